@@ -1,6 +1,9 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from services.chatbot_service import router as chatbot_router
+from services.chatbot_service import (
+    response_cache as chat_response_cache, router as chatbot_router, service_status, warm_up
+)
 # Import the suggestions router and include it so /generate_suggestions is available
 from services import suggestion_generator
 import sys
@@ -8,15 +11,25 @@ import os
 # Add the backend directory to the Python path
 sys.path.append(os.path.dirname(__file__))
 from services.ai_suggestions import router as ai_suggestions_router
-from services.recommendations import GroqMentalStatePredictor
+from services.recommendations import (
+    GroqMentalStatePredictor, prediction_cache, read_recommendations, recommendation_timings, refresh_recommendations
+)
 from services.exercises import router as exercises_router
+from services import exercise_trending
+from services.exercise_trending import trending_sync_loop
+from services.exercise_catalog import RenderedJSON, cached_json_response, catalog_stats, catalog_sync_loop
+from services.doctor_allocator import doctor_allocator, doctor_index_sync_loop
+from services.reference_data import reference_data, reference_sync_loop
+from services.conversation_memory import conversation_memory, conversation_flush_loop
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import logging
-from supabase import create_client, Client
-from config.settings import SUPABASE_URL, SUPABASE_KEY
+from config.settings import SUPABASE_URL
+from config.database import supabase, pool_stats
 from typing import Optional, List
-from datetime import datetime, timedelta
-import uuid
+import asyncio
+from core.auth import require_admin
+from core.llm_gateway import close_llm_gateways
 
 # Fix encoding issues on Windows
 if hasattr(sys.stdout, 'reconfigure'):
@@ -28,9 +41,6 @@ if hasattr(sys.stderr, 'reconfigure'):
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
 # Create FastAPI app
 app = FastAPI(title="SafeSpace API")
 
@@ -52,6 +62,27 @@ app.include_router(ai_suggestions_router)
 # Include the exercises router
 app.include_router(exercises_router)
 
+_background_tasks: List[asyncio.Task] = []
+
+@app.on_event("startup")
+async def start_warm_up():
+    """Warm caches and clients in the background so the worker accepts traffic immediately"""
+    _background_tasks.append(asyncio.create_task(warm_up()))
+    _background_tasks.append(asyncio.create_task(trending_sync_loop()))
+    _background_tasks.append(asyncio.create_task(catalog_sync_loop()))
+    _background_tasks.append(asyncio.create_task(doctor_index_sync_loop()))
+    _background_tasks.append(asyncio.create_task(reference_sync_loop()))
+    _background_tasks.append(asyncio.create_task(conversation_flush_loop()))
+
+@app.on_event("shutdown")
+async def close_clients():
+    for task in _background_tasks:
+        if not task.done():
+            task.cancel()
+    if conversation_memory.table:
+        await run_in_threadpool(conversation_memory.flush)
+    close_llm_gateways()
+
 # Define request models
 class UserRequest(BaseModel):
     user_id: str
@@ -66,16 +97,23 @@ async def root():
         "endpoints": {
             "chatbot": "/api/chat",
             "status": "/",
+            "ready": "/api/ready",
             "entertainment": "/recommend_entertainment"
         }
     }
 
+@app.get("/api/ready")
+async def readiness():
+    """Readiness probe: 200 once warm-up has finished, 503 before that"""
+    status_code = 200 if service_status["warmed_up"] else 503
+    return JSONResponse(status_code=status_code, content={"ready": status_code == 200, **service_status})
+
 @app.post("/api/predict-mental-state")
 async def predict_mental_state(req: PredictionRequest):
     """Predict mental state from a message using Groq API with fallback heuristic"""
     try:
         predictor = GroqMentalStatePredictor()
-        result = predictor.predict(req.message)
+        result = await predictor.apredict(req.message)
         
         return {
             "prediction": result["prediction"],
@@ -92,6 +130,39 @@ async def predict_mental_state(req: PredictionRequest):
             "error": str(e)
         }
 
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for the in-process caches"""
+    return {
+        "prediction_cache": prediction_cache.stats(),
+        "trending_counter": exercise_trending.trending_counter.stats() if exercise_trending.trending_counter else None,
+        "exercise_catalog": catalog_stats(),
+        "reference_data": reference_data.stats(),
+        "chat_responses": chat_response_cache.stats() if chat_response_cache else None,
+        "conversation_memory": conversation_memory.stats()
+    }
+
+@app.post("/api/admin/reference-data/refresh", dependencies=[Depends(require_admin)])
+async def refresh_reference_data(table: Optional[str] = None):
+    """Force a re-read of the reference tables (all, or just ``table``)"""
+    if table is not None and table not in reference_data.tables:
+        raise HTTPException(status_code=404, detail=f"Unknown reference table '{table}'")
+    try:
+        versions = await run_in_threadpool(reference_data.refresh, [table] if table else None)
+    except Exception as e:
+        logger.error(f"Error refreshing reference data: {str(e)}")
+        raise HTTPException(status_code=502, detail=f"Error refreshing reference data: {str(e)}")
+    return {"refreshed": versions, "stats": reference_data.stats()}
+
+@app.get("/api/db/stats")
+async def db_stats():
+    """Usage of the shared Supabase connection pool"""
+    return {
+        "supabase_pool": pool_stats(),
+        "doctor_index": doctor_allocator.snapshot(),
+        "recommendation_stages": recommendation_timings.stats()
+    }
+
 def get_user_dominant_state(user_id: str) -> Optional[str]:
     """Get the user's most recent dominant mental state"""
     try:
@@ -108,141 +179,76 @@ def get_user_dominant_state(user_id: str) -> Optional[str]:
         logger.error(f"Error getting user state: {str(e)}")
         return None
 
-def get_doctors_by_dominant_state(dominant_state: str) -> list:
-    """Get doctors that can handle a specific mental state"""
-    try:
-        # First try to get doctors specifically matching this state
-        response = (
-            supabase.table("doctors")
-            .select("*")
-            .eq("dominant_state", dominant_state)
-            .execute()
-        )
-        
-        matching_doctors = response.data if response.data else []
-        logger.info(f"Found {len(matching_doctors)} doctors matching state {dominant_state}")
-        
-        if not matching_doctors:
-            # If no specific matches, get doctors who can handle any state
-            response = (
-                supabase.table("doctors")
-                .select("*")
-                .is_("dominant_state", "null")
-                .execute()
-            )
-            matching_doctors = response.data if response.data else []
-            logger.info(f"Found {len(matching_doctors)} general doctors")
-            
-        return matching_doctors
-    except Exception as e:
-        logger.error(f"Error getting doctors: {str(e)}")
-        return []
+def generate_entertainment_recommendations(user_id: str) -> dict:
+    """Match entertainments to the user's latest dominant state and store them (blocking)"""
+    from services.recommendations import get_entertainments_by_dominant_state, store_recommended_entertainments
 
-def is_doctor_already_assigned(doctor_id: str) -> bool:
-    """Check if a doctor is already assigned to someone"""
-    try:
-        response = (
-            supabase.table("recommended_doctor")
-            .select("doctor_id")
-            .eq("doctor_id", doctor_id)
-            .execute()
+    # Fetch user's dominant state
+    response = (
+        supabase.table('mental_state_reports')
+        .select('dominant_state, created_at')
+        .eq('user_id', user_id)
+        .order('created_at', desc=True)
+        .limit(1)
+        .execute()
+    )
+    
+    if not response.data:
+        raise HTTPException(
+            status_code=404,
+            detail="No mental state report found for this user"
         )
-        
-        logger.info(f"Checking assignment for doctor {doctor_id}: {len(response.data)} assignments found")
-        return len(response.data) > 0
-    except Exception as e:
-        logger.error(f"Error checking doctor assignment: {str(e)}")
-        return False  # Assume not assigned in case of error to allow assignment
 
-def store_recommended_doctor(user_id: str, doctor_id: str) -> Optional[dict]:
-    """Store a doctor recommendation for a user"""
-    try:
-        response = supabase.table("recommended_doctor").insert({
-            "user_id": user_id,
-            "doctor_id": doctor_id
-        }).execute()
-        return response.data[0] if response.data else None
-    except Exception as e:
-        logger.error(f"Error storing doctor recommendation: {str(e)}")
-        return None
+    report = response.data[0]
+    user_dominant_state = report['dominant_state']
+    
+    # Entertainments with matching dominant state, from the in-memory reference tables
+    entertainments = get_entertainments_by_dominant_state(user_dominant_state)
+    
+    if not entertainments:
+        return {
+            "success": True,
+            "recommendations": [],
+            "message": f"No entertainments found matching the '{user_dominant_state}' state."
+        }
+        
+    # Store all recommendations in one batched write
+    stored = store_recommended_entertainments(user_id, entertainments, user_dominant_state)
+    failed_ids = {f["entertainment_id"] for f in stored["failed"]}
+    if failed_ids:
+        logger.error(f"Failed to store {len(failed_ids)} recommendation(s): {stored['failed'][0]['error']}")
+    recommendations = [
+        {
+            **entertainment,
+            'recommended_at': stored['recommended_at'],
+            'matched_state': user_dominant_state
+        }
+        for entertainment in entertainments
+        if entertainment['id'] not in failed_ids
+    ]
+    
+    response = {
+        "success": True,
+        "recommendations": recommendations,
+        "dominant_state": user_dominant_state
+    }
+    if stored["failed"]:
+        response["failed"] = stored["failed"]
+    return response
 
 @app.get("/recommend_entertainment/api/suggestions/{user_id}")
 async def recommend_entertainment(user_id: str) -> dict:
     """Get entertainment recommendations for a user based on their mental state"""
     try:
-        # Import the recommendation function from recommendations service
+        # Import the recommendation functions from recommendations service
         from services.recommendations import get_all_recommendations
         
         # Get all recommendations using the existing function
-        recommendations = get_all_recommendations(user_id)
+        recommendations = await run_in_threadpool(get_all_recommendations, user_id)
         
         if not recommendations or not recommendations.get("entertainments"):
-            # If no recommendations, try to generate them
-            # Fetch user's dominant state
-            response = (
-                supabase.table('mental_state_reports')
-                .select('dominant_state, created_at')
-                .eq('user_id', user_id)
-                .order('created_at', desc=True)
-                .limit(1)
-                .execute()
-            )
-            
-            if not response.data:
-                raise HTTPException(
-                    status_code=404,
-                    detail="No mental state report found for this user"
-                )
-
-            report = response.data[0]
-            user_dominant_state = report['dominant_state']
-            
-            # Fetch entertainments with matching dominant state
-            entertainment_response = (
-                supabase.table('entertainments')
-                .select('id, title, type, dominant_state, cover_img_url, description, media_file_url')
-                .eq('dominant_state', user_dominant_state)
-                .execute()
-            )
-            
-            if not entertainment_response.data:
-                return {
-                    "success": True,
-                    "recommendations": [],
-                    "message": f"No entertainments found matching the '{user_dominant_state}' state."
-                }
-                
-            # Store recommendations and prepare response
-            recommendations = []
-            for entertainment in entertainment_response.data:
-                try:
-                    recommendation_data = {
-                        'id': str(uuid.uuid4()),
-                        'user_id': user_id,
-                        'entertainment_id': entertainment['id'],
-                        'recommended_at': datetime.now().isoformat(),
-                        'matched_state': user_dominant_state
-                    }
-                    
-                    # Store the recommendation
-                    supabase.table('recommended_entertainments').insert(recommendation_data).execute()
-                    
-                    # Add to return list with additional details
-                    recommendations.append({
-                        **entertainment,
-                        'recommended_at': recommendation_data['recommended_at'],
-                        'matched_state': user_dominant_state
-                    })
-                    
-                except Exception as insert_error:
-                    logger.error(f"Failed to store recommendation: {insert_error}")
-                    continue
-            
-            return {
-                "success": True,
-                "recommendations": recommendations,
-                "dominant_state": user_dominant_state
-            }
+            # If no recommendations, try to generate them off the event loop
+            return await run_in_threadpool(generate_entertainment_recommendations, user_id)
         else:
             # Return the recommendations from get_all_recommendations
             return {
@@ -259,68 +265,38 @@ async def recommend_entertainment(user_id: str) -> dict:
             detail=str(e)
         )
 
-def assign_best_available_doctor(user_id: str, matching_doctors: list) -> Optional[dict]:
-    """Find and assign the best available doctor from a list"""
-    logger.info(f"Attempting to assign doctor from {len(matching_doctors)} matching doctors")
-    
-    if not matching_doctors:
-        logger.warning("No matching doctors available to assign")
-        return None
-        
-    for doctor in matching_doctors:
-        doctor_id = doctor.get("id")
-        if not doctor_id:
-            logger.warning(f"Doctor record missing ID: {doctor}")
-            continue
-            
-        logger.info(f"Checking availability of doctor {doctor_id}")
-        if not is_doctor_already_assigned(doctor_id):
-            logger.info(f"Doctor {doctor_id} is available, attempting to store recommendation")
-            if store_recommended_doctor(user_id, doctor_id):
-                logger.info(f"Successfully assigned doctor {doctor_id} to user {user_id}")
-                return doctor
-            else:
-                logger.error(f"Failed to store recommendation for doctor {doctor_id}")
-        else:
-            logger.info(f"Doctor {doctor_id} is already assigned")
-            
-    logger.warning("No available doctors found after checking all matches")
-    return None
-
 @app.get("/recommendations")
-async def get_recommendations(user_id: str):
-    """Get personalized recommendations for a user based on their mental state"""
+async def get_recommendations(user_id: str, request: Request):
+    """Current recommendations for a user. Read-only; POST /recommendations/refresh applies assignments"""
     try:
-        # Import the recommendation function from recommendations service
-        from services.recommendations import get_all_recommendations
-        
-        # Get all recommendations
-        recommendations = get_all_recommendations(user_id)
-        
-        return {
-            "success": True,
-            "recommendations": recommendations
-        }
+        view = await run_in_threadpool(read_recommendations, user_id)
+        return cached_json_response(request, RenderedJSON({"success": True, "recommendations": view}))
     except Exception as e:
         logger.error(f"Error getting recommendations: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail=f"Error getting recommendations: {str(e)}"
         )
+
+@app.post("/recommendations/refresh")
+async def refresh_user_recommendations(req: UserRequest):
+    """Assign a doctor and store entertainment recommendations for the user's current state"""
+    try:
+        view = await run_in_threadpool(refresh_recommendations, req.user_id)
+        return {"success": True, "recommendations": view}
+    except Exception as e:
+        logger.error(f"Error refreshing recommendations: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error refreshing recommendations: {str(e)}"
+        )
+
 @app.get("/api/suggestions/{user_id}")
-async def get_suggestions(user_id: str):
-    """Get personalized suggestions for a user based on their mental state"""
+async def get_suggestions(user_id: str, request: Request):
+    """Current suggestions for a user based on their mental state. Read-only and ETag-cacheable"""
     try:
-        # Import the recommendation function from recommendations service
-        from services.recommendations import get_all_recommendations
-        
-        # Get all recommendations
-        recommendations = get_all_recommendations(user_id)
-        
-        return {
-            "doctors": recommendations["doctors"],
-            "entertainments": recommendations["entertainments"]
-        }
+        view = await run_in_threadpool(read_recommendations, user_id)
+        return cached_json_response(request, RenderedJSON(view))
     except Exception as e:
         logger.error(f"Error getting suggestions: {str(e)}")
         raise HTTPException(
@@ -339,30 +315,16 @@ async def recommend_doctor(req: UserRequest):
         
         # Check if user already has an assigned doctor
         try:
-            existing = (
-                supabase.table("recommended_doctor")
-                .select("doctor_id")
-                .eq("user_id", req.user_id)
-                .execute()
-            )
-            
-            if existing.data:
-                doctor_id = existing.data[0]["doctor_id"]
-                doctor = (
-                    supabase.table("doctors")
-                    .select("*")
-                    .eq("id", doctor_id)
-                    .execute()
-                )
-                if doctor.data:
-                    logger.info(f"Found existing doctor assignment for user {req.user_id}")
-                    return {"assigned_doctor": doctor.data[0]}
+            existing = await run_in_threadpool(doctor_allocator.assigned_doctor, req.user_id)
+            if existing:
+                logger.info(f"Found existing doctor assignment for user {req.user_id}")
+                return {"assigned_doctor": existing}
         except Exception as e:
             logger.error(f"Error checking existing doctor: {str(e)}")
             # Continue to new assignment if checking existing fails
         
         # Get user's dominant mental state
-        dominant_state = get_user_dominant_state(req.user_id)
+        dominant_state = await run_in_threadpool(get_user_dominant_state, req.user_id)
         if not dominant_state:
             logger.warning(f"No mental state found for user {req.user_id}")
             raise HTTPException(
@@ -372,29 +334,18 @@ async def recommend_doctor(req: UserRequest):
         
         logger.info(f"User {req.user_id} dominant state: {dominant_state}")
         
-        # Get matching doctors
-        matching_doctors = get_doctors_by_dominant_state(dominant_state)
-        if not matching_doctors:
-            logger.warning(f"No doctors found for state: {dominant_state}")
-            # Fallback to any available doctor if no specific match
-            try:
-                matching_doctors = supabase.table("doctors").select("*").execute().data
-            except Exception as e:
-                logger.error(f"Error getting all doctors: {str(e)}")
-                matching_doctors = []
-                
-            if not matching_doctors:
-                raise HTTPException(
-                    status_code=404,
-                    detail="No doctors available in the system"
-                )
+        if not await run_in_threadpool(doctor_allocator.has_doctors):
+            raise HTTPException(
+                status_code=404,
+                detail="No doctors available in the system"
+            )
         
-        # Assign best available doctor
-        assigned_doctor = assign_best_available_doctor(req.user_id, matching_doctors)
+        # Least-loaded doctor for the state, then general doctors, then anyone with a free slot
+        assigned_doctor = await run_in_threadpool(doctor_allocator.allocate, req.user_id, dominant_state, True)
         if not assigned_doctor:
             raise HTTPException(
                 status_code=503,
-                detail="All doctors are currently assigned. Please try again later."
+                detail="All doctors are at capacity. Please try again later."
             )
         
         logger.info(f"Successfully assigned doctor {assigned_doctor['id']} to user {req.user_id}")
@@ -413,4 +364,16 @@ async def recommend_doctor(req: UserRequest):
         raise HTTPException(
             status_code=500,
             detail=f"Server error: {error_msg}"
-        )
\ No newline at end of file
+        )
+
+@app.delete("/recommend/{user_id}")
+async def release_doctor(user_id: str):
+    """End a user's doctor assignment, freeing a slot on that doctor"""
+    try:
+        released = await run_in_threadpool(doctor_allocator.release, user_id)
+    except Exception as e:
+        logger.error(f"Error releasing doctor for user {user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
+    if not released:
+        raise HTTPException(status_code=404, detail="No doctor is assigned to this user")
+    return {"released": True, "user_id": user_id}
@@ -0,0 +1 @@
+"""Load and micro-benchmarks for backend services (run as ``python -m benchmarks.<name>``)."""
@@ -0,0 +1,121 @@
+"""Hit rate, precision and latency of the chat response cache.
+
+1. Near-duplicate quality: the cache is filled with the training patterns of
+   ``benchmarks.intent_retrieval`` (reply = the pattern's intent), then the
+   held-out patterns are looked up. For each similarity threshold it reports
+   the share of lookups answered from the cache and the share of those hits
+   whose cached reply belongs to a different intent.
+2. Latency: ``/api/chat`` turns through ``chat_with_bot`` against a fake Groq
+   server with ``--delay`` upstream latency, for a miss (LLM call), an exact
+   hit (same message, different case and punctuation) and a near-duplicate
+   hit, plus the bare ``ResponseCache.get`` cost.
+
+Run from ``lib/Backend``::
+
+    python -m benchmarks.chat_response_cache --delay 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from benchmarks.fake_groq import percentile, start_fake_groq
+from benchmarks.intent_retrieval import DATASET_PATH, build_eval_set
+from utils.response_cache import ResponseCache
+
+PHRASINGS = [
+    ("I feel so stressed about my exams", "i feel SO stressed about my exams!!"),
+    ("I can't sleep because I keep worrying about work", "i can't sleep, because I keep worrying about WORK."),
+    ("Nobody understands me and I feel lonely all the time", "nobody understands me, and I feel lonely all the time"),
+    ("How can I calm down before my presentation tomorrow", "How can I calm down before my presentation tomorrow?"),
+]
+NEAR_DUPLICATES = [
+    ("I feel so stressed about my exams", "I feel so stressed about my final exams"),
+    ("I can't sleep because I keep worrying about work", "I can't sleep because I keep worrying about my work"),
+    ("Nobody understands me and I feel lonely all the time", "Nobody understands me and I feel so lonely all the time"),
+    ("How can I calm down before my presentation tomorrow", "How can I calm down before my big presentation tomorrow"),
+]
+
+
+def eval_precision(thresholds):
+    with open(DATASET_PATH, "r", encoding="utf-8") as file:
+        intents = json.load(file)["intents"]
+    training, eval_set = build_eval_set(intents, 5, 3, 7)
+    print(f"near-duplicate quality: {sum(len(i['patterns']) for i in training)} cached patterns, "
+          f"{len(eval_set)} held-out lookups")
+    print(f"{'similarity':>10} {'hit rate':>9} {'wrong intent':>13}")
+    for threshold in thresholds:
+        cache = ResponseCache(maxsize=100000, ttl=3600, similarity=threshold)
+        for intent in training:
+            for pattern in intent["patterns"]:
+                cache.set("model", pattern, intent["tag"])
+        hits = wrong = 0
+        for query, tag in eval_set:
+            reply = cache.get("model", query)
+            hits += reply is not None
+            wrong += reply is not None and reply != tag
+        print(f"{threshold if threshold else 'exact':>10} {hits / len(eval_set):>9.1%} {wrong / max(hits, 1):>13.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--delay", type=float, default=0.2, help="fake upstream latency in seconds")
+    parser.add_argument("--similarity", type=float, default=0.7, help="threshold for the latency run")
+    parser.add_argument("--repeat", type=int, default=25)
+    args = parser.parse_args()
+
+    eval_precision([0.0, 0.9, 0.8, 0.7, 0.6, 0.5])
+
+    server, base_url = start_fake_groq(args.delay)
+    os.environ["GROQ_BASE_URL"] = base_url
+    os.environ.setdefault("GROQ_API_KEY", "fake-key")
+    os.environ["CHAT_CACHE_SIMILARITY"] = str(args.similarity)
+
+    # Imported after the environment is set so settings pick up the fake server
+    from services import chatbot_service
+    from services.chatbot_service import ChatRequest, chat_with_bot
+
+    cache = chatbot_service.response_cache
+
+    async def turn(message: str) -> float:
+        started = time.perf_counter()
+        await chat_with_bot(ChatRequest(message=message))
+        return (time.perf_counter() - started) * 1000.0
+
+    async def run():
+        await turn("warm up the pooled connection")
+        misses, exact, near = [], [], []
+        for (original, variant), (_, near_duplicate) in zip(PHRASINGS, NEAR_DUPLICATES):
+            misses.append(await turn(original))
+            for _ in range(args.repeat):
+                exact.append(await turn(variant))
+                near.append(await turn(near_duplicate))
+        return misses, exact, near
+
+    misses, exact, near = asyncio.run(run())
+    stats = cache.stats()
+    assert stats["exact_hits"] == len(exact) and stats["approximate_hits"] == len(near), stats
+
+    samples = []
+    for _ in range(args.repeat):
+        for _, near_duplicate in NEAR_DUPLICATES:
+            started = time.perf_counter()
+            cache.get(chatbot_service.MODELS["default"], near_duplicate)
+            samples.append((time.perf_counter() - started) * 1e6)
+
+    crisis = "I want to end my life, I can't go on"
+    asyncio.run(turn(crisis))
+    assert chatbot_service.cached_reply(chatbot_service.MODELS["default"], crisis) is None
+
+    print(f"\n/api/chat latency, fake LLM delay {args.delay * 1000:.0f} ms, similarity {args.similarity}")
+    print(f"  miss (LLM call)     p50 {percentile(misses, 50):8.2f} ms")
+    print(f"  exact hit           p50 {percentile(exact, 50):8.3f} ms  p99 {percentile(exact, 99):.3f} ms")
+    print(f"  near-duplicate hit  p50 {percentile(near, 50):8.3f} ms  p99 {percentile(near, 99):.3f} ms")
+    print(f"  ResponseCache.get (near-duplicate) p50 {percentile(samples, 50):.0f} us")
+    print(f"cache stats: {cache.stats()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
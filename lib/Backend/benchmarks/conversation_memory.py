@@ -0,0 +1,119 @@
+"""Prompt size, assembly latency and write-through cost of conversation memory.
+
+1. For conversations of increasing length, the estimated prompt tokens and
+   ``build_messages`` latency with memory, next to the size of a prompt
+   that replays the whole history.
+2. Session memory stays bounded when more users than ``--sessions`` chat.
+3. Write-through against the local PostgREST stand-in: ``--users`` users x
+   ``--exchanges`` exchanges flushed in batches, compared with one insert
+   per exchange, then a fresh store reloads a user's recent turns.
+
+Run from ``lib/Backend``::
+
+    python -m benchmarks.conversation_memory --latency 0.005
+"""
+import argparse
+import json
+import os
+import time
+
+from benchmarks.fake_groq import percentile
+from benchmarks.fake_postgrest import start_fake_postgrest
+from benchmarks.intent_retrieval import DATASET_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[1, 10, 100, 1000, 10000])
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--exchanges", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.005, help="stand-in latency per request (s)")
+    args = parser.parse_args()
+
+    server, store, url = start_fake_postgrest(args.latency)
+    os.environ["SUPABASE_URL"] = url
+    os.environ.setdefault("GROQ_API_KEY", "fake-key")
+    os.environ.setdefault("GROQ_BASE_URL", "http://127.0.0.1:9")
+
+    # Imported after the environment is set so settings pick up the stand-in
+    from config.database import supabase
+    from services.conversation_memory import ConversationStore, estimate_tokens
+
+    with open(DATASET_PATH, "r", encoding="utf-8") as file:
+        intents = json.load(file)["intents"]
+    exchanges = [(pattern, intent["responses"][0]) for intent in intents if intent.get("responses")
+                 for pattern in intent.get("patterns", [])]
+    system_prompt = "You are a compassionate mental health assistant."
+    prompt = "As a mental health support assistant, respond with empathy and care:\nUser's message: \"I still can't sleep\""
+
+    memory = ConversationStore(table=None)
+    print(f"token budget {memory.token_budget}, ring buffer {memory.max_turns} messages, "
+          f"summary {memory.summary_tokens} tokens")
+    print(f"{'exchanges':>9} {'full history':>13} {'with memory':>12} {'build p50 us':>13} {'p99 us':>7}")
+    recorded = 0
+    for length in sorted(args.lengths):
+        while recorded < length:
+            message, reply = exchanges[recorded % len(exchanges)]
+            memory.record("user-1", message, reply)
+            recorded += 1
+        full = sum(estimate_tokens(m) + estimate_tokens(r) for m, r in
+                   (exchanges[i % len(exchanges)] for i in range(length)))
+        full += estimate_tokens(system_prompt) + estimate_tokens(prompt)
+        samples = []
+        for _ in range(200):
+            started = time.perf_counter()
+            messages = memory.build_messages("user-1", system_prompt, prompt)
+            samples.append((time.perf_counter() - started) * 1e6)
+        tokens = sum(estimate_tokens(m["content"]) for m in messages)
+        assert tokens <= memory.token_budget
+        print(f"{length:>9} {full:>13} {tokens:>12} {percentile(samples, 50):>13.0f} {percentile(samples, 99):>7.0f}")
+
+    bounded = ConversationStore(max_sessions=args.sessions, table=None)
+    for user in range(args.sessions * 10):
+        bounded.record(f"user-{user}", "I feel anxious", "Try a few slow breaths.")
+    stats = bounded.stats()
+    print(f"{args.sessions * 10} users, max {args.sessions} sessions: {stats['sessions']} kept, "
+          f"{stats['evicted_lru']} evicted")
+    assert stats["sessions"] == args.sessions
+
+    table = "chat_messages"
+    users = [f"00000000-0000-0000-0000-{i:012d}" for i in range(args.users)]
+    total = args.users * args.exchanges
+
+    store.tables[table] = []
+    before, started = store.requests, time.perf_counter()
+    for turn in range(args.exchanges):
+        for user in users:
+            message, reply = exchanges[turn % len(exchanges)]
+            supabase.table(table).insert([
+                {"user_id": user, "role": "user", "content": message},
+                {"user_id": user, "role": "assistant", "content": reply},
+            ]).execute()
+    per_turn = (store.requests - before, (time.perf_counter() - started) * 1000)
+
+    store.tables[table] = []
+    writer = ConversationStore(table=table)
+    for turn in range(args.exchanges):
+        for user in users:
+            message, reply = exchanges[turn % len(exchanges)]
+            writer.record(user, message, reply)
+    before, started = store.requests, time.perf_counter()
+    written = writer.flush()
+    batched = (store.requests - before, (time.perf_counter() - started) * 1000)
+    assert written == 2 * total == len(store.tables[table])
+
+    print(f"write-through of {total} exchanges ({args.users} users), stand-in latency {args.latency * 1000:.0f} ms")
+    print(f"  insert per exchange : {per_turn[0]:5d} requests {per_turn[1]:8.1f} ms")
+    print(f"  batched flush       : {batched[0]:5d} requests {batched[1]:8.1f} ms")
+
+    reader = ConversationStore(table=table)
+    session = reader.open(users[0])
+    expected = [item for turn in range(args.exchanges) for item in exchanges[turn % len(exchanges)]]
+    assert [t["content"] for t in session.turns] == expected[-reader.max_turns:]
+    print(f"reload after restart: {len(session.turns)} recent messages restored for {users[0]}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
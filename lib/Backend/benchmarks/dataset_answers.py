@@ -0,0 +1,96 @@
+"""Dataset-only chat answers: quality, latency and load shedding.
+
+1. Coverage and accuracy of ``dataset_answer`` at several score floors, on
+   the held-out patterns of ``benchmarks.intent_retrieval`` (an answer is
+   correct when it comes from the held-out pattern's intent).
+2. Latency of ``dataset_answer`` over the same queries.
+3. A burst of ``--concurrency`` simultaneous ``chat_with_bot`` calls against
+   a fake Groq server, in ``llm`` mode and in ``auto`` mode with
+   ``CHAT_SHED_QUEUE_DEPTH`` set to the gateway concurrency, reporting
+   latency and how many turns reached the LLM.
+
+Run from ``lib/Backend``::
+
+    python -m benchmarks.dataset_answers --concurrency 128 --delay 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from benchmarks.fake_groq import percentile, start_fake_groq
+from benchmarks.intent_retrieval import DATASET_PATH, build_eval_set
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=128)
+    parser.add_argument("--llm-concurrency", type=int, default=16, help="gateway concurrency and shedding depth")
+    parser.add_argument("--delay", type=float, default=0.2, help="fake upstream latency in seconds")
+    args = parser.parse_args()
+
+    server, base_url = start_fake_groq(args.delay)
+    os.environ["GROQ_BASE_URL"] = base_url
+    os.environ.setdefault("GROQ_API_KEY", "fake-key")
+    os.environ["LLM_MAX_CONCURRENCY"] = str(args.llm_concurrency)
+    os.environ["CHAT_CACHE_SIZE"] = "0"  # repeated messages would otherwise be answered from the reply cache
+
+    # Imported after the environment is set so settings pick up the fake server
+    from services import chatbot_service
+    from services.chatbot_service import ChatRequest, chat_with_bot, dataset_answer
+    from utils.intent_index import IntentIndex
+
+    with open(DATASET_PATH, "r", encoding="utf-8") as file:
+        intents = json.load(file)["intents"]
+    training, eval_set = build_eval_set(intents, 5, 3, 7)
+    index = IntentIndex.build(training)
+    print(f"eval set: {len(eval_set)} held-out patterns")
+    print(f"{'min score':>9} {'answered':>9} {'correct':>8}")
+    for floor in (0.0, 4.0, 6.0, 8.0, 10.0):
+        answered = correct = 0
+        for query, tag in eval_set:
+            matches = index.search(query, 1, floor)
+            answered += bool(matches)
+            correct += bool(matches) and matches[0]["tag"] == tag
+        print(f"{floor:>9.1f} {answered / len(eval_set):>9.1%} {correct / max(answered, 1):>8.1%}")
+
+    chatbot_service.get_intent_index()
+    samples = []
+    for query, _ in eval_set * 5:
+        started = time.perf_counter()
+        dataset_answer(query)
+        samples.append((time.perf_counter() - started) * 1e6)
+    print(f"dataset_answer latency: p50 {percentile(samples, 50):.0f} us  p99 {percentile(samples, 99):.0f} us")
+
+    queries = [query for query, _ in eval_set]
+
+    async def one_chat(i: int) -> float:
+        started = time.perf_counter()
+        await chat_with_bot(ChatRequest(message=queries[i % len(queries)]))
+        return (time.perf_counter() - started) * 1000.0
+
+    async def burst():
+        return await asyncio.gather(*(one_chat(i) for i in range(args.concurrency)))
+
+    gateway = chatbot_service.groq_client
+    controller = chatbot_service.answer_mode
+    controller.shed_queue_depth = args.llm_concurrency
+    print(f"burst of {args.concurrency} chats, LLM delay {args.delay * 1000:.0f} ms, "
+          f"gateway concurrency {args.llm_concurrency}")
+    print(f"{'mode':<8} {'p50 ms':>8} {'p99 ms':>8} {'LLM calls':>10} {'local':>8}")
+    asyncio.run(one_chat(0))  # open the pooled connection outside the measurement
+    for mode in ("llm", "auto"):
+        controller.set_mode(mode)
+        controller.decisions.clear()
+        before = gateway.stats["requests"]
+        latencies = asyncio.run(burst())
+        llm_calls = gateway.stats["requests"] - before
+        print(f"{mode:<8} {percentile(latencies, 50):>8.1f} {percentile(latencies, 99):>8.1f} "
+              f"{llm_calls:>10} {args.concurrency - llm_calls:>8}")
+    print(f"auto decisions: {controller.stats()['decisions']}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
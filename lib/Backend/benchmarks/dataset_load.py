@@ -0,0 +1,79 @@
+"""Per-worker load time and memory of the chatbot dataset.
+
+Each mode runs in a fresh interpreter (like a new uvicorn worker) after
+importing NumPy, and reports load time plus the growth in resident memory,
+split into private (RssAnon) and file-backed (RssFile) pages. File-backed
+pages of the snapshot live in the page cache and are shared by every worker
+on the host; private pages are paid per worker. Linux only. Run from
+``lib/Backend``::
+
+    python -m benchmarks.dataset_load
+"""
+import json
+import subprocess
+import sys
+
+DATASET_PATH = "models/chatbot_dataset.json"
+
+MODES = {
+    "json tag map (pre-index)": """
+with open(DATASET_PATH, encoding="utf-8") as f:
+    raw = json.load(f)
+dataset = {i["tag"]: i["responses"][0] for i in raw["intents"] if i.get("responses")}
+""",
+    "json + build index": """
+from utils.intent_index import IntentIndex
+with open(DATASET_PATH, encoding="utf-8") as f:
+    index = IntentIndex.build(json.load(f)["intents"])
+dataset = index.first_responses()
+""",
+    "mapped snapshot": """
+from utils.dataset_snapshot import load_intent_index
+index, info = load_intent_index(DATASET_PATH)
+assert info["source"] == "snapshot", info
+dataset = index.first_responses()
+index.search("I can't sleep at night", 2)
+""",
+}
+
+PROBE = """
+import json, time
+import numpy
+DATASET_PATH = {path!r}
+
+def memory():
+    with open("/proc/self/status") as f:
+        fields = dict(line.split(":", 1) for line in f)
+    return {{k: int(fields[k].split()[0]) for k in ("VmRSS", "RssAnon", "RssFile")}}
+
+before = memory()
+started = time.perf_counter()
+{code}
+elapsed = (time.perf_counter() - started) * 1000
+after = memory()
+print(json.dumps({{"ms": elapsed, **{{k: after[k] - before[k] for k in after}}}}))
+"""
+
+
+def run(code: str) -> dict:
+    output = subprocess.run([sys.executable, "-c", PROBE.format(path=DATASET_PATH, code=code)],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    # Make sure the snapshot exists and is current before measuring it
+    from utils.dataset_snapshot import load_intent_index
+    _, info = load_intent_index(DATASET_PATH)
+    print(f"snapshot {info['path']} ({info['source']})")
+
+    print(f"{'mode':<26} {'load ms':>8} {'RSS KiB':>8} {'private':>8} {'shared':>8}")
+    for name, code in MODES.items():
+        runs = [run(code) for _ in range(5)]
+        best = min(runs, key=lambda r: r["ms"])
+        median_rss = sorted(r["VmRSS"] for r in runs)[len(runs) // 2]
+        print(f"{name:<26} {best['ms']:>8.1f} {median_rss:>8} {best['RssAnon']:>8} {best['RssFile']:>8}")
+
+
+if __name__ == "__main__":
+    main()
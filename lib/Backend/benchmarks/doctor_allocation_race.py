@@ -0,0 +1,225 @@
+"""Concurrency and load-balancing check for doctor allocation.
+
+Fires ``--requests`` simultaneous ``POST /recommend`` calls (one per user)
+at the app, backed by the local PostgREST stand-in, and checks that no
+doctor goes over capacity, no user gets two doctors and load is spread
+evenly within each state. The previous one-patient-per-doctor
+check-then-insert allocation is replayed under the same load for
+comparison, a second allocator instance stands in for another worker, and
+a release/re-assign round checks the incremental load counts against a
+rescan of ``recommended_doctor``.
+
+The ``/recommend`` latencies are dominated by queueing, not allocation: all
+requests are fired at once, each makes a few stand-in queries, and the app,
+the HTTP client and the stand-in share one process (and one GIL), so the
+burst is served roughly one query at a time. The benchmark prints the time
+spent inside ``allocate`` next to them, then times allocation on its own
+with ``--threads`` concurrent callers and fails if its p99 exceeds
+``--max-allocate-ms``. One allocation is about one claim query, so its
+latency grows with the number of callers sharing the stand-in, not with
+the number of users or doctors. Run from
+``lib/Backend``::
+
+    python -m benchmarks.doctor_allocation_race --requests 500 --doctors 60 --capacity 10
+"""
+import argparse
+import asyncio
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_groq import percentile
+from benchmarks.fake_postgrest import start_fake_postgrest
+
+STATES = ["stressed", "anxious", "depressed", "neutral/calm", "happy/positive"]
+
+
+def seed(store, users: int, doctors: int):
+    store.tables["doctors"] = [
+        {"id": f"doc-{i}", "name": f"Doctor {i}", "dominant_state": STATES[i % len(STATES)] if i % 10 else "General"}
+        for i in range(doctors)
+    ]
+    store.tables["mental_state_reports"] = [
+        {"user_id": f"user-{i}", "dominant_state": STATES[i % len(STATES)], "created_at": "2026-01-01T00:00:00+00:00"}
+        for i in range(users)
+    ]
+    store.tables["recommended_doctor"] = []
+    store.unique["recommended_doctor"] = [("user_id",)]
+
+
+def install_claim_rpc(store, default_capacity: int):
+    """The stand-in's version of claim_doctor_slot from DOCTOR_ALLOCATION_SQL."""
+    def claim(body):
+        with store.lock:
+            doctor = next((d for d in store.tables["doctors"] if d["id"] == body["p_doctor_id"]), None)
+            if doctor is None:
+                return "missing"
+            rows = store.tables["recommended_doctor"]
+            if any(r["user_id"] == body["p_user_id"] for r in rows):
+                return "assigned"
+            slots = doctor.get("capacity") or body["p_default_capacity"]
+            if sum(1 for r in rows if r["doctor_id"] == body["p_doctor_id"]) >= slots:
+                return "full"
+            rows.append({"id": store.next_id(), "user_id": body["p_user_id"], "doctor_id": body["p_doctor_id"]})
+            return "claimed"
+    store.rpcs["claim_doctor_slot"] = claim
+
+
+def check(store, label: str, capacity: int, latencies=None) -> int:
+    rows = store.tables["recommended_doctor"]
+    load = Counter(r["doctor_id"] for r in rows)
+    over = sum(1 for c in load.values() if c > capacity)
+    doubled_users = sum(1 for c in Counter(r["user_id"] for r in rows).values() if c > 1)
+    spread = 0
+    for state in STATES:
+        loads = [load.get(d["id"], 0) for d in store.tables["doctors"] if d["dominant_state"] == state]
+        spread = max(spread, max(loads) - min(loads))
+    line = (f"  {label:<30} assigned {len(rows):4d}  doctors over capacity {over:3d}  "
+            f"users with 2+ doctors {doubled_users:3d}  load spread {spread}")
+    if latencies:
+        line += f"  p50 {percentile(latencies, 50):6.1f} ms  p99 {percentile(latencies, 99):6.1f} ms"
+    print(line)
+    return over + doubled_users
+
+
+def time_allocations(allocator, latencies: list):
+    """Record the duration of every ``allocator.allocate`` call in ``latencies`` (ms)."""
+    allocate = allocator.allocate
+
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return allocate(*args, **kwargs)
+        finally:
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    allocator.allocate = timed
+
+
+def legacy_assign(supabase, user_id: str, state: str):
+    """The previous check-then-insert allocation: a doctor with any assignment is unavailable."""
+    doctors = supabase.table("doctors").select("*").eq("dominant_state", state).execute().data
+    for doctor in doctors:
+        assigned = supabase.table("recommended_doctor").select("doctor_id").eq("doctor_id", doctor["id"]).execute().data
+        if not assigned:
+            supabase.table("recommended_doctor").insert({"user_id": user_id, "doctor_id": doctor["id"]}).execute()
+            return doctor
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--doctors", type=int, default=60)
+    parser.add_argument("--capacity", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.002, help="stand-in latency per request (s)")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent callers for the allocation-only run")
+    parser.add_argument("--max-allocate-ms", type=float, default=100.0, help="p99 bound for a single allocation")
+    args = parser.parse_args()
+
+    server, store, url = start_fake_postgrest(args.latency)
+    install_claim_rpc(store, args.capacity)
+    os.environ["SUPABASE_URL"] = url
+    os.environ["DOCTOR_DEFAULT_CAPACITY"] = str(args.capacity)
+    os.environ.setdefault("GROQ_API_KEY", "fake-key")
+    os.environ.setdefault("GROQ_BASE_URL", "http://127.0.0.1:9")
+
+    # Imported after the environment is set so settings pick up the stand-in
+    import httpx
+    from app import app
+    from config.database import supabase
+    from services.doctor_allocator import DoctorAllocator, doctor_allocator
+
+    print(f"{args.requests} concurrent users, {args.doctors} doctors x {args.capacity} slots, "
+          f"{args.latency * 1000:.0f} ms per query")
+    problems = 0
+
+    seed(store, args.requests, args.doctors)
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(lambda i: legacy_assign(supabase, f"user-{i}", STATES[i % len(STATES)]), range(args.requests)))
+    legacy = store.tables["recommended_doctor"]
+    doubled = sum(1 for c in Counter(r["doctor_id"] for r in legacy).values() if c > 1)
+    print(f"  {'legacy check-then-insert':<30} assigned {len(legacy):4d}  doctors double-assigned {doubled:3d}")
+
+    async def fire(client, users):
+        async def one(user_id):
+            start = time.perf_counter()
+            response = await client.post("/recommend", json={"user_id": user_id})
+            return response.status_code, (time.perf_counter() - start) * 1000
+        return await asyncio.gather(*(one(u) for u in users))
+
+    async def run_app():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+            allocations = []
+            time_allocations(doctor_allocator, allocations)
+            requests_before = store.requests
+            start = time.perf_counter()
+            results = await fire(client, [f"user-{i}" for i in range(args.requests)])
+            wall_ms = (time.perf_counter() - start) * 1000
+            statuses = Counter(status for status, _ in results)
+            failed = check(store, "/recommend", args.capacity, [ms for _, ms in results])
+            queries = store.requests - requests_before
+            print(f"    statuses {dict(statuses)}")
+            print(f"    inside allocate: p50 {percentile(allocations, 50):.1f} ms  p99 {percentile(allocations, 99):.1f} ms; "
+                  f"the burst made {queries} queries in {wall_ms:.0f} ms "
+                  f"({wall_ms / queries:.1f} ms each, served one after another)")
+            del doctor_allocator.allocate
+
+            # Release a fifth of the users and hand their slots to new ones
+            released = [f"user-{i}" for i in range(0, args.requests, 5)]
+            await asyncio.gather(*(client.delete(f"/recommend/{u}") for u in released))
+            newcomers = [f"new-{i}" for i in range(len(released))]
+            store.tables["mental_state_reports"].extend(
+                {"user_id": u, "dominant_state": STATES[i % len(STATES)], "created_at": "2026-01-02T00:00:00+00:00"}
+                for i, u in enumerate(newcomers)
+            )
+            results = await fire(client, newcomers)
+            failed += check(store, f"release {len(released)}, assign {len(newcomers)}", args.capacity,
+                            [ms for _, ms in results])
+            return failed
+
+    seed(store, args.requests, args.doctors)
+    doctor_allocator.load()
+    problems += asyncio.run(run_app())
+    incremental = {d: n for d, n in doctor_allocator.load_count.items() if n}
+    rescanned = dict(Counter(r["doctor_id"] for r in store.tables["recommended_doctor"]))
+    print(f"    incremental loads match a rescan: {incremental == rescanned}")
+    problems += incremental != rescanned
+
+    # Allocation alone, without the rest of the /recommend pipeline
+    seed(store, args.requests, args.doctors)
+    allocator = DoctorAllocator()
+    allocator.load()
+    allocations = []
+    time_allocations(allocator, allocations)
+    requests_before = store.requests
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(lambda i: allocator.allocate(f"user-{i}", STATES[i % len(STATES)], True), range(args.requests)))
+    problems += check(store, f"allocate only, {args.threads} threads", args.capacity, allocations)
+    slow = percentile(allocations, 99) > args.max_allocate_ms
+    print(f"    {(store.requests - requests_before) / args.requests:.2f} queries per allocation, "
+          f"p99 within {args.max_allocate_ms:.0f} ms: {not slow}")
+    problems += slow
+
+    # Two allocators = two workers with independent indexes, racing on the same users
+    seed(store, args.requests, args.doctors)
+    workers = [DoctorAllocator(), DoctorAllocator()]
+    for worker in workers:
+        worker.load()
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(
+            lambda i: workers[i % 2].allocate(f"user-{i // 2}", STATES[(i // 2) % len(STATES)], True),
+            range(args.requests * 2),
+        ))
+    problems += check(store, "two workers", args.capacity)
+    print(f"    settled by the database: {sum(w.stats['conflicts'] for w in workers)} user conflicts, "
+          f"{sum(w.stats['full'] for w in workers)} full doctors")
+
+    server.shutdown()
+    assert problems == 0, "capacity or uniqueness violated, or allocation latency over the bound"
+
+
+if __name__ == "__main__":
+    main()
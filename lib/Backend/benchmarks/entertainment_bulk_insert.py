@@ -0,0 +1,116 @@
+"""Per-request cost of storing entertainment recommendations.
+
+Compares the previous one-insert-per-row loop with the batched, chunked
+``store_recommended_entertainments`` at several set sizes against the local
+PostgREST stand-in (with a simulated round-trip latency), then checks that a
+rejected row inside a batch is isolated and reported while the rest of the
+batch is stored, and that repeated calls for an unchanged set neither grow
+the table nor send writes. Run from ``lib/Backend``::
+
+    python -m benchmarks.entertainment_bulk_insert --sizes 10 100 1000 --latency 0.005
+"""
+import argparse
+import os
+import statistics
+import time
+import uuid
+from datetime import datetime
+
+from benchmarks.fake_postgrest import start_fake_postgrest
+
+
+def legacy_store(supabase, user_id, entertainments, dominant_state):
+    """The previous row-at-a-time write path."""
+    stored = 0
+    for entertainment in entertainments:
+        try:
+            supabase.table('recommended_entertainments').insert({
+                'id': str(uuid.uuid4()),
+                'user_id': user_id,
+                'entertainment_id': entertainment['id'],
+                'recommended_at': datetime.now().isoformat(),
+                'matched_state': dominant_state
+            }).execute()
+            stored += 1
+        except Exception:
+            pass
+    return stored
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--latency", type=float, default=0.005, help="stand-in latency per request (s)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    server, store, url = start_fake_postgrest(args.latency)
+    os.environ["SUPABASE_URL"] = url
+    os.environ.setdefault("GROQ_API_KEY", "fake-key")
+    os.environ.setdefault("GROQ_BASE_URL", "http://127.0.0.1:9")
+
+    # Imported after the environment is set so settings pick up the stand-in
+    import contextlib
+    import io
+    from config.database import supabase
+    from services import recommendations
+
+    print(f"stand-in latency {args.latency * 1000:.0f} ms/request, chunk size {recommendations.ENTERTAINMENT_INSERT_CHUNK_SIZE}")
+    print(f"{'items':>6} {'legacy ms':>10} {'requests':>9} {'batched ms':>11} {'requests':>9} {'speed-up':>9}")
+    for size in args.sizes:
+        entertainments = [{"id": f"ent-{i}", "title": f"Item {i}"} for i in range(size)]
+        timings = {}
+        for name, store_fn in (("legacy", lambda user: legacy_store(supabase, user, entertainments, "stressed")),
+                               ("batched", lambda user: recommendations.store_recommended_entertainments(
+                                   user, entertainments, "stressed"))):
+            samples = []
+            for run in range(args.repeat):
+                store.tables["recommended_entertainments"] = []
+                before = store.requests
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    store_fn(f"user-{size}-{run}")
+                samples.append((time.perf_counter() - start) * 1000)
+                assert len(store.tables["recommended_entertainments"]) == size
+            timings[name] = (statistics.median(samples), store.requests - before)
+        (legacy_ms, legacy_requests), (batched_ms, batched_requests) = timings["legacy"], timings["batched"]
+        print(f"{size:>6} {legacy_ms:>10.1f} {legacy_requests:>9} {batched_ms:>11.1f} {batched_requests:>9} "
+              f"{legacy_ms / batched_ms:>8.1f}x")
+
+    # One row the database rejects, in the middle of a 1000-row batch
+    entertainments = [{"id": f"ent-{i}", "title": f"Item {i}"} for i in range(1000)]
+    store.tables["recommended_entertainments"] = [{"id": "existing", "user_id": "user-1", "entertainment_id": "ent-437"}]
+    store.unique["recommended_entertainments"] = ("user_id", "entertainment_id")
+    before = store.requests
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = recommendations.store_recommended_entertainments("user-1", entertainments, "stressed")
+    print(f"partial failure: stored {result['stored']}, failed {[f['entertainment_id'] for f in result['failed']]}, "
+          f"{store.requests - before} requests")
+    assert result["stored"] == 999 and [f["entertainment_id"] for f in result["failed"]] == ["ent-437"]
+
+    # Twenty page refreshes for a user whose state and matching set do not change
+    entertainments = entertainments[:50]
+    for name, store_fn in (("legacy", lambda: legacy_store(supabase, "user-2", entertainments, "stressed")),
+                           ("idempotent", lambda: recommendations.store_recommended_entertainments(
+                               "user-2", entertainments, "stressed"))):
+        # The legacy path ran without the unique index
+        store.unique["recommended_entertainments"] = ("user_id", "entertainment_id", "matched_state") if name != "legacy" else ()
+        store.tables["recommended_entertainments"] = []
+        recommendations._entertainment_fingerprints.delete("user-2")
+        before = store.requests
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(20):
+                store_fn()
+        rows = len(store.tables["recommended_entertainments"])
+        print(f"20 refreshes, 50 items, {name:<10}: {rows:5d} rows, {store.requests - before:5d} write requests")
+    assert rows == 50
+
+    # A state change rewrites the set; the old state's rows are kept as history
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = recommendations.store_recommended_entertainments("user-2", entertainments, "anxious")
+    assert not result["skipped"] and len(store.tables["recommended_entertainments"]) == 100
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
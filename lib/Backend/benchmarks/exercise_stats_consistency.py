@@ -0,0 +1,71 @@
+"""Consistency check: materialized exercise stats vs. the full recompute path.
+
+Replays random completion histories through ``record_completion`` against a
+local PostgREST stand-in and, after every completion, compares the O(1)
+``read_user_stats`` answer (at a random later instant) with
+``get_exercise_stats``. Finishes with the ``verify --all`` command. Run from
+``lib/Backend``::
+
+    python -m benchmarks.exercise_stats_consistency --users 30
+"""
+import argparse
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.fake_postgrest import start_fake_postgrest
+
+TIMEZONES = ["+05:30", "UTC", "America/New_York", "-08:00", None]
+GAPS_HOURS = [1, 3, 8, 20, 26, 30, 50, 200]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    server, store, url = start_fake_postgrest()
+    store.unique["exercise_user_stats"] = ("user_id",)
+    store.tables["exercise_completions"] = []
+    os.environ["SUPABASE_URL"] = url
+
+    # Imported after the environment is set so settings pick up the stand-in
+    from services import exercise_stats
+
+    rng = random.Random(args.seed)
+    now = datetime.now(timezone.utc)
+    checks = mismatches = 0
+    for index in range(args.users):
+        user_id = f"user-{index}"
+        tz_name = rng.choice(TIMEZONES)
+        completed_at = now - timedelta(days=rng.randint(20, 120))
+        while True:
+            completed_at += timedelta(hours=rng.choice(GAPS_HOURS))
+            if completed_at > now:
+                break
+            duration = rng.randint(30, 600)
+            store.tables["exercise_completions"].append({
+                "user_id": user_id,
+                "exercise_id": 1,
+                "duration_seconds": duration,
+                "completed_at": completed_at.isoformat(),
+            })
+            exercise_stats.record_completion(user_id, completed_at, duration, tz_name)
+
+            probe = min(completed_at + timedelta(hours=rng.choice([0, 5, 30, 80])), now)
+            materialized = exercise_stats.read_user_stats(user_id, tz_name, now=probe)
+            recomputed = exercise_stats.get_exercise_stats(user_id, tz_name, now=probe)
+            checks += 1
+            if materialized != recomputed:
+                mismatches += 1
+                print(f"MISMATCH {user_id} at {probe}: {materialized} != {recomputed}")
+
+    print(f"incremental vs recompute: {checks} checks, {mismatches} mismatches")
+    status = exercise_stats.main(["verify", "--all"])
+    server.shutdown()
+    assert mismatches == 0 and status == 0, "materialized stats diverged from the recompute path"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""Minimal in-memory PostgREST stand-in used by the benchmarks.
+
+Supports the subset of the PostgREST protocol the backend uses: ``select``
+with ``eq``/``neq``/``gt``/``gte``/``lt``/``lte``/``in``/``is`` filters
+(also nested in ``or``/``and``),
+``order``, ``limit``, ``offset``, ``count=exact``, inserts (atomic per statement, with any
+number of unique constraints), upserts (``on_conflict``), RPCs and deletes. It
+also counts accepted TCP connections so benchmarks can check connection
+reuse.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+
+def _coerce(value: str) -> Any:
+    if value == "null":
+        return None
+    if value in ("true", "false"):
+        return value == "true"
+    return value
+
+
+def _compare(op: str, left: Any, right: Any) -> bool:
+    if op == "is":
+        return left is right or (right is None and left is None)
+    if left is None:
+        return False
+    if not isinstance(left, str):
+        try:
+            right = type(left)(right)
+        except (TypeError, ValueError):
+            left = str(left)
+    if op == "eq":
+        return left == right
+    if op == "neq":
+        return left != right
+    if op == "gt":
+        return left > right
+    if op == "gte":
+        return left >= right
+    if op == "lt":
+        return left < right
+    if op == "lte":
+        return left <= right
+    raise ValueError(op)
+
+
+def _parse_filter(column: str, expression: str) -> Callable[[Dict], bool]:
+    op, _, value = expression.partition(".")
+    if op == "in":
+        members = [v.strip().strip('"') for v in value.strip("()").split(",") if v.strip()]
+        return lambda row: str(row.get(column)) in members
+    right = _coerce(value.strip('"'))
+    return lambda row: _compare(op, row.get(column), right)
+
+
+def _split_terms(text: str) -> List[str]:
+    """Split a logic tree's comma-separated terms, respecting parentheses and quotes."""
+    terms, depth, quoted, start = [], 0, False, 0
+    for i, char in enumerate(text):
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and char == "," and depth == 0:
+            terms.append(text[start:i])
+            start = i + 1
+    terms.append(text[start:])
+    return terms
+
+
+def _parse_logic(operator: str, expression: str) -> Callable[[Dict], bool]:
+    """``or=(a.gt.1,and(b.eq.2,c.lt.3))`` style filters."""
+    checks = []
+    for term in _split_terms(expression.strip()[1:-1]):
+        head, _, rest = term.partition("(")
+        if head in ("or", "and") and rest:
+            checks.append(_parse_logic(head, "(" + rest))
+        else:
+            column, _, condition = term.partition(".")
+            checks.append(_parse_filter(column, condition))
+    combine = any if operator == "or" else all
+    return lambda row: combine(check(row) for check in checks)
+
+
+class FakePostgrestStore:
+    """Tables are plain lists of dicts, guarded by one lock."""
+
+    def __init__(self, latency: float = 0.0):
+        self.tables: Dict[str, List[Dict]] = {}
+        # table -> key columns, or a list of them for several unique constraints
+        self.unique: Dict[str, Any] = {}
+        self.rpcs: Dict[str, Callable[[Dict], Any]] = {}
+        self.lock = threading.Lock()
+        self.latency = latency
+        self.requests = 0
+        self.connections = 0
+        self._next_id = 1
+
+    def constraints(self, table: str) -> List[Tuple[str, ...]]:
+        keys = self.unique.get(table)
+        if not keys:
+            return []
+        return [tuple(keys)] if isinstance(keys[0], str) else [tuple(k) for k in keys]
+
+    def next_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+
+class FakePostgrestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    store: FakePostgrestStore = None
+
+    def setup(self):
+        super().setup()
+        with self.store.lock:
+            self.store.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    # -- helpers ---------------------------------------------------------
+    def _route(self) -> Tuple[str, List[Tuple[str, str]]]:
+        parts = urlsplit(self.path)
+        path = parts.path
+        if path.startswith("/rest/v1"):
+            path = path[len("/rest/v1"):]
+        return path.strip("/"), parse_qsl(parts.query, keep_blank_values=True)
+
+    def _filters(self, params) -> Tuple[List[Callable], Optional[List[Tuple[str, bool]]], Optional[int], Optional[str]]:
+        filters, order, limit, on_conflict = [], None, None, None
+        offset = 0
+        for key, value in params:
+            if key == "select" or key == "columns":
+                continue
+            if key == "order":
+                order = []
+                for term in value.split(","):
+                    column, _, direction = term.partition(".")
+                    order.append((column, direction.startswith("desc")))
+            elif key == "limit":
+                limit = int(value)
+            elif key == "offset":
+                offset = int(value)
+            elif key == "on_conflict":
+                on_conflict = value
+            elif key in ("or", "and"):
+                filters.append(_parse_logic(key, value))
+            else:
+                filters.append(_parse_filter(key, value))
+        self._offset = offset
+        return filters, order, limit, on_conflict
+
+    def _body(self) -> Any:
+        return self._payload
+
+    def _send(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None):
+        # Prefer: return=minimal answers writes with an empty body
+        minimal = self.command != "GET" and "return=minimal" in (self.headers.get("Prefer") or "") and status < 300
+        data = b"" if minimal else json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        # One write for headers and body, so keep-alive responses are not held back
+        self._headers_buffer.append(b"\r\n" + data)
+        self.flush_headers()
+
+    def _begin(self):
+        # always drain the body: postgrest-py sends "{}" even on GET requests
+        length = int(self.headers.get("Content-Length") or 0)
+        self._payload = json.loads(self.rfile.read(length) or b"null")
+        with self.store.lock:
+            self.store.requests += 1
+        if self.store.latency:
+            time.sleep(self.store.latency)
+
+    # -- verbs -----------------------------------------------------------
+    def do_GET(self):
+        self._begin()
+        table, params = self._route()
+        filters, order, limit, _ = self._filters(params)
+        with self.store.lock:
+            rows = [dict(r) for r in self.store.tables.get(table, []) if all(f(r) for f in filters)]
+        # Stable sorts from the last key to the first give the multi-column order
+        for column, descending in reversed(order or []):
+            rows.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=descending)
+        total = len(rows)
+        rows = rows[self._offset:]
+        if limit is not None:
+            rows = rows[:limit]
+        headers = None
+        if "count=exact" in (self.headers.get("Prefer") or ""):
+            headers = {"Content-Range": f"{self._offset}-{self._offset + len(rows) - 1}/{total}" if rows else f"*/{total}"}
+        self._send(200, rows, headers)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_POST(self):
+        self._begin()
+        table, params = self._route()
+        body = self._body()
+        if table.startswith("rpc/"):
+            handler = self.store.rpcs.get(table[4:])
+            if handler is None:
+                self._send(404, {"message": f"function {table[4:]} not found"})
+                return
+            self._send(200, handler(body or {}))
+            return
+
+        _, _, _, on_conflict = self._filters(params)
+        rows = body if isinstance(body, list) else [body]
+        merge = "merge-duplicates" in (self.headers.get("Prefer") or "")
+        constraints = self.store.constraints(table)
+        if on_conflict:
+            constraints = [tuple(on_conflict.split(","))] + [c for c in constraints if c != tuple(on_conflict.split(","))]
+        inserted, appended, merged = [], [], []
+        with self.store.lock:
+            existing = self.store.tables.setdefault(table, [])
+            indexes = [{tuple(r.get(k) for k in keys): r for r in existing} for keys in constraints]
+            # The statement is atomic: nothing is applied if any row conflicts
+            for row in rows:
+                row = dict(row)
+                for position, keys in enumerate(constraints):
+                    clash = indexes[position].get(tuple(row.get(k) for k in keys))
+                    if clash is None:
+                        continue
+                    if merge and position == 0:
+                        merged.append((clash, row))
+                        inserted.append({**clash, **row})
+                        break
+                    self._send(409, {
+                        "code": "23505",
+                        "message": f'duplicate key value violates unique constraint "{table}_{"_".join(keys)}_key"',
+                    })
+                    return
+                else:
+                    row.setdefault("id", self.store.next_id())
+                    appended.append(row)
+                    for keys, index in zip(constraints, indexes):
+                        index[tuple(row.get(k) for k in keys)] = row
+                    inserted.append(dict(row))
+            for clash, row in merged:
+                clash.update(row)
+            existing.extend(appended)
+        self._send(201, inserted)
+
+    def do_PATCH(self):
+        self._begin()
+        table, params = self._route()
+        filters, _, _, _ = self._filters(params)
+        changes = self._body() or {}
+        with self.store.lock:
+            updated = []
+            for row in self.store.tables.get(table, []):
+                if all(f(row) for f in filters):
+                    row.update(changes)
+                    updated.append(dict(row))
+        self._send(200, updated)
+
+    def do_DELETE(self):
+        self._begin()
+        table, params = self._route()
+        filters, _, _, _ = self._filters(params)
+        with self.store.lock:
+            rows = self.store.tables.get(table, [])
+            removed = [r for r in rows if all(f(r) for f in filters)]
+            self.store.tables[table] = [r for r in rows if not all(f(r) for f in filters)]
+        self._send(200, removed)
+
+
+def start_fake_postgrest(latency: float = 0.0) -> Tuple[ThreadingHTTPServer, FakePostgrestStore, str]:
+    """Start the stand-in on a free port; returns (server, store, supabase_url)."""
+    store = FakePostgrestStore(latency)
+    handler = type("ConfiguredFakePostgrestHandler", (FakePostgrestHandler,), {"store": store})
+    # A deeper accept backlog than the default 5, for bursts of new pool connections
+    server_class = type("FakePostgrestServer", (ThreadingHTTPServer,), {"request_queue_size": 256})
+    server = server_class(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, store, f"http://127.0.0.1:{server.server_address[1]}"
@@ -0,0 +1,94 @@
+"""Accuracy and latency of intent retrieval over ``models/chatbot_dataset.json``.
+
+The labeled eval set is built from the dataset itself: for every intent with
+at least ``--min-patterns`` distinct patterns, up to ``--per-intent`` patterns
+that belong to no other intent are held out (fixed seed) and the index is
+built from the rest. Each held-out pattern is a query labeled with its
+intent. Reports top-1/top-3 accuracy for the BM25 ``IntentIndex`` and for the
+previous "tag name is a substring of the message" lookup, then search
+latency over the eval queries. Run from ``lib/Backend``::
+
+    python -m benchmarks.intent_retrieval --per-intent 5
+"""
+import argparse
+import json
+import random
+import time
+from collections import defaultdict
+
+from benchmarks.fake_groq import percentile
+from utils.intent_index import IntentIndex, tokenize
+
+DATASET_PATH = "models/chatbot_dataset.json"
+
+
+def build_eval_set(intents, per_intent: int, min_patterns: int, seed: int):
+    """Split the patterns into (training intents, [(query, tag)])."""
+    owners = defaultdict(set)
+    for intent in intents:
+        for pattern in intent.get("patterns", []):
+            owners[pattern.strip().lower()].add(intent["tag"])
+
+    rng = random.Random(seed)
+    training, eval_set = [], []
+    for intent in intents:
+        patterns = list(dict.fromkeys(p.strip() for p in intent.get("patterns", []) if tokenize(p)))
+        candidates = [p for p in patterns if len(owners[p.lower()]) == 1]
+        held_out = set()
+        if len(patterns) >= min_patterns:
+            held_out = set(rng.sample(candidates, min(per_intent, len(candidates), len(patterns) - 1)))
+        eval_set.extend((pattern, intent["tag"]) for pattern in sorted(held_out))
+        training.append({**intent, "patterns": [p for p in patterns if p not in held_out]})
+    return training, eval_set
+
+
+def legacy_tags(intents, message: str):
+    """The previous lookup: the first tag whose name occurs in the message."""
+    lowered = message.lower().strip()
+    return [intent["tag"] for intent in intents if intent["tag"].lower() in lowered][:1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--per-intent", type=int, default=5)
+    parser.add_argument("--min-patterns", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with open(DATASET_PATH, "r", encoding="utf-8") as file:
+        intents = json.load(file)["intents"]
+    training, eval_set = build_eval_set(intents, args.per_intent, args.min_patterns, args.seed)
+
+    started = time.perf_counter()
+    index = IntentIndex.build(training)
+    build_ms = (time.perf_counter() - started) * 1000
+    print(f"index: {len(index)} intents, {len(index.patterns)} distinct patterns, built in {build_ms:.0f} ms")
+    print(f"eval set: {len(eval_set)} held-out patterns from "
+          f"{len({tag for _, tag in eval_set})} intents")
+
+    for name, lookup in (("legacy tag-in-message", lambda q: legacy_tags(intents, q)),
+                         ("BM25 IntentIndex", lambda q: [m["tag"] for m in index.search(q, 3)])):
+        top1 = top3 = 0
+        for query, tag in eval_set:
+            tags = lookup(query)
+            top1 += bool(tags) and tags[0] == tag
+            top3 += tag in tags[:3]
+        print(f"  {name:<22} top-1 {top1 / len(eval_set):6.1%}   top-3 {top3 / len(eval_set):6.1%}")
+
+    for _ in range(3):
+        for query, _ in eval_set:
+            index.search(query, 3)
+    samples = []
+    for query, _ in eval_set * 5:
+        started = time.perf_counter()
+        index.search(query, 3)
+        samples.append((time.perf_counter() - started) * 1e6)
+    print(f"search latency: p50 {percentile(samples, 50):.0f} us  p99 {percentile(samples, 99):.0f} us  "
+          f"max {max(samples):.0f} us")
+
+    scores = sorted(m["score"] for query, _ in eval_set for m in index.search(query, 1))
+    print(f"top-1 score quartiles: {[round(scores[int(len(scores) * q)], 2) for q in (0.1, 0.25, 0.5, 0.75)]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Micro-benchmark: compiled keyword matcher vs. the previous per-keyword scans.
+
+Classifies a synthetic corpus with both the legacy substring loops and the
+precompiled matchers, checks the results are identical and prints timings.
+Run from ``lib/Backend``::
+
+    python -m benchmarks.keyword_matcher_bench --messages 100000
+"""
+import argparse
+import os
+import random
+import time
+
+os.environ.setdefault("GROQ_API_KEY", "bench-key")
+
+from services.chatbot_service import CRISIS_KEYWORDS, FALLBACK_RESPONSES, contains_crisis, _FALLBACK_MATCHER
+from services.recommendations import (
+    HEURISTIC_CHECKS,
+    HEURISTIC_PHRASES,
+    LABEL_KEYWORDS,
+    LABEL_PHRASES,
+    GroqMentalStatePredictor,
+)
+
+FILLER = (
+    "today i went to class and then came home the bus was late again my friend said "
+    "we should talk later about the project work family weekend"
+).split()
+
+
+def legacy_heuristic(text):
+    t = (text or "").lower().strip()
+    for phrase, (label, conf) in HEURISTIC_PHRASES.items():
+        if phrase in t:
+            return {"prediction": label, "confidence": conf}
+    best_label, best_conf = None, 0.0
+    for keywords, label, conf in HEURISTIC_CHECKS:
+        for kw in keywords:
+            if kw in t:
+                if conf > best_conf:
+                    best_conf, best_label = conf, label
+                break
+    if best_label:
+        return {"prediction": best_label, "confidence": round(best_conf, 2)}
+    return {"prediction": "neutral/calm", "confidence": 0.7}
+
+
+def legacy_normalize(p):
+    p = p.strip().lower()
+    for k, v in LABEL_KEYWORDS.items():
+        if k in p:
+            return v
+    for phrase, label in LABEL_PHRASES.items():
+        if phrase in p:
+            return label
+    return None
+
+
+def legacy_crisis(message):
+    return any(kw in message.lower() for kw in CRISIS_KEYWORDS)
+
+
+def legacy_fallback_key(message):
+    lowered = message.lower()
+    for keyword in FALLBACK_RESPONSES:
+        if keyword in lowered:
+            return keyword
+    return None
+
+
+def build_corpus(size, seed=7):
+    rng = random.Random(seed)
+    vocabulary = (
+        list(HEURISTIC_PHRASES) + list(LABEL_KEYWORDS) + list(LABEL_PHRASES)
+        + CRISIS_KEYWORDS + list(FALLBACK_RESPONSES)
+        + [kw for keywords, _, _ in HEURISTIC_CHECKS for kw in keywords]
+    )
+    corpus = []
+    for _ in range(size):
+        words = rng.choices(FILLER, k=rng.randint(4, 16))
+        for _ in range(rng.randint(0, 3)):
+            words.insert(rng.randrange(len(words) + 1), rng.choice(vocabulary))
+        text = " ".join(words)
+        corpus.append(text.capitalize() if rng.random() < 0.3 else text)
+    return corpus
+
+
+def timed(label, fn, corpus):
+    start = time.perf_counter()
+    results = [fn(text) for text in corpus]
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<10} {elapsed * 1000:9.1f} ms  ({elapsed / len(corpus) * 1e6:6.2f} us/msg)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100_000)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.messages)
+    predictor = GroqMentalStatePredictor()
+    cases = [
+        ("heuristic_predict", legacy_heuristic, predictor.heuristic_predict),
+        ("normalize_prediction", legacy_normalize, predictor.normalize_prediction),
+        ("contains_crisis", legacy_crisis, contains_crisis),
+        ("fallback keyword", legacy_fallback_key, _FALLBACK_MATCHER.first),
+    ]
+    print(f"corpus: {len(corpus)} messages")
+    for name, legacy, compiled in cases:
+        print(name)
+        expected = timed("legacy", legacy, corpus)
+        actual = timed("compiled", compiled, corpus)
+        mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+        print(f"  mismatches: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
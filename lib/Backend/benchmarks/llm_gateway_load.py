@@ -0,0 +1,55 @@
+"""Load benchmark for the /api/chat handler running on the shared LLM gateway.
+
+Starts a local fake Groq server, points the gateway at it and fires
+``--concurrency`` simultaneous chats through ``chat_with_bot``. Run from
+``lib/Backend``::
+
+    python -m benchmarks.llm_gateway_load --concurrency 64 --delay 0.2
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.fake_groq import percentile, start_fake_groq
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--delay", type=float, default=0.2, help="fake upstream latency in seconds")
+    args = parser.parse_args()
+
+    server, base_url = start_fake_groq(args.delay)
+    os.environ["GROQ_BASE_URL"] = base_url
+    os.environ.setdefault("GROQ_API_KEY", "fake-key")
+    os.environ["CHAT_CACHE_SIZE"] = "0"  # repeated messages would otherwise be answered from the reply cache
+
+    # Imported after the environment is set so settings pick up the fake server
+    from services.chatbot_service import ChatRequest, chat_with_bot
+
+    async def one_chat(i: int) -> float:
+        start = time.perf_counter()
+        await chat_with_bot(ChatRequest(message=f"I feel so stressed about my exams ({i})"))
+        return (time.perf_counter() - start) * 1000.0
+
+    async def one_round():
+        return await asyncio.gather(*(one_chat(i) for i in range(args.concurrency)))
+
+    latencies = []
+    wall_start = time.perf_counter()
+    for _ in range(args.rounds):
+        latencies.extend(asyncio.run(one_round()))
+    wall = time.perf_counter() - wall_start
+
+    print(f"upstream delay : {args.delay * 1000:.0f} ms")
+    print(f"concurrency    : {args.concurrency} x {args.rounds} rounds")
+    print(f"p50 latency    : {percentile(latencies, 50):.1f} ms")
+    print(f"p99 latency    : {percentile(latencies, 99):.1f} ms")
+    print(f"throughput     : {len(latencies) / wall:.1f} chats/s")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""End-to-end latency of ``get_all_recommendations``.
+
+Runs the previous sequential pipeline and the concurrent one against the
+local PostgREST stand-in with a simulated round-trip latency, for fresh
+users (so every stage does real work), and prints the per-stage timings.
+With the fan-out the total should sit near state lookup + the slower
+branch rather than the sum of every stage. Run from ``lib/Backend``::
+
+    python -m benchmarks.recommendation_fanout --users 20 --latency 0.02
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import time
+
+from benchmarks.fake_postgrest import start_fake_postgrest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02, help="stand-in latency per request (s)")
+    args = parser.parse_args()
+
+    server, store, url = start_fake_postgrest(args.latency)
+    store.tables["doctors"] = [{"id": f"doc-{i}", "name": f"Doctor {i}", "dominant_state": "stressed"} for i in range(10)]
+    store.tables["recommended_doctor"] = []
+    store.unique["recommended_doctor"] = [("user_id",)]
+    store.tables["entertainments"] = [
+        {"id": f"ent-{i}", "title": f"Item {i}", "type": "video", "dominant_state": "stressed"} for i in range(50)
+    ]
+    store.unique["recommended_entertainments"] = ("user_id", "entertainment_id", "matched_state")
+    store.tables["mental_state_reports"] = [
+        {"id": i, "user_id": f"{prefix}-{i}", "dominant_state": "stressed", "created_at": "2026-01-01T00:00:00+00:00"}
+        for prefix in ("sequential", "concurrent") for i in range(args.users)
+    ]
+    os.environ["SUPABASE_URL"] = url
+    os.environ["DOCTOR_DEFAULT_CAPACITY"] = str(args.users * 2)
+    os.environ.setdefault("GROQ_API_KEY", "fake-key")
+    os.environ.setdefault("GROQ_BASE_URL", "http://127.0.0.1:9")
+
+    # Imported after the environment is set so settings pick up the stand-in
+    from services import recommendations
+    from services.doctor_allocator import doctor_allocator
+    doctor_allocator.load()
+
+    def sequential(user_id):
+        """The previous pipeline: every stage after the one before it."""
+        dominant_state = recommendations.get_user_dominant_state(user_id)
+        entertainments = recommendations.get_entertainments_by_dominant_state(dominant_state)
+        recommendations.store_recommended_entertainments(user_id, entertainments, dominant_state)
+        doctor_allocator.allocate(user_id, dominant_state)
+
+    results = {}
+    for name, run in (("sequential", sequential), ("concurrent", recommendations.get_all_recommendations)):
+        samples = []
+        for i in range(args.users):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                run(f"{name}-{i}")
+            samples.append((time.perf_counter() - start) * 1000)
+        results[name] = statistics.median(samples)
+
+    print(f"stand-in latency {args.latency * 1000:.0f} ms/request, {args.users} fresh users")
+    for name, median in results.items():
+        print(f"  {name:<11} median {median:7.1f} ms")
+    print("  stages (concurrent pipeline):")
+    for stage, stats in recommendations.recommendation_timings.stats().items():
+        print(f"    {stage:<22} avg {stats['avg_ms']:7.1f} ms  max {stats['max_ms']:7.1f} ms")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
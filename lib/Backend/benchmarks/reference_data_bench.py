@@ -0,0 +1,94 @@
+"""Supabase traffic and latency of per-state reference lookups.
+
+Replays ``--calls`` per-user lookups (doctors, entertainments and
+suggestions for the user's state) against the local PostgREST stand-in,
+first with the previous query-per-call functions and then through the
+reference-data cache, and reports requests sent, latency and hit rate. It
+then edits a table and checks that the forced-refresh endpoint picks the
+change up. Run from ``lib/Backend``::
+
+    python -m benchmarks.reference_data_bench --calls 500 --latency 0.005
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import statistics
+import time
+
+from benchmarks.fake_postgrest import start_fake_postgrest
+
+STATES = ["happy/positive", "stressed/anxious", "depressed/sad", "angry/frustrated",
+          "neutral/calm", "confused/uncertain", "excited/energetic"]
+
+
+def legacy_lookups(supabase, state):
+    """The previous per-call queries."""
+    doctors = supabase.table("doctors").select("*").eq("dominant_state", state).execute().data
+    if not doctors:
+        doctors = supabase.table("doctors").select("*").eq("dominant_state", "General").execute().data
+    supabase.table('entertainments') \
+        .select('id, title, type, dominant_state, cover_img_url, description, media_file_url') \
+        .eq('dominant_state', state).execute()
+    supabase.table("suggestions").select("id, logo, suggestion, description, category").eq("category", state).execute()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.005, help="stand-in latency per request (s)")
+    args = parser.parse_args()
+
+    server, store, url = start_fake_postgrest(args.latency)
+    store.tables["doctors"] = [{"id": i, "name": f"Doctor {i}", "dominant_state": STATES[i % 5] if i % 6 else "General"}
+                               for i in range(60)]
+    store.tables["entertainments"] = [{"id": i, "title": f"Item {i}", "type": "video", "dominant_state": STATES[i % 7]}
+                                      for i in range(300)]
+    store.tables["suggestions"] = [{"id": i, "suggestion": f"Tip {i}", "category": STATES[i % 7]} for i in range(140)]
+    os.environ["SUPABASE_URL"] = url
+    os.environ.setdefault("GROQ_API_KEY", "fake-key")
+    os.environ.setdefault("GROQ_BASE_URL", "http://127.0.0.1:9")
+    logging.disable(logging.INFO)
+
+    # Imported after the environment is set so settings pick up the stand-in
+    from fastapi.testclient import TestClient
+    from app import app
+    from config.database import supabase
+    from services import recommendations
+    from services.ai_suggestions import SuggestionManager
+    from services.reference_data import reference_data
+
+    manager = SuggestionManager()
+
+    def cached_lookups(state):
+        recommendations.get_doctors_by_dominant_state(state)
+        recommendations.get_entertainments_by_dominant_state(state)
+        manager.fetch_matching_suggestions(state)
+
+    print(f"{args.calls} per-user lookups over {len(STATES)} states, {args.latency * 1000:.0f} ms per request")
+    for name, lookup in (("query per call", lambda s: legacy_lookups(supabase, s)), ("reference cache", cached_lookups)):
+        before = store.requests
+        samples = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(args.calls):
+                start = time.perf_counter()
+                lookup(STATES[i % len(STATES)])
+                samples.append((time.perf_counter() - start) * 1000)
+        print(f"  {name:<16} requests {store.requests - before:5d}  median {statistics.median(samples):7.3f} ms  "
+              f"max {max(samples):7.1f} ms")
+    for table, stats in reference_data.stats().items():
+        print(f"  {table:<16} rows {stats['rows']:4d}  hit rate {stats['hit_rate']:.4f}  version {stats['version']}")
+
+    store.tables["suggestions"].append({"id": 999, "suggestion": "New tip", "category": "neutral/calm"})
+    client = TestClient(app)
+    response = client.post("/api/admin/reference-data/refresh", params={"table": "suggestions"})
+    assert response.status_code == 200, response.text
+    tips = [row["id"] for row in reference_data.rows_for("suggestions", "neutral/calm")]
+    print(f"  forced refresh: {response.json()['refreshed']}, new row visible: {999 in tips}")
+    assert 999 in tips
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
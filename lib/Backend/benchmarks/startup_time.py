@@ -0,0 +1,85 @@
+"""Cold-start benchmark: import time and first-request latency of the app.
+
+Each run is a fresh interpreter that imports ``app``, enters the FastAPI
+startup hooks through ``TestClient`` and sends one ``/api/chat`` request to a
+local fake Groq server. ``--backend-dir`` can point at another checkout (for
+example a ``git worktree`` of an older commit) to compare the two. Run from
+``lib/Backend``::
+
+    python -m benchmarks.startup_time --runs 5 --delay 0.2
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child(delay: float):
+    from benchmarks.fake_groq import start_fake_groq
+
+    server, base_url = start_fake_groq(delay)
+    os.environ["GROQ_BASE_URL"] = base_url
+    os.environ.setdefault("GROQ_API_KEY", "fake-key")
+
+    start = time.perf_counter()
+    import app as app_module
+    imported = time.perf_counter()
+
+    from fastapi.testclient import TestClient
+
+    with TestClient(app_module.app) as client:
+        started = time.perf_counter()
+        client.post("/api/chat", json={"message": "I feel stressed about my exams"})
+        first_response = time.perf_counter()
+        ready = None
+        if any(getattr(r, "path", None) == "/api/ready" for r in app_module.app.routes):
+            while client.get("/api/ready").status_code != 200:
+                time.sleep(0.005)
+            ready = time.perf_counter()
+
+    print(json.dumps({
+        "import_ms": (imported - start) * 1000,
+        "startup_ms": (started - imported) * 1000,
+        "first_request_ms": (first_response - started) * 1000,
+        "import_to_first_response_ms": (first_response - start) * 1000,
+        "import_to_ready_ms": (ready - start) * 1000 if ready else None,
+    }))
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--delay", type=float, default=0.2, help="fake upstream latency in seconds")
+    parser.add_argument("--backend-dir", default=BACKEND_DIR, help="backend checkout to measure")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.delay)
+        return
+
+    # The fake server module is taken from this checkout so older trees can be measured too
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([args.backend_dir, BACKEND_DIR]))
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", "--delay", str(args.delay)],
+            cwd=args.backend_dir, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"backend: {args.backend_dir} ({args.runs} cold runs, upstream delay {args.delay * 1000:.0f} ms)")
+    for key in runs[0]:
+        values = [r[key] for r in runs if r[key] is not None]
+        if values:
+            print(f"  {key:<28} median {statistics.median(values):8.1f} ms   max {max(values):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Connection reuse check for the shared Supabase client.
+
+Runs a burst of sequential and concurrent queries through
+``config.database.supabase`` against a local PostgREST stand-in and compares
+the TCP connections the server accepted with the number of requests served.
+Run from ``lib/Backend``::
+
+    python -m benchmarks.supabase_pool_reuse --requests 500 --threads 16
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_postgrest import start_fake_postgrest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    server, store, url = start_fake_postgrest()
+    store.tables["doctors"] = [{"id": i, "name": f"Doctor {i}", "dominant_state": "neutral/calm"} for i in range(20)]
+    os.environ["SUPABASE_URL"] = url
+
+    # Imported after the environment is set so settings pick up the stand-in
+    from config.database import pool_stats, supabase
+
+    def query(_):
+        return supabase.table("doctors").select("*").eq("dominant_state", "neutral/calm").execute()
+
+    start = time.perf_counter()
+    for i in range(args.requests // 2):
+        query(i)
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(query, range(args.requests - args.requests // 2)))
+    elapsed = time.perf_counter() - start
+
+    stats = pool_stats()
+    print(f"requests served      : {store.requests}")
+    print(f"server TCP accepts   : {store.connections}")
+    print(f"client pool stats    : {stats}")
+    print(f"elapsed              : {elapsed * 1000:.0f} ms")
+    assert store.connections <= args.threads + 1, "expected connections to be reused from the pool"
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Benchmark: trending exercises, legacy scan + N+1 vs. aggregated engine.
+
+Loads ``--completions`` synthetic completions (spread over twice the
+trending window) into the local PostgREST stand-in, registers a
+``trending_exercises`` RPC that aggregates in the "database", and times:
+
+* legacy   - every windowed completion row pulled into Python, then one
+             query per top exercise (the previous ``get_trending``)
+* rpc      - server-side counts, hydrated from the exercise catalog
+             (its first load is the second request)
+* cached   - the same call served from the TTL cache
+* scan     - the client-side fallback used when the RPC is missing
+             (only with ``--include-scan``; slow on the stand-in)
+* warm     - building the in-memory decayed counter from the hourly
+             aggregate RPC (``warm-scan``: from a paged table scan)
+* counter  - answering from the warm counter (per call, after one
+             completion invalidates the cached top-K, and cached)
+
+Run from ``lib/Backend``::
+
+    python -m benchmarks.trending_bench --completions 1000000
+"""
+import argparse
+import os
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.fake_postgrest import start_fake_postgrest
+
+
+def build_store(store, completions: int, exercises: int, window_days: int, seed: int = 11):
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    store.tables["exercises"] = [
+        {
+            "id": f"ex-{i}",
+            "exercise_name": f"Exercise {i}",
+            "duration": "5 min",
+            "category_name": "Breathing",
+            "category_image_path": "assets/breathing.png",
+            "exercise_description": "Slow breathing",
+            "chat_flow": '[{"type": "bot", "text": "Breathe in"}]',
+            "is_active": True,
+        }
+        for i in range(exercises)
+    ]
+    # Share timestamp and id strings between rows to keep the stand-in's memory down
+    minutes = window_days * 2 * 24 * 60
+    stamps = [(now - timedelta(minutes=m)).isoformat() for m in range(minutes)]
+    ids = [f"ex-{i}" for i in range(exercises)]
+    weights = [1.0 / (i + 1) for i in range(exercises)]
+    picks = rng.choices(ids, weights=weights, k=completions)
+    store.tables["exercise_completions"] = [
+        {"id": n, "exercise_id": picks[n], "completed_at": stamps[rng.randrange(minutes)]}
+        for n in range(completions)
+    ]
+
+    def trending_rpc(body):
+        since = body["since"]
+        counts = Counter(r["exercise_id"] for r in store.tables["exercise_completions"] if r["completed_at"] >= since)
+        ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[: body.get("max_results", 10)]
+        return [{"exercise_id": exercise_id, "completions": count} for exercise_id, count in ranked]
+
+    def hourly_rpc(body):
+        since = body["since"]
+        counts = Counter(
+            (r["exercise_id"], r["completed_at"][:13])
+            for r in store.tables["exercise_completions"] if r["completed_at"] >= since
+        )
+        return [
+            {"exercise_id": exercise_id, "hour": f"{hour}:00:00+00:00", "completions": count}
+            for (exercise_id, hour), count in counts.items()
+        ]
+
+    store.rpcs["trending_exercises"] = trending_rpc
+    store.rpcs["trending_exercises_hourly"] = hourly_rpc
+
+
+def legacy_trending(supabase, limit: int, window_days: int):
+    week_ago = (datetime.now(timezone.utc) - timedelta(days=window_days)).isoformat()
+    response = supabase.table("exercise_completions").select("exercise_id").gte("completed_at", week_ago).execute()
+    count_map = {}
+    for completion in response.data:
+        count_map[completion["exercise_id"]] = count_map.get(completion["exercise_id"], 0) + 1
+    trending = []
+    for ex_id, count in sorted(count_map.items(), key=lambda x: x[1], reverse=True)[:limit]:
+        ex_response = supabase.table("exercises").select("*").eq("id", ex_id).execute()
+        if ex_response.data:
+            trending.append((ex_response.data[0], count))
+    return trending
+
+
+def timed(label, fn, store):
+    requests_before = store.requests
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<8} {elapsed * 1000:10.1f} ms  {store.requests - requests_before:5d} requests")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--completions", type=int, default=1_000_000)
+    parser.add_argument("--exercises", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--include-scan", action="store_true")
+    args = parser.parse_args()
+
+    server, store, url = start_fake_postgrest()
+    os.environ["SUPABASE_URL"] = url
+    os.environ.setdefault("EXERCISE_TRENDING_PAGE_SIZE", "50000")
+
+    # Imported after the environment is set so settings pick up the stand-in
+    from config.database import supabase
+    from config.settings import EXERCISE_TRENDING_WINDOW_DAYS
+    from services import exercise_trending
+
+    build_store(store, args.completions, args.exercises, EXERCISE_TRENDING_WINDOW_DAYS)
+    print(f"{args.completions} completions, {args.exercises} exercises, top {args.limit}")
+
+    legacy = timed("legacy", lambda: legacy_trending(supabase, args.limit, EXERCISE_TRENDING_WINDOW_DAYS), store)
+    engine = timed("rpc", lambda: exercise_trending.get_trending(args.limit), store)
+    timed("cached", lambda: exercise_trending.get_trending(args.limit), store)
+    if args.include_scan:
+        since = (datetime.now(timezone.utc) - timedelta(days=EXERCISE_TRENDING_WINDOW_DAYS)).isoformat()
+        scan = timed("scan", lambda: exercise_trending._count_via_scan(since, args.limit), store)
+        assert [c for _, c in scan] == [c for _, c in engine]
+
+    same = [(ex["id"], count) for ex, count in legacy] == [(ex["id"], count) for ex, count in engine]
+    print(f"  rpc ranking matches legacy: {same}")
+
+    if args.include_scan:
+        exercise_trending._rpc_unavailable_until = time.monotonic() + 60
+        timed("warm-scan", exercise_trending.warm_trending_counter, store)
+        exercise_trending._rpc_unavailable_until = 0.0
+    counter = timed("warm", exercise_trending.warm_trending_counter, store)
+    exercise_trending.get_trending(args.limit)
+    calls = 10_000
+    start = time.perf_counter()
+    for _ in range(calls):
+        exercise_trending.get_trending(args.limit)
+    cached_us = (time.perf_counter() - start) / calls * 1e6
+    start = time.perf_counter()
+    for i in range(calls):
+        exercise_trending.record_trending_completion(f"ex-{i % args.exercises}")
+        counter.top(args.limit)
+    dirty_us = (time.perf_counter() - start) / calls * 1e6
+    print(f"  counter  {cached_us:10.1f} us per cached get_trending, {dirty_us:.1f} us per record + top-K")
+
+    # Window counts are hour-aligned, so only the oldest partial hour may differ from the exact count
+    exact = {ex["id"]: count for ex, count in engine}
+    window = counter.window_counts()
+    drift = max(abs(window.get(exercise_id, 0) - calls // args.exercises - count) for exercise_id, count in exact.items())
+    print(f"  counter window counts vs exact 7-day counts: max drift {drift} (oldest partial hour)")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
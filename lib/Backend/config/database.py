@@ -1,9 +1,172 @@
-"""Database client initialization."""
-from supabase import create_client, Client
-from config.settings import SUPABASE_URL, SUPABASE_KEY
+"""Database client initialization.
+
+Every module imports the single process-wide Supabase client from here, so a
+worker has one PostgREST connection pool, one auth setup and one set of TLS
+sessions. The pool is tunable from settings, uses HTTP/2 when the ``h2``
+package is installed, applies per-request timeouts and records
+connection-reuse statistics.
+"""
+import threading
+import weakref
+from collections import deque
+from typing import Dict, List, Optional, Union
+
+import httpx
+from postgrest import SyncPostgrestClient
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+from postgrest.utils import SyncClient as PostgrestSession
+from supabase import Client, ClientOptions
+
+from config.settings import (
+    SUPABASE_CONNECT_TIMEOUT_SECONDS,
+    SUPABASE_HTTP2,
+    SUPABASE_KEEPALIVE_EXPIRY,
+    SUPABASE_KEY,
+    SUPABASE_MAX_CONNECTIONS,
+    SUPABASE_MAX_KEEPALIVE,
+    SUPABASE_TIMEOUT_SECONDS,
+    SUPABASE_URL,
+)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class InstrumentedTransport(httpx.HTTPTransport):
+    """HTTP transport that counts requests and newly opened pool connections."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self._known = weakref.WeakSet()
+        self.requests = 0
+        self.connections_opened = 0
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        response = super().handle_request(request)
+        with self._lock:
+            self.requests += 1
+            for connection in self._pool.connections:
+                if connection not in self._known:
+                    self._known.add(connection)
+                    self.connections_opened += 1
+        return response
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        connections = list(self._pool.connections)
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "open_connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle()),
+            "reuse_ratio": round(1 - self.connections_opened / self.requests, 4) if self.requests else 0.0,
+        }
+
+
+_transport = InstrumentedTransport(
+    http2=SUPABASE_HTTP2 and HTTP2_AVAILABLE,
+    limits=httpx.Limits(
+        max_connections=SUPABASE_MAX_CONNECTIONS,
+        max_keepalive_connections=SUPABASE_MAX_KEEPALIVE,
+        keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY,
+    ),
+)
+
+REQUEST_TIMEOUT = httpx.Timeout(SUPABASE_TIMEOUT_SECONDS, connect=SUPABASE_CONNECT_TIMEOUT_SECONDS)
+
+
+class PooledPostgrestClient(SyncPostgrestClient):
+    """PostgREST client whose session rides on the shared instrumented transport."""
+
+    def create_session(self, base_url, headers, timeout, verify=True) -> PostgrestSession:
+        return PostgrestSession(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            follow_redirects=True,
+            transport=_transport,
+        )
+
+
+class PooledSupabaseClient(Client):
+    """Supabase client that (re)builds its PostgREST client on the shared pool."""
+
+    @staticmethod
+    def _init_postgrest_client(rest_url, headers, schema, timeout=REQUEST_TIMEOUT, verify=True):
+        return PooledPostgrestClient(rest_url, headers=headers, schema=schema, timeout=timeout, verify=verify)
+
 
 # Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase: Client = PooledSupabaseClient.create(
+    SUPABASE_URL,
+    SUPABASE_KEY,
+    ClientOptions(postgrest_client_timeout=REQUEST_TIMEOUT),
+)
 
 # Alias for backward compatibility
 db = supabase
+
+
+def get_supabase() -> Client:
+    """Return the process-wide Supabase client."""
+    return supabase
+
+
+def pool_stats() -> Dict[str, Union[int, float, bool]]:
+    """Connection pool usage for the shared Supabase transport."""
+    return {
+        **_transport.stats(),
+        "http2": SUPABASE_HTTP2 and HTTP2_AVAILABLE,
+        "max_connections": SUPABASE_MAX_CONNECTIONS,
+        "max_keepalive_connections": SUPABASE_MAX_KEEPALIVE,
+    }
+
+
+def fetch_all_rows(table: str, columns: str = "*", page_size: int = 1000) -> List[dict]:
+    """Every row of a small table, paged so PostgREST's max-rows cannot truncate it."""
+    rows: List[dict] = []
+    while True:
+        page = supabase.table(table).select(columns).range(len(rows), len(rows) + page_size - 1).execute().data or []
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+
+
+def insert_rows_in_chunks(table: str, rows: List[Dict], chunk_size: int = 500,
+                          on_conflict: Optional[str] = None) -> Dict[str, List]:
+    """Insert ``rows`` with one request per ``chunk_size`` rows.
+
+    With ``on_conflict`` the rows are upserted on those columns instead. A
+    chunk the database rejects is split in half and retried until the bad
+    rows are isolated, so one invalid row costs a few extra requests rather
+    than the whole chunk. Transport errors fail the chunk without splitting.
+    Returns the stored rows and a ``{"row", "error", "rejected"}`` entry per
+    failed row; ``rejected`` is True when the database refused that row, so
+    retrying it cannot succeed, and False when the request itself failed.
+    """
+    stored, failed = [], []
+    pending = deque(rows[i:i + chunk_size] for i in range(0, len(rows), max(chunk_size, 1)))
+    while pending:
+        chunk = pending.popleft()
+        try:
+            query = supabase.table(table)
+            if on_conflict:
+                query = query.upsert(chunk, on_conflict=on_conflict, returning=ReturnMethod.minimal)
+            else:
+                query = query.insert(chunk, returning=ReturnMethod.minimal)
+            query.execute()
+            stored.extend(chunk)
+        except APIError as e:
+            if len(chunk) == 1:
+                failed.append({"row": chunk[0], "error": e.message or str(e), "rejected": True})
+            else:
+                middle = len(chunk) // 2
+                pending.appendleft(chunk[middle:])
+                pending.appendleft(chunk[:middle])
+        except Exception as e:
+            failed.extend({"row": row, "error": str(e), "rejected": False} for row in chunk)
+    return {"stored": stored, "failed": failed}
@@ -0,0 +1,77 @@
+"""Caller identity from Supabase access tokens.
+
+Users sign in with Supabase Auth, so a request proves who it is with
+``Authorization: Bearer <access token>``. ``authenticated_user_id`` checks
+the token with Supabase Auth and returns the user's id, or None when there
+is no token or it is rejected. Ids sent in a request body are never trusted
+for per-user data. Verified tokens are remembered for
+``AUTH_TOKEN_CACHE_SECONDS`` so repeated requests skip the round trip.
+
+Operational endpoints depend on ``require_admin`` instead: the caller must
+send ``X-Admin-Token`` equal to ``ADMIN_API_TOKEN``, and the endpoints are
+disabled while that setting is unset.
+"""
+import hashlib
+import hmac
+import logging
+from typing import Optional
+
+from fastapi import Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from gotrue.errors import AuthApiError
+
+from config.database import supabase
+from config.settings import ADMIN_API_TOKEN, AUTH_TOKEN_CACHE_SECONDS
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# sha256(token) -> user id, or "" for a token Supabase rejected
+_verified_tokens = TTLCache(maxsize=10000, ttl=AUTH_TOKEN_CACHE_SECONDS)
+
+
+def bearer_token(request: Optional[Request]) -> Optional[str]:
+    """The token of an ``Authorization: Bearer`` header, if present."""
+    if request is None:
+        return None
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    token = token.strip()
+    return token if scheme.lower() == "bearer" and token else None
+
+
+def verify_access_token(token: str) -> Optional[str]:
+    """User id of a valid Supabase access token, else None (blocking on a cache miss)."""
+    key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    cached = _verified_tokens.get(key)
+    if cached is not None:
+        return cached or None
+    try:
+        response = supabase.auth.get_user(token)
+    except AuthApiError as e:
+        logger.info(f"Rejected access token: {e}")
+        _verified_tokens.set(key, "")
+        return None
+    except Exception as e:
+        # Not cached: Supabase Auth may just be unreachable for a moment
+        logger.warning(f"Could not verify access token: {e}")
+        return None
+    user_id = str(response.user.id) if response and response.user else ""
+    _verified_tokens.set(key, user_id)
+    return user_id or None
+
+
+async def authenticated_user_id(request: Optional[Request]) -> Optional[str]:
+    """Verified user id of the caller, or None for anonymous requests."""
+    token = bearer_token(request)
+    if token is None:
+        return None
+    return await run_in_threadpool(verify_access_token, token)
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """FastAPI dependency that rejects callers without the admin token."""
+    if not ADMIN_API_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_API_TOKEN is not set)")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode("utf-8"), ADMIN_API_TOKEN.encode("utf-8")):
+        logger.warning("Rejected admin request with a missing or wrong X-Admin-Token")
+        raise HTTPException(status_code=401, detail="Invalid admin token")
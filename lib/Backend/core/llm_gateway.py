@@ -0,0 +1,253 @@
+"""Shared async gateway for Groq chat completions.
+
+All LLM traffic in a worker goes through one ``AsyncGroq`` client that owns a
+pooled keep-alive ``httpx.AsyncClient``. The client lives on a dedicated event
+loop thread so both async route handlers and synchronous helpers (CLI tools,
+report generation) can share the same connection pool without blocking the
+uvicorn event loop.
+"""
+import asyncio
+import contextlib
+import logging
+import threading
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+from groq import AsyncGroq
+
+from config.settings import (
+    GROQ_API_KEY,
+    GROQ_BASE_URL,
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_CONNECTIONS,
+    LLM_TIMEOUT_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stream relayed between event loops
+_STREAM_END = object()
+
+
+class LLMGateway:
+    """Pooled, concurrency-bounded access to the Groq chat completions API."""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        timeout: float = LLM_TIMEOUT_SECONDS,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_connections: int = LLM_MAX_CONNECTIONS,
+    ):
+        self.api_key = api_key or GROQ_API_KEY
+        self.base_url = base_url or GROQ_BASE_URL
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[AsyncGroq] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        self.stats = {"requests": 0, "errors": 0, "timeouts": 0, "in_flight": 0, "waiting": 0}
+
+    @property
+    def available(self) -> bool:
+        return bool(self.api_key)
+
+    @property
+    def queue_depth(self) -> int:
+        """Calls in flight plus calls waiting for a concurrency slot."""
+        return self.stats["in_flight"] + self.stats["waiting"]
+
+    # ------------------------------------------------------------------
+    # Event loop / client lifecycle
+    # ------------------------------------------------------------------
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="llm-gateway", daemon=True)
+                thread.start()
+                self._loop = loop
+            return self._loop
+
+    def _ensure_client(self) -> AsyncGroq:
+        # Only ever called on the gateway loop, so no locking is needed here
+        if self._client is None:
+            if not self.api_key:
+                raise ValueError("GROQ_API_KEY not found in environment variables")
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                timeout=httpx.Timeout(self.timeout),
+            )
+            kwargs: Dict[str, Any] = {"api_key": self.api_key, "http_client": http_client}
+            if self.base_url:
+                kwargs["base_url"] = self.base_url
+            self._client = AsyncGroq(**kwargs)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    def _on_gateway_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    @contextlib.asynccontextmanager
+    async def _slot(self):
+        """Hold one of the ``max_concurrency`` slots, counting callers still waiting for one."""
+        self.stats["waiting"] += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.stats["waiting"] -= 1
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+    async def _create(self, timeout: Optional[float], **params):
+        client = self._ensure_client()
+        timeout = timeout or self.timeout
+        async with self._slot():
+            self.stats["requests"] += 1
+            self.stats["in_flight"] += 1
+            try:
+                return await asyncio.wait_for(
+                    client.chat.completions.create(timeout=timeout, **params),
+                    timeout=timeout,
+                )
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                raise
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+            finally:
+                self.stats["in_flight"] -= 1
+
+    async def _stream(self, timeout: Optional[float], **params) -> AsyncIterator[str]:
+        client = self._ensure_client()
+        timeout = timeout or self.timeout
+        async with self._slot():
+            self.stats["requests"] += 1
+            self.stats["in_flight"] += 1
+            try:
+                stream = await asyncio.wait_for(
+                    client.chat.completions.create(stream=True, timeout=timeout, **params),
+                    timeout=timeout,
+                )
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                raise
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+            finally:
+                self.stats["in_flight"] -= 1
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    async def acreate(self, model: str, messages: List[Dict[str, str]], timeout: Optional[float] = None, **params):
+        """Create a chat completion without blocking the caller's event loop."""
+        loop = self._ensure_loop()
+        coro = self._create(timeout, model=model, messages=messages, **params)
+        if self._on_gateway_loop():
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    async def acomplete(self, model: str, messages: List[Dict[str, str]], timeout: Optional[float] = None, **params) -> str:
+        """Like ``acreate`` but returns only the first choice's text."""
+        response = await self.acreate(model, messages, timeout=timeout, **params)
+        return response.choices[0].message.content
+
+    async def astream(self, model: str, messages: List[Dict[str, str]], timeout: Optional[float] = None, **params) -> AsyncIterator[str]:
+        """Yield content deltas of a streamed completion as they arrive upstream."""
+        loop = self._ensure_loop()
+        if self._on_gateway_loop():
+            async for delta in self._stream(timeout, model=model, messages=messages, **params):
+                yield delta
+            return
+
+        # Relay deltas from the gateway loop into a queue on the caller's loop
+        caller_loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def pump():
+            try:
+                async for delta in self._stream(timeout, model=model, messages=messages, **params):
+                    caller_loop.call_soon_threadsafe(queue.put_nowait, (delta, None))
+            except Exception as e:
+                caller_loop.call_soon_threadsafe(queue.put_nowait, (None, e))
+                return
+            caller_loop.call_soon_threadsafe(queue.put_nowait, (_STREAM_END, None))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), loop)
+        try:
+            while True:
+                delta, error = await queue.get()
+                if error is not None:
+                    raise error
+                if delta is _STREAM_END:
+                    return
+                yield delta
+        finally:
+            future.cancel()
+
+    def create(self, model: str, messages: List[Dict[str, str]], timeout: Optional[float] = None, **params):
+        """Blocking variant of ``acreate`` for synchronous callers."""
+        return self.run(self._create(timeout, model=model, messages=messages, **params))
+
+    def run(self, coro):
+        """Run a coroutine on the gateway loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    def close(self):
+        """Close the pooled HTTP client and stop the gateway loop."""
+        with self._lock:
+            loop, client = self._loop, self._client
+            self._loop, self._client, self._semaphore = None, None, None
+        if loop is None:
+            return
+        if client is not None:
+            asyncio.run_coroutine_threadsafe(client.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+
+# One gateway (loop thread + connection pool) per API key in this worker
+_gateways: Dict[Optional[str], LLMGateway] = {}
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway(api_key: Optional[str] = None) -> LLMGateway:
+    """Return the worker's gateway for ``api_key`` (default: GROQ_API_KEY), creating it on first use."""
+    key = api_key or GROQ_API_KEY
+    gateway = _gateways.get(key)
+    if gateway is None:
+        with _gateway_lock:
+            gateway = _gateways.get(key)
+            if gateway is None:
+                gateway = _gateways[key] = LLMGateway(api_key=key)
+    return gateway
+
+
+def close_llm_gateways():
+    """Close every gateway created by ``get_llm_gateway``."""
+    with _gateway_lock:
+        gateways = list(_gateways.values())
+    for gateway in gateways:
+        gateway.close()
+
@@ -1,10 +1,11 @@
 import random
-from supabase import create_client, Client
 from datetime import datetime
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
 from config.settings import SUPABASE_URL, SUPABASE_KEY
+from config.database import supabase
+from services.reference_data import reference_data
 import logging
 
 # Configure logging
@@ -33,7 +34,8 @@ class SuggestionManager:
         self.SUPABASE_URL = SUPABASE_URL
         self.SUPABASE_KEY = SUPABASE_KEY
         
-        self.supabase = create_client(self.SUPABASE_URL, self.SUPABASE_KEY)
+        # Reuse the shared pooled client instead of opening a new one per manager
+        self.supabase = supabase
     
     def fetch_user_dominant_state(self, user_id):
         """Fetch user's dominant state from mental_state_reports table"""
@@ -87,12 +89,8 @@ class SuggestionManager:
             category = category_mapping.get(dominant_state.lower(), dominant_state)
             logger.info(f"Mapped state '{dominant_state}' to category: {category}")
             
-            response = self.supabase.table("suggestions")\
-                .select("id, logo, suggestion, description, category")\
-                .eq("category", category)\
-                .execute()
-            
-            all_suggestions = response.data if response.data else []
+            # Served from the shared reference-data cache rather than a query per request
+            all_suggestions = reference_data.rows_for("suggestions", category)
             
             if not all_suggestions:
                 logger.warning(f"No suggestions found for category: {category}")
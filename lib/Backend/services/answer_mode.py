@@ -0,0 +1,138 @@
+"""Per-turn choice between the LLM and the dataset-only responder.
+
+``/api/chat`` can answer a message either through Groq or locally from the
+intent dataset (``chatbot_service.dataset_answer``, well under a
+millisecond). The mode decides which one is tried first:
+
+- ``llm``: always call the LLM; the dataset answers only when it fails.
+- ``dataset``: never call the LLM.
+- ``auto``: call the LLM unless the turn should be shed, i.e.
+  ``CHAT_SHED_QUEUE_DEPTH`` LLM turns are already in flight or queued, the
+  ``CHAT_LLM_BUDGET_PER_MINUTE`` token bucket is empty, or the last
+  ``CHAT_LLM_FAILURE_THRESHOLD`` calls failed (then the LLM is skipped for
+  ``CHAT_LLM_COOLDOWN_SECONDS`` before it is tried again).
+
+The mode is set by ``CHAT_ANSWER_MODE``; ``GET /api/chat/mode`` reports it
+along with the shedding decisions so far.
+"""
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from config.settings import (
+    CHAT_ANSWER_MODE,
+    CHAT_LLM_BUDGET_PER_MINUTE,
+    CHAT_LLM_COOLDOWN_SECONDS,
+    CHAT_LLM_FAILURE_THRESHOLD,
+    CHAT_SHED_QUEUE_DEPTH,
+)
+
+ANSWER_MODES = ("llm", "dataset", "auto")
+
+
+class AnswerModeController:
+    """Decides whether a chat turn goes to the LLM, and counts why."""
+
+    def __init__(
+        self,
+        mode: str = CHAT_ANSWER_MODE,
+        budget_per_minute: int = CHAT_LLM_BUDGET_PER_MINUTE,
+        shed_queue_depth: int = CHAT_SHED_QUEUE_DEPTH,
+        failure_threshold: int = CHAT_LLM_FAILURE_THRESHOLD,
+        cooldown_seconds: float = CHAT_LLM_COOLDOWN_SECONDS,
+        clock=time.monotonic,
+    ):
+        self._lock = threading.Lock()
+        self._clock = clock
+        self.mode = "llm"
+        self.set_mode(mode)
+        self.budget_per_minute = budget_per_minute
+        self.shed_queue_depth = shed_queue_depth
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+
+        self._tokens = float(budget_per_minute)
+        self._refilled_at = clock()
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+        self._admitted = 0  # LLM turns between choose() and finish()
+        self.decisions: Counter = Counter()
+
+    def set_mode(self, mode: str) -> str:
+        mode = mode.lower().strip()
+        if mode not in ANSWER_MODES:
+            raise ValueError(f"Unknown answer mode {mode!r}; expected one of {', '.join(ANSWER_MODES)}")
+        self.mode = mode
+        return mode
+
+    def _take_token(self, now: float) -> bool:
+        if self.budget_per_minute <= 0:
+            return True
+        self._tokens = min(float(self.budget_per_minute),
+                           self._tokens + (now - self._refilled_at) * self.budget_per_minute / 60.0)
+        self._refilled_at = now
+        if self._tokens < 1.0:
+            return False
+        self._tokens -= 1.0
+        return True
+
+    def choose(self, queue_depth: int = 0) -> Tuple[str, str]:
+        """
+        Return ``(source, reason)``, where source is ``"llm"`` or ``"dataset"``.
+
+        ``queue_depth`` is the gateway's own count; turns admitted here but not
+        yet at the gateway are counted too. Every ``"llm"`` decision must be
+        followed by ``finish``.
+        """
+        with self._lock:
+            now = self._clock()
+            queue_depth = max(queue_depth, self._admitted)
+            if self.mode == "llm":
+                decision = ("llm", "mode")
+            elif self.mode == "dataset":
+                decision = ("dataset", "mode")
+            elif now < self._open_until:
+                decision = ("dataset", "llm_failing")
+            elif self.shed_queue_depth > 0 and queue_depth >= self.shed_queue_depth:
+                decision = ("dataset", "queue_full")
+            elif not self._take_token(now):
+                decision = ("dataset", "budget")
+            else:
+                decision = ("llm", "auto")
+            if decision[0] == "llm":
+                self._admitted += 1
+            self.decisions[decision] += 1
+            return decision
+
+    def finish(self, ok: Optional[bool]):
+        """Record the outcome of an LLM turn; ``None`` (cancelled) counts neither way."""
+        with self._lock:
+            self._admitted -= 1
+            if ok:
+                self._consecutive_failures = 0
+            elif ok is False:
+                self._consecutive_failures += 1
+                if self.failure_threshold > 0 and self._consecutive_failures >= self.failure_threshold:
+                    self._open_until = self._clock() + self.cooldown_seconds
+                    self._consecutive_failures = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            now = self._clock()
+            tokens: Optional[float] = None
+            if self.budget_per_minute > 0:
+                tokens = min(float(self.budget_per_minute),
+                             self._tokens + (now - self._refilled_at) * self.budget_per_minute / 60.0)
+            return {
+                "mode": self.mode,
+                "budget_per_minute": self.budget_per_minute,
+                "budget_tokens": round(tokens, 2) if tokens is not None else None,
+                "shed_queue_depth": self.shed_queue_depth,
+                "llm_turns_in_flight": self._admitted,
+                "llm_paused_for_seconds": round(max(0.0, self._open_until - now), 2),
+                "decisions": {f"{source}:{reason}": count for (source, reason), count in self.decisions.items()},
+            }
+
+
+answer_mode = AnswerModeController()
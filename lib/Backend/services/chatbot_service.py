@@ -1,15 +1,30 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import AsyncIterator, Dict, List, Optional
 import requests
+import asyncio
 import os
 import json
 import random
 import re
-from groq import Groq
+import threading
 from fastapi.middleware.cors import CORSMiddleware
 import logging
-from config.settings import GROQ_API_KEY
+from config.settings import (
+    CHAT_CACHE_LSH_BANDS, CHAT_CACHE_LSH_ROWS, CHAT_CACHE_SIMILARITY, CHAT_CACHE_SIZE, CHAT_CACHE_TTL_SECONDS,
+    CHAT_DATASET_MIN_SCORE, CHAT_INTENT_MIN_SCORE, CHAT_INTENT_RELATIVE_SCORE, CHAT_INTENT_TOP_K,
+    CHAT_MEMORY_ENABLED, DATASET_SNAPSHOT_PATH, GROQ_API_KEY
+)
+from core.auth import authenticated_user_id
+from core.llm_gateway import get_llm_gateway
+from services.answer_mode import answer_mode
+from services.conversation_memory import conversation_memory
+from utils.dataset_snapshot import load_intent_index
+from utils.intent_index import IntentIndex
+from utils.keyword_matcher import KeywordMatcher
+from utils.response_cache import ResponseCache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -32,18 +47,8 @@ if not GROQ_API_KEY:
 
 logger.info(f"Found GROQ_API_KEY: {'*' * 4}...{'*' * 4}")
 
-try:
-    groq_client = Groq(api_key=GROQ_API_KEY)
-    test_response = groq_client.chat.completions.create(
-        model=MODELS["default"],
-        messages=[{"role": "user", "content": "test"}],
-        max_tokens=10
-    )
-    logger.info("Successfully connected to Groq API")
-except Exception as e:
-    logger.error(f"Error connecting to Groq API: {str(e)}")
-    logger.warning("Continuing without Groq API connection. Chat functionality may not work.")
-    groq_client = None
+# The gateway connects lazily on first use; see check_groq_connection()
+groq_client = get_llm_gateway()
 
 # Crisis keywords and response
 CRISIS_KEYWORDS = [
@@ -60,20 +65,79 @@ CRISIS_RESPONSE = (
     "You are stronger than you think, and better days can still come."
 )
 
-# Load mental health dataset
-try:
-    dataset_path = os.path.join(os.path.dirname(__file__), "..", "models", "chatbot_dataset.json")
-    with open(dataset_path, "r", encoding="utf-8") as file:
-        raw_dataset = json.load(file)
-        dataset = {
-            intent["tag"]: intent["responses"][0]
-            for intent in raw_dataset.get("intents", [])
-            if "tag" in intent and "responses" in intent
-        }
-    logger.info("Dataset loaded successfully")
-except Exception as e:
-    logger.error(f"Error loading dataset: {e}")
-    dataset = {}
+# Mental health dataset, compiled into a shared memory-mapped snapshot on first use
+DATASET_PATH = os.path.join(os.path.dirname(__file__), "..", "models", "chatbot_dataset.json")
+_dataset: Optional[Dict[str, str]] = None
+_intent_index: Optional[IntentIndex] = None
+_dataset_lock = threading.Lock()
+
+# Warm-up state reported by the readiness probe
+service_status = {
+    "dataset_loaded": False, "dataset_intents": 0, "intent_patterns": 0, "dataset_source": None,
+    "dataset_load_ms": None, "groq_reachable": None, "warmed_up": False
+}
+
+def get_intent_index() -> IntentIndex:
+    """Return the BM25 index over the dataset, mapping (or rebuilding) its snapshot on first use."""
+    global _intent_index
+    if _intent_index is None:
+        with _dataset_lock:
+            if _intent_index is None:
+                try:
+                    index, info = load_intent_index(DATASET_PATH, DATASET_SNAPSHOT_PATH)
+                except Exception as e:
+                    logger.error(f"Error loading dataset: {e}")
+                    index, info = IntentIndex.build([]), {"source": None, "load_ms": None}
+                service_status["intent_patterns"] = len(index.patterns)
+                service_status["dataset_source"] = info["source"]
+                service_status["dataset_load_ms"] = info["load_ms"]
+                logger.info(f"Intent index loaded from {info['source']}: {len(index)} intents, "
+                            f"{len(index.patterns)} patterns, {info['load_ms']} ms")
+                _intent_index = index
+    return _intent_index
+
+def get_dataset() -> Dict[str, str]:
+    """Return the tag -> first response mapping of the intent dataset."""
+    global _dataset
+    if _dataset is None:
+        loaded = get_intent_index().first_responses()
+        with _dataset_lock:
+            if _dataset is None:
+                _dataset = loaded
+                service_status["dataset_loaded"] = True
+                service_status["dataset_intents"] = len(_dataset)
+    return _dataset
+
+def relevant_intents(message: str) -> List[Dict]:
+    """Dataset intents worth grounding the prompt in, best first."""
+    matches = get_intent_index().search(message, CHAT_INTENT_TOP_K, CHAT_INTENT_MIN_SCORE)
+    if not matches:
+        return []
+    floor = matches[0]["score"] * CHAT_INTENT_RELATIVE_SCORE
+    return [match for match in matches if match["score"] >= floor and match["response"]]
+
+async def check_groq_connection(timeout: float = 5.0) -> bool:
+    """Send a tiny completion to confirm the Groq API is reachable."""
+    try:
+        await groq_client.acreate(
+            model=MODELS["default"],
+            messages=[{"role": "user", "content": "test"}],
+            max_tokens=10,
+            timeout=timeout
+        )
+        logger.info("Successfully connected to Groq API")
+        return True
+    except Exception as e:
+        logger.error(f"Error connecting to Groq API: {str(e)}")
+        logger.warning("Continuing without a confirmed Groq API connection. Chat will fall back if calls fail.")
+        return False
+
+async def warm_up():
+    """Load the dataset off the event loop and probe Groq; run once at startup."""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, get_dataset)
+    service_status["groq_reachable"] = await check_groq_connection()
+    service_status["warmed_up"] = True
 
 # Simple responses for common interactions
 SIMPLE_RESPONSES = {
@@ -110,52 +174,246 @@ SIMPLE_RESPONSES = {
 }
 
 # Helper functions
+_CRISIS_MATCHER = KeywordMatcher((kw, kw) for kw in CRISIS_KEYWORDS)
+
 def contains_crisis(message: str) -> bool:
     """Check if message contains any crisis keywords."""
-    return any(kw in message.lower() for kw in CRISIS_KEYWORDS)
+    return _CRISIS_MATCHER.any(message)
+
+# LLM replies reused for repeated (optionally near-duplicate) messages; None when CHAT_CACHE_SIZE is 0
+response_cache = ResponseCache(
+    CHAT_CACHE_SIZE, CHAT_CACHE_TTL_SECONDS, CHAT_CACHE_SIMILARITY, CHAT_CACHE_LSH_BANDS, CHAT_CACHE_LSH_ROWS
+) if CHAT_CACHE_SIZE > 0 else None
+
+def cached_reply(model: str, message: str) -> Optional[str]:
+    """An earlier LLM reply to the same (or a near-identical) message; crisis messages are never looked up."""
+    if response_cache is None:
+        return None
+    if contains_crisis(message):
+        response_cache.skip()
+        return None
+    return response_cache.get(model, message)
+
+def remember_reply(model: str, message: str, reply: str):
+    """Cache an LLM reply; crisis messages are never stored."""
+    if response_cache is None or not reply:
+        return
+    if contains_crisis(message):
+        response_cache.skip()
+        return
+    response_cache.set(model, message, reply)
+
+async def conversation_user(http_request: Optional[Request]) -> Optional[str]:
+    """Whose conversation memory a turn uses: the verified caller, and only with CHAT_MEMORY_ENABLED."""
+    if not CHAT_MEMORY_ENABLED:
+        return None
+    return await authenticated_user_id(http_request)
+
+async def open_conversation(user_id: Optional[str]):
+    """Make the user's session current before the turn; reloading it from Supabase runs in a thread."""
+    if not user_id:
+        return
+    if conversation_memory.table:
+        await run_in_threadpool(conversation_memory.open, user_id)
+    else:
+        conversation_memory.open(user_id)
+
+async def remember_turn(user_id: Optional[str], message: str, reply: str):
+    """Append the exchange to the user's conversation memory."""
+    if not user_id or not reply:
+        return
+    if conversation_memory.table:
+        await run_in_threadpool(conversation_memory.record, user_id, message, reply)
+    else:
+        conversation_memory.record(user_id, message, reply)
+
+# Hotline numbers are only shown in crisis mode
+HOTLINE_PATTERN = re.compile(r"(Sumithrayo.*?\d+|Psychiatrists.*?\d+|Helpline.*?\d+)", re.IGNORECASE)
+HOTLINE_TRIGGERS = ("sumithrayo", "psychiatrists", "helpline")
+HOTLINE_TRIGGER_PATTERN = re.compile("|".join(HOTLINE_TRIGGERS), re.IGNORECASE)
+
+POSITIVE_PHRASES = ["remember", "you can", "try", "hope", "suggestion"]
+POSITIVE_ENDING = " Remember, small steps can make a big difference."
+
+CHAT_SYSTEM_PROMPT = "You are a compassionate mental health assistant."
+
+def _strip_reply_marker(text: str) -> str:
+    """Drop anything up to the last "AI:" marker, then surrounding whitespace and quotes."""
+    text = text.split("AI:")[-1].strip()
+    return text.strip('"\'')
+
+def _uppercase_first_sentence(text: str) -> str:
+    """Uppercase the first line, or the first sentence of a reply without newlines."""
+    if "\n" in text:
+        first_line, rest = text.split("\n", 1)
+        return f"{first_line.upper()}\n{rest}"
+    sentences = text.split(". ")
+    if len(sentences) > 1:
+        return f"{sentences[0].strip().upper()}. {'. '.join(sentences[1:]).strip()}"
+    return text
 
 def clean_response(text: str, crisis_mode: bool = False) -> str:
     """Clean and format the AI response."""
     # Remove any AI: prefix
-    text = text.split("AI:")[-1].strip()
-    text = text.strip('"\'')
+    text = _strip_reply_marker(text)
     
     # Uppercase first sentence
-    if "\n" in text:
-        first_line, rest = text.split("\n", 1)
-        text = f"{first_line.upper()}\n{rest}"
-    else:
-        sentences = text.split(". ")
-        if len(sentences) > 1:
-            text = f"{sentences[0].strip().upper()}. {'. '.join(sentences[1:]).strip()}"
+    text = _uppercase_first_sentence(text)
     
     # Remove hotline numbers if not crisis mode
     if not crisis_mode:
-        text = re.sub(r"(Sumithrayo.*?\d+|Psychiatrists.*?\d+|Helpline.*?\d+)", "", text, flags=re.IGNORECASE)
+        text = HOTLINE_PATTERN.sub("", text)
     
     # Ensure positive ending
-    positive_phrases = ["remember", "you can", "try", "hope", "suggestion"]
-    if not any(phrase in text.lower() for phrase in positive_phrases):
-        text += " Remember, small steps can make a big difference."
+    if not any(phrase in text.lower() for phrase in POSITIVE_PHRASES):
+        text += POSITIVE_ENDING
     
     return text.strip()
 
-def query_groq(model: str, prompt: str, max_tokens: int = 512) -> str:
-    """Query the Groq API for a response."""
+def _is_blank(text: str) -> bool:
+    return not text or text.isspace()
+
+class StreamingResponseCleaner:
+    """
+    Incremental version of ``clean_response`` for streamed completions.
+
+    The same steps run in the same order, and text is released as soon as no
+    later delta can change it. The first line is held until a newline with
+    text after it arrives; its first sentence (up to ". ") is released
+    earlier, as it is uppercased either way. A reply that never reaches such
+    a newline gets the ". " rule of ``clean_response`` at the end. Trailing
+    whitespace and quotes are held back for the final strip, hotline numbers
+    are held back and removed outside crisis mode, and ``finish`` appends the
+    positive ending. The result equals ``clean_response`` of the joined
+    deltas unless an "AI:" marker arrives after text has been released.
+    """
+
+    def __init__(self, crisis_mode: bool = False):
+        self.crisis_mode = crisis_mode
+        self._raw = ""  # everything received while the first line is open
+        self._sentence: Optional[str] = None  # released start of the first sentence
+        self._in_body = False
+        self._quoted = ""  # trailing whitespace and quotes the opening strip may remove
+        self._pending = ""  # text that may still be part of a hotline number
+        self._space = ""  # trailing whitespace the final strip may remove
+        self._emitted = []
+
+    @property
+    def emitted(self) -> str:
+        return "".join(self._emitted)
+
+    def feed(self, delta: str) -> str:
+        """Consume one upstream delta and return the text that is safe to send."""
+        text = self._hold_quoted(delta) if self._in_body else self._first_line(delta)
+        return self._release(text, final=False)
+
+    def finish(self) -> str:
+        """Flush held-back text and append the positive ending if needed."""
+        if self._in_body:
+            text = self._quoted.rstrip().rstrip('"\'')
+        else:
+            text = _uppercase_first_sentence(_strip_reply_marker(self._raw))
+            if self._sentence is not None:
+                text = self._quoted + text.lstrip()[len(self._sentence):]
+        self._quoted = ""
+        text = self._release(text, final=True)
+        if not any(phrase in self.emitted.lower() for phrase in POSITIVE_PHRASES):
+            ending = self._space + POSITIVE_ENDING if self._emitted else POSITIVE_ENDING.lstrip()
+            self._emitted.append(ending)
+            text += ending
+        self._space = ""
+        return text
+
+    def _first_line(self, delta: str) -> str:
+        self._raw += delta
+        head = self._raw.split("AI:")[-1].lstrip().lstrip('"\'')
+        # A boundary counts once non-whitespace follows it; the final strip could remove it before that
+        newline = head.find("\n")
+        if newline != -1 and not _is_blank(head[newline + 1:]):
+            first = head[:newline].upper()
+            if self._sentence is not None:
+                first = first.lstrip()[len(self._sentence):]
+            self._in_body = True
+            self._raw = ""
+            return self._hold_quoted(first + head[newline:])
+        if self._sentence is None:
+            stop = head.find(". ")
+            if stop != -1 and not _is_blank(head[stop + 2:]):
+                self._sentence = head[:stop].strip().upper()
+                return self._hold_quoted(self._sentence)
+        return ""
+
+    def _hold_quoted(self, text: str) -> str:
+        text = self._quoted + text
+        keep = len(text)
+        while keep and (text[keep - 1].isspace() or text[keep - 1] in '"\''):
+            keep -= 1
+        self._quoted = text[keep:]
+        return text[:keep]
+
+    def _release(self, text: str, final: bool) -> str:
+        self._pending += text
+        if self.crisis_mode:
+            text, self._pending = self._pending, ""
+        else:
+            text = self._strip_hotlines(final)
+        text = self._space + text
+        released = text.rstrip()
+        self._space = text[len(released):]
+        if not self._emitted:
+            released = released.lstrip()
+        if released:
+            self._emitted.append(released)
+        return released
+
+    def _strip_hotlines(self, final: bool) -> str:
+        out = []
+        buf = self._pending
+        while True:
+            match = HOTLINE_TRIGGER_PATTERN.search(buf)
+            if not match:
+                keep = 0 if final else _partial_suffix_length(buf, HOTLINE_TRIGGERS)
+                out.append(buf[:len(buf) - keep])
+                buf = buf[len(buf) - keep:]
+                break
+            out.append(buf[:match.start()])
+            buf = buf[match.start():]
+            number = HOTLINE_PATTERN.match(buf)
+            if number and (final or number.end() < len(buf)):
+                # The digits are terminated, so the match cannot grow any further
+                buf = buf[number.end():]
+                continue
+            if number is None and (final or "\n" in buf):
+                # No number on this line: the trigger word is ordinary text
+                trigger_length = match.end() - match.start()
+                out.append(buf[:trigger_length])
+                buf = buf[trigger_length:]
+                continue
+            break
+        self._pending = buf
+        return "".join(out)
+
+def _partial_suffix_length(text: str, words) -> int:
+    """Length of the longest suffix of ``text`` that starts one of ``words``."""
+    lowered = text[-max(len(w) for w in words):].lower()
+    for size in range(len(lowered), 0, -1):
+        suffix = lowered[-size:]
+        if any(w.startswith(suffix) and w != suffix for w in words):
+            return size
+    return 0
+
+async def query_groq(model: str, prompt: str, max_tokens: int = 512, user_id: Optional[str] = None) -> str:
+    """Query the Groq API for a response, with the user's recent conversation when ``user_id`` is given."""
     if groq_client is None:
         logger.warning("Groq API is not available, using fallback responses")
         raise Exception("Groq client not initialized")
     try:
-        response = groq_client.chat.completions.create(
+        return await groq_client.acomplete(
             model=model,
-            messages=[
-                {"role": "system", "content": "You are a compassionate mental health assistant."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=conversation_memory.build_messages(user_id, CHAT_SYSTEM_PROMPT, prompt),
             max_tokens=max_tokens,
             temperature=0.7
         )
-        return response.choices[0].message.content
     except Exception as e:
         logger.error(f"Error querying Groq API: {e}")
         raise Exception(f"Groq API error: {str(e)}")
@@ -200,14 +458,14 @@ FALLBACK_RESPONSES = {
     ]
 }
 
+_FALLBACK_MATCHER = KeywordMatcher((kw, kw) for kw in FALLBACK_RESPONSES)
+
 def get_fallback_response(user_message: str) -> Optional[str]:
     """Get a fallback response based on keywords in the message."""
-    user_message_lower = user_message.lower()
-    
-    # Check for keyword matches
-    for keyword, responses in FALLBACK_RESPONSES.items():
-        if keyword in user_message_lower:
-            return random.choice(responses)
+    # Check for keyword matches (first keyword in table order wins)
+    keyword = _FALLBACK_MATCHER.first(user_message)
+    if keyword:
+        return random.choice(FALLBACK_RESPONSES[keyword])
     
     # Generic fallback responses
     generic_responses = [
@@ -217,27 +475,68 @@ def get_fallback_response(user_message: str) -> Optional[str]:
     ]
     return random.choice(generic_responses)
 
+def dataset_answer(user_message: str) -> str:
+    """Answer without the LLM: the closest dataset intent's best response, else the keyword fallbacks."""
+    matches = get_intent_index().search(user_message, 1, CHAT_DATASET_MIN_SCORE)
+    if matches and matches[0]["response"]:
+        return matches[0]["response"]
+    return get_fallback_response(user_message)
+
+def choose_answer_source() -> tuple:
+    """``("llm" | "dataset", reason)`` for the next chat turn."""
+    if groq_client is None or not groq_client.available:
+        return "dataset", "unavailable"
+    return answer_mode.choose(groq_client.queue_depth)
+
 # API Models
 class ChatRequest(BaseModel):
     message: str
     model: str = "default"
-    user_id: Optional[str] = None
+    user_id: Optional[str] = None  # accepted from older clients; memory uses the verified access token instead
 
 class ChatResponse(BaseModel):
     response: str
 
+def resolve_model(requested: str) -> str:
+    """Map a requested model alias to a Groq model id."""
+    model_name = requested.lower()
+    if model_name not in MODELS:
+        logger.warning(f"Invalid model requested: {model_name}")
+        model_name = "default"
+    return MODELS[model_name]
+
+def build_chat_prompt(message: str) -> str:
+    """Build the LLM prompt for a user message, grounded in the intent dataset."""
+    prompt_parts = [
+        "As a mental health support assistant, respond with empathy and care:",
+        f'User\'s message: "{message}"'
+    ]
+    
+    # Add context from the closest dataset intents, if any match well enough
+    for match in relevant_intents(message):
+        prompt_parts.append(f"Relevant information: {match['response']}")
+    
+    prompt_parts.extend([
+        "Requirements:",
+        "- Start with an encouraging sentence",
+        "- Use a warm, friendly tone",
+        "- Avoid medical jargon",
+        "- Give practical, everyday suggestions",
+        "- Keep responses under 200 words",
+        "- End with a hopeful note",
+        "Note: Do not mention being AI or use AI terminology"
+    ])
+    return "\n".join(prompt_parts)
+
 # Chat endpoint
 @router.post("/chat", response_model=ChatResponse)
-async def chat_with_bot(request: ChatRequest):
+async def chat_with_bot(request: ChatRequest, http_request: Request = None):
     """Handle chat requests and generate responses."""
     try:
+        user_id = await conversation_user(http_request)
+
         # Validate model
-        model_name = request.model.lower()
-        if model_name not in MODELS:
-            logger.warning(f"Invalid model requested: {model_name}")
-            model_name = "default"
-        
-        selected_model = MODELS[model_name]
+        selected_model = resolve_model(request.model)
         logger.info(f"Using model: {selected_model}")
         
         user_message = request.message.lower().strip()
@@ -255,55 +554,118 @@ async def chat_with_bot(request: ChatRequest):
         # Check for conversation end
         is_end = any(word in user_message for word in {"bye", "goodbye", "see you", "take care"})
 
-        # Try to use AI first, fallback to dataset/generic responses
+        # From here on the exchange is kept in the user's conversation memory
+        async def reply(text: str) -> ChatResponse:
+            await remember_turn(user_id, request.message, text)
+            return ChatResponse(response=text)
+
+        # Repeated messages reuse an earlier LLM reply, unless earlier turns give them context
+        await open_conversation(user_id)
+        with_history = conversation_memory.has_context(user_id)
+        cached = None if with_history else cached_reply(selected_model, request.message)
+        if cached is not None:
+            return await reply(cached)
+
+        # Use the LLM unless the answer mode sheds this turn; the dataset answers otherwise
+        source, reason = choose_answer_source()
+        if source == "dataset":
+            logger.info(f"Answering from the dataset ({reason})")
+            return await reply(dataset_answer(request.message))
+        ok = None
         try:
-            if groq_client is not None:
-                # Build prompt for AI
-                prompt_parts = [
-                    "As a mental health support assistant, respond with empathy and care:",
-                    f'User\'s message: "{request.message}"'
-                ]
-                
-                # Add context from dataset if available
-                for keyword, advice in dataset.items():
-                    if keyword.lower() in user_message:
-                        prompt_parts.append(f"Relevant information: {advice}")
-                        break
-                
-                prompt_parts.extend([
-                    "Requirements:",
-                    "- Start with an encouraging sentence",
-                    "- Use a warm, friendly tone",
-                    "- Avoid medical jargon",
-                    "- Give practical, everyday suggestions",
-                    "- Keep responses under 200 words",
-                    "- End with a hopeful note",
-                    "Note: Do not mention being AI or use AI terminology"
-                ])
-                
-                prompt = "\n".join(prompt_parts)
-                ai_response = query_groq(selected_model, prompt)
-                response = clean_response(ai_response, crisis_mode)
-                logger.info("Generated response using Groq API")
-                return ChatResponse(response=response)
-            else:
-                logger.info("Groq API not available, using fallback responses")
-                # Use fallback responses
-                fallback = get_fallback_response(request.message)
-                if fallback:
-                    return ChatResponse(response=fallback)
-                else:
-                    return ChatResponse(response="I'm here to listen and support you. Can you tell me more about what's on your mind?")
-                
+            prompt = build_chat_prompt(request.message)
+            ai_response = await query_groq(selected_model, prompt, user_id=user_id)
+            ok = True
+            response = clean_response(ai_response, crisis_mode)
+            if not with_history:
+                remember_reply(selected_model, request.message, response)
+            logger.info("Generated response using Groq API")
         except Exception as e:
+            ok = False
             logger.warning(f"Error with Groq API, falling back to dataset responses: {e}")
-            # Use fallback responses when Groq fails
-            fallback = get_fallback_response(request.message)
-            if fallback:
-                return ChatResponse(response=fallback)
-            else:
-                return ChatResponse(response="I'm here to listen and support you. Can you tell me more about what's on your mind?")
+            response = dataset_answer(request.message)
+        finally:
+            answer_mode.finish(ok)
+        return await reply(response)
 
     except Exception as e:
         logger.error(f"Error in chat endpoint: {e}")
-        return ChatResponse(response="I care about what you're sharing. Could you tell me a bit more?")
\ No newline at end of file
+        return ChatResponse(response="I care about what you're sharing. Could you tell me a bit more?")
+
+def _sse_event(payload) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+async def _chat_event_stream(request: ChatRequest, user_id: Optional[str] = None) -> AsyncIterator[str]:
+    """Produce server-sent events for a streamed chat response."""
+    try:
+        selected_model = resolve_model(request.model)
+        user_message = request.message.lower().strip()
+
+        if user_message in SIMPLE_RESPONSES:
+            yield _sse_event({"delta": random.choice(SIMPLE_RESPONSES[user_message])})
+        elif contains_crisis(user_message):
+            yield _sse_event({"delta": CRISIS_RESPONSE})
+        else:
+            parts: List[str] = []
+
+            def delta_event(text: str) -> str:
+                parts.append(text)
+                return _sse_event({"delta": text})
+
+            await open_conversation(user_id)
+            with_history = conversation_memory.has_context(user_id)
+            cached = None if with_history else cached_reply(selected_model, request.message)
+            if cached is not None:
+                yield delta_event(cached)
+            elif (answer := choose_answer_source())[0] == "dataset":
+                logger.info(f"Answering from the dataset ({answer[1]})")
+                yield delta_event(dataset_answer(request.message))
+            else:
+                cleaner = StreamingResponseCleaner()
+                ok = None
+                try:
+                    async for delta in groq_client.astream(
+                        model=selected_model,
+                        messages=conversation_memory.build_messages(
+                            user_id, CHAT_SYSTEM_PROMPT, build_chat_prompt(request.message)
+                        ),
+                        max_tokens=512,
+                        temperature=0.7
+                    ):
+                        text = cleaner.feed(delta)
+                        if text:
+                            yield delta_event(text)
+                    ok = True
+                except Exception as e:
+                    ok = False
+                    logger.warning(f"Error streaming from Groq API, falling back to dataset responses: {e}")
+                    if not cleaner.emitted:
+                        yield delta_event(dataset_answer(request.message))
+                        cleaner = None
+                finally:
+                    answer_mode.finish(ok)
+                if cleaner is not None:
+                    tail = cleaner.finish()
+                    if tail:
+                        yield delta_event(tail)
+                    if ok and not with_history:
+                        remember_reply(selected_model, request.message, cleaner.emitted)
+            await remember_turn(user_id, request.message, "".join(parts))
+    except Exception as e:
+        logger.error(f"Error in chat stream: {e}")
+        yield _sse_event({"delta": "I care about what you're sharing. Could you tell me a bit more?"})
+    yield "data: [DONE]\n\n"
+
+@router.post("/chat/stream")
+async def chat_with_bot_stream(request: ChatRequest, http_request: Request = None):
+    """Stream chat responses as server-sent events (``data: {"delta": ...}``)."""
+    return StreamingResponse(
+        _chat_event_stream(request, await conversation_user(http_request)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/chat/mode")
+async def get_chat_mode():
+    """Current answer mode, LLM budget and shedding decisions so far."""
+    return {**answer_mode.stats(), "llm_queue_depth": groq_client.queue_depth if groq_client else None}
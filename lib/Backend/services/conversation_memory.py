@@ -0,0 +1,360 @@
+"""Server-side chat history per user, bounded in memory and in prompt size.
+
+Memory is off unless ``CHAT_MEMORY_ENABLED`` is set, and the chat endpoints
+then key it by the user id of the caller's verified Supabase access token
+(``core/auth.py``), never by an id sent in the request body.
+
+Each such user gets a ``ConversationSession``: a ring buffer
+of the last ``CHAT_MEMORY_TURNS`` messages plus a rolling summary. A turn
+that falls out of the ring buffer is folded into the summary (the user's
+side only, shortened to ``SUMMARY_NOTE_WORDS`` words), and the oldest notes
+are dropped once the summary exceeds ``CHAT_MEMORY_SUMMARY_TOKENS``.
+
+``build_messages`` assembles the chat messages for the LLM within
+``CHAT_PROMPT_TOKEN_BUDGET`` tokens: system prompt and current prompt
+first, then the newest turns that still fit, then the summary if it fits.
+The prompt is shortened if it alone is over budget. Token counts are
+estimated from the text (no tokenizer is installed), so the budget is
+approximate but never grows with the conversation.
+
+Sessions idle for ``CHAT_MEMORY_IDLE_SECONDS`` are dropped, and the least
+recently used ones are evicted beyond ``CHAT_MEMORY_SESSIONS``. When
+``CHAT_MEMORY_TABLE`` is set, turns are also queued and written to Supabase
+in batches by ``conversation_flush_loop`` (and once more at shutdown). Only
+rows that failed in transport are retried; rows the database rejects are
+dropped and counted, and turns of a ``user_id`` that is not a UUID are never
+queued. A user whose session is not in memory is then reloaded from the
+table's last ``CHAT_MEMORY_TURNS`` rows.
+Print the table's schema with ``python -m services.conversation_memory``.
+"""
+import asyncio
+import logging
+import math
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional
+
+from config.database import insert_rows_in_chunks, supabase
+from config.settings import (
+    CHAT_MEMORY_BATCH_SIZE,
+    CHAT_MEMORY_FLUSH_SECONDS,
+    CHAT_MEMORY_IDLE_SECONDS,
+    CHAT_MEMORY_MAX_PENDING,
+    CHAT_MEMORY_SESSIONS,
+    CHAT_MEMORY_SUMMARY_TOKENS,
+    CHAT_MEMORY_TABLE,
+    CHAT_MEMORY_TURNS,
+    CHAT_PROMPT_TOKEN_BUDGET,
+)
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_NOTE_WORDS = 30
+_TOKEN_PIECES = re.compile(r"\w+|[^\w\s]")
+
+CHAT_MESSAGES_SQL = """
+create table if not exists chat_messages (
+    id bigserial primary key,
+    user_id uuid not null,
+    role text not null check (role in ('user', 'assistant')),
+    content text not null,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists chat_messages_user_created_idx
+    on chat_messages (user_id, created_at desc);
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough BPE token count: about 4/3 tokens per word or punctuation mark, and at least 1 per 4 characters."""
+    if not text:
+        return 0
+    return max(math.ceil(len(_TOKEN_PIECES.findall(text)) * 4 / 3), math.ceil(len(text) / 4))
+
+
+def is_uuid(value: str) -> bool:
+    try:
+        uuid.UUID(str(value))
+        return True
+    except ValueError:
+        return False
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    """Keep the start of ``text`` so that it fits in about ``tokens`` tokens."""
+    if estimate_tokens(text) <= tokens:
+        return text
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(" ".join(words[:middle]) + " ...") <= tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low]) + " ..." if low else ""
+
+
+class ConversationSession:
+    """Recent turns of one user plus a rolling summary of older ones."""
+
+    def __init__(self, max_turns: int = CHAT_MEMORY_TURNS, summary_tokens: int = CHAT_MEMORY_SUMMARY_TOKENS):
+        self.turns: Deque[Dict[str, str]] = deque()
+        self.max_turns = max_turns
+        self.summary_tokens = summary_tokens
+        self._notes: Deque[str] = deque()
+        self._summary_size = 0
+        self.last_seen = time.monotonic()
+
+    @property
+    def summary(self) -> str:
+        return " ".join(self._notes)
+
+    def add(self, role: str, content: str):
+        self.turns.append({"role": role, "content": content})
+        while len(self.turns) > self.max_turns:
+            self._fold(self.turns.popleft())
+
+    def _fold(self, turn: Dict[str, str]):
+        if turn["role"] != "user":
+            return
+        words = turn["content"].split()
+        note = " ".join(words[:SUMMARY_NOTE_WORDS]) + (" ..." if len(words) > SUMMARY_NOTE_WORDS else "")
+        note = f"The user said: {note}"
+        self._notes.append(note)
+        self._summary_size += estimate_tokens(note)
+        while self._notes and self._summary_size > self.summary_tokens:
+            self._summary_size -= estimate_tokens(self._notes.popleft())
+
+
+class ConversationStore:
+    """LRU of ``ConversationSession`` objects keyed by user id, with batched write-through."""
+
+    def __init__(
+        self,
+        max_sessions: int = CHAT_MEMORY_SESSIONS,
+        idle_seconds: float = CHAT_MEMORY_IDLE_SECONDS,
+        max_turns: int = CHAT_MEMORY_TURNS,
+        summary_tokens: int = CHAT_MEMORY_SUMMARY_TOKENS,
+        token_budget: int = CHAT_PROMPT_TOKEN_BUDGET,
+        table: Optional[str] = CHAT_MEMORY_TABLE,
+    ):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.max_turns = max_turns
+        self.summary_tokens = summary_tokens
+        self.token_budget = token_budget
+        self.table = table
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending: List[Dict] = []
+        self._pending_lock = threading.Lock()
+        self.stats_counters = {"evicted_idle": 0, "evicted_lru": 0, "loaded": 0, "load_errors": 0,
+                               "written": 0, "write_errors": 0, "rejected": 0, "invalid_user_ids": 0,
+                               "dropped": 0, "truncated_prompts": 0}
+
+    # ------------------------------------------------------------------
+    # Sessions
+    # ------------------------------------------------------------------
+    def _evict(self, now: float):
+        while self._sessions:
+            user_id, session = next(iter(self._sessions.items()))
+            if len(self._sessions) > self.max_sessions:
+                self.stats_counters["evicted_lru"] += 1
+            elif now - session.last_seen > self.idle_seconds:
+                self.stats_counters["evicted_idle"] += 1
+            else:
+                break
+            del self._sessions[user_id]
+
+    def _session(self, user_id: str, create: bool) -> Optional[ConversationSession]:
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is not None and now - session.last_seen > self.idle_seconds:
+                del self._sessions[user_id]
+                self.stats_counters["evicted_idle"] += 1
+                session = None
+            if session is not None:
+                session.last_seen = now
+                self._sessions.move_to_end(user_id)
+                return session
+        if not create:
+            return None
+        session = self._load(user_id)
+        with self._lock:
+            # Another request may have created the session while this one was loading
+            session = self._sessions.setdefault(user_id, session)
+            session.last_seen = now
+            self._sessions.move_to_end(user_id)
+            self._evict(now)
+        return session
+
+    def _load(self, user_id: str) -> ConversationSession:
+        """A new session, seeded from the write-through table when there is one."""
+        session = ConversationSession(self.max_turns, self.summary_tokens)
+        if not self.table:
+            return session
+        try:
+            rows = (
+                supabase.table(self.table)
+                .select("role, content")
+                .eq("user_id", user_id)
+                .order("created_at", desc=True)
+                .order("id", desc=True)
+                .limit(self.max_turns)
+                .execute()
+            ).data or []
+            for row in reversed(rows):
+                session.add(row["role"], row["content"])
+            self.stats_counters["loaded"] += 1
+        except Exception as e:
+            self.stats_counters["load_errors"] += 1
+            logger.warning(f"Could not load conversation history for {user_id}: {e}")
+        return session
+
+    def open(self, user_id: str) -> ConversationSession:
+        """The user's session, created (and reloaded from the write-through table) if needed.
+
+        May query Supabase, so async callers should run it in a thread when
+        ``table`` is set.
+        """
+        return self._session(user_id, create=True)
+
+    def has_context(self, user_id: Optional[str]) -> bool:
+        """Whether a reply to this user would depend on earlier turns held in memory."""
+        if not user_id:
+            return False
+        session = self._session(user_id, create=False)
+        return bool(session and (session.turns or session.summary))
+
+    def record(self, user_id: Optional[str], message: str, reply: str):
+        """Append one exchange to the user's session and queue it for write-through."""
+        if not user_id or not reply:
+            return
+        session = self._session(user_id, create=True)
+        with self._lock:
+            session.add("user", message)
+            session.add("assistant", reply)
+        if self.table and not is_uuid(user_id):
+            # chat_messages.user_id is a uuid column; the insert could never succeed
+            self.stats_counters["invalid_user_ids"] += 1
+        elif self.table:
+            now = datetime.now(timezone.utc).isoformat()
+            with self._pending_lock:
+                self._pending.extend([
+                    {"user_id": user_id, "role": "user", "content": message, "created_at": now},
+                    {"user_id": user_id, "role": "assistant", "content": reply, "created_at": now},
+                ])
+                overflow = len(self._pending) - CHAT_MEMORY_MAX_PENDING
+                if overflow > 0:
+                    del self._pending[:overflow]
+                    self.stats_counters["dropped"] += overflow
+
+    def forget(self, user_id: str):
+        """Drop the in-memory session of ``user_id`` (rows already written are kept)."""
+        with self._lock:
+            self._sessions.pop(user_id, None)
+
+    # ------------------------------------------------------------------
+    # Prompt assembly
+    # ------------------------------------------------------------------
+    def build_messages(self, user_id: Optional[str], system_prompt: str, prompt: str) -> List[Dict[str, str]]:
+        """Chat messages for the LLM: system, summary, recent turns and ``prompt``, within the token budget."""
+        remaining = self.token_budget - estimate_tokens(system_prompt)
+        if estimate_tokens(prompt) > remaining:
+            prompt = truncate_to_tokens(prompt, max(remaining, 0))
+            self.stats_counters["truncated_prompts"] += 1
+        remaining -= estimate_tokens(prompt)
+
+        history: List[Dict[str, str]] = []
+        summary = ""
+        session = self._session(user_id, create=False) if user_id else None
+        if session is not None:
+            with self._lock:
+                turns, summary = list(session.turns), session.summary
+            for turn in reversed(turns):
+                cost = estimate_tokens(turn["content"])
+                if cost > remaining:
+                    break
+                history.append(turn)
+                remaining -= cost
+            history.reverse()
+            # A reply without the message it answers is confusing; start on a user turn
+            while history and history[0]["role"] != "user":
+                history.pop(0)
+
+        messages = [{"role": "system", "content": system_prompt}]
+        if summary:
+            summary = f"Earlier in this conversation: {summary}"
+            if estimate_tokens(summary) <= remaining:
+                messages.append({"role": "system", "content": summary})
+        messages.extend(history)
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    # ------------------------------------------------------------------
+    # Write-through
+    # ------------------------------------------------------------------
+    def flush(self) -> int:
+        """Write queued turns in ``CHAT_MEMORY_BATCH_SIZE`` batches; rows that failed in transport are re-queued."""
+        with self._pending_lock:
+            rows, self._pending = self._pending, []
+        if not rows or not self.table:
+            return 0
+        result = insert_rows_in_chunks(self.table, rows, CHAT_MEMORY_BATCH_SIZE)
+        self.stats_counters["written"] += len(result["stored"])
+        rejected = [failure for failure in result["failed"] if failure["rejected"]]
+        retry = [failure for failure in result["failed"] if not failure["rejected"]]
+        if rejected:
+            self.stats_counters["rejected"] += len(rejected)
+            logger.warning(f"Dropped {len(rejected)} chat messages the database rejected: {rejected[0]['error']}")
+        if retry:
+            self.stats_counters["write_errors"] += len(retry)
+            logger.warning(f"Could not write {len(retry)} chat messages, will retry: {retry[0]['error']}")
+            with self._pending_lock:
+                self._pending[:0] = [failure["row"] for failure in retry]
+                overflow = len(self._pending) - CHAT_MEMORY_MAX_PENDING
+                if overflow > 0:
+                    del self._pending[:overflow]
+                    self.stats_counters["dropped"] += overflow
+        return len(result["stored"])
+
+    def stats(self) -> Dict:
+        with self._lock:
+            sessions = len(self._sessions)
+        with self._pending_lock:
+            pending = len(self._pending)
+        return {
+            "sessions": sessions,
+            "max_sessions": self.max_sessions,
+            "token_budget": self.token_budget,
+            "write_through_table": self.table,
+            "pending_writes": pending,
+            **self.stats_counters,
+        }
+
+
+conversation_memory = ConversationStore()
+
+
+async def conversation_flush_loop(interval: float = CHAT_MEMORY_FLUSH_SECONDS):
+    """Write queued chat turns every ``interval`` seconds; does nothing without CHAT_MEMORY_TABLE."""
+    if not conversation_memory.table:
+        return
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await loop.run_in_executor(None, conversation_memory.flush)
+        except Exception as e:
+            logger.error(f"Error writing chat history: {e}")
+
+
+if __name__ == "__main__":
+    print(CHAT_MESSAGES_SQL)
@@ -0,0 +1,387 @@
+"""Doctor allocation: one doctor per user, up to ``capacity`` users per doctor.
+
+``DoctorAllocator`` keeps every doctor and every existing assignment in
+memory (two queries on load, re-synced periodically) together with each
+doctor's capacity and current load. Each ``dominant_state`` pool has a
+min-heap keyed on load, so the least-loaded doctor with a free slot is
+picked in O(log n). Loads are updated incrementally on assign and release;
+``recommended_doctor`` is only re-read by the periodic re-sync. A user the
+index has no doctor for is checked with one indexed lookup, and a negative
+answer is trusted for ``DOCTOR_UNASSIGNED_TTL_SECONDS`` (or until this
+worker assigns one or re-syncs).
+
+Claims go to the database through the ``claim_doctor_slot`` function in
+``DOCTOR_ALLOCATION_SQL``, which locks the doctor row, checks the load
+against the capacity and inserts, so workers can never overfill a doctor.
+The migration first removes duplicate assignments (keeping one row per
+user) so the unique index on ``user_id`` can be built. Doctors
+without a ``capacity`` keep the one-patient limit unless
+``DOCTOR_DEFAULT_CAPACITY`` says otherwise.
+If the function is not installed the claim falls back to a plain insert,
+where the unique index on ``user_id`` still prevents a second doctor per
+user. Within a worker a slot is reserved before the claim is sent, so
+concurrent requests never race for the same slot in the first place.
+"""
+import asyncio
+import heapq
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+from config.database import fetch_all_rows, supabase
+from config.settings import (
+    DOCTOR_CLAIM_RPC,
+    DOCTOR_DEFAULT_CAPACITY,
+    DOCTOR_INDEX_RESYNC_SECONDS,
+    DOCTOR_UNASSIGNED_TTL_SECONDS,
+)
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+GENERAL_STATE = "General"
+RPC_RETRY_SECONDS = 600
+
+DOCTOR_ALLOCATION_SQL = """
+alter table doctors add column if not exists capacity integer;
+drop index if exists recommended_doctor_doctor_id_key;
+-- Users assigned twice before the index existed keep one row (lowest ctid)
+delete from recommended_doctor newer
+    using recommended_doctor older
+    where newer.user_id = older.user_id and newer.ctid > older.ctid;
+create unique index if not exists recommended_doctor_user_id_key on recommended_doctor (user_id);
+
+create or replace function claim_doctor_slot(
+    p_user_id recommended_doctor.user_id%type,
+    p_doctor_id recommended_doctor.doctor_id%type,
+    p_default_capacity integer
+) returns text
+language plpgsql as $$
+declare
+    slots integer;
+    current_load integer;
+begin
+    -- The row lock serializes claims on one doctor across workers
+    select coalesce(capacity, p_default_capacity) into slots from doctors where id = p_doctor_id for update;
+    if not found then
+        return 'missing';
+    end if;
+    select count(*) into current_load from recommended_doctor where doctor_id = p_doctor_id;
+    if current_load >= slots then
+        return 'full';
+    end if;
+    insert into recommended_doctor (user_id, doctor_id) values (p_user_id, p_doctor_id);
+    return 'claimed';
+exception when unique_violation then
+    return 'assigned';
+end;
+$$;
+""".strip()
+
+
+def _pool_key(dominant_state: Optional[str]) -> str:
+    """Doctors without a state (or marked "General") can take any state."""
+    return dominant_state if dominant_state and dominant_state != GENERAL_STATE else GENERAL_STATE
+
+
+def _capacity(doctor: dict) -> int:
+    try:
+        return max(int(doctor.get("capacity")), 0)
+    except (TypeError, ValueError):
+        return DOCTOR_DEFAULT_CAPACITY
+
+
+def _is_conflict(error: Exception) -> bool:
+    message = str(error)
+    return "23505" in message or "duplicate key" in message.lower()
+
+
+class DoctorAllocator:
+    """In-memory least-loaded doctor scheduler with capacity-checked claims."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._claims = threading.Condition(self._lock)
+        self._loaded = False
+        self.doctors: Dict[str, dict] = {}
+        self.pools: Dict[str, List[str]] = {}
+        self.capacity: Dict[str, int] = {}
+        self.load_count: Dict[str, int] = {}
+        self.user_doctor: Dict[str, str] = {}
+        # Heap entries are (load, position, doctor_id); entries whose load is
+        # out of date are dropped when they reach the top
+        self._heaps: Dict[str, List[Tuple[int, int, str]]] = {}
+        self._position: Dict[str, int] = {}
+        self._reserved: Counter = Counter()
+        self._claiming_users: Set[str] = set()
+        self._rpc_unavailable_until = 0.0
+        # Users recently confirmed to have no doctor
+        self._unassigned = TTLCache(maxsize=100000, ttl=DOCTOR_UNASSIGNED_TTL_SECONDS)
+        self.loaded_at: Optional[float] = None
+        self.stats = {"claims": 0, "releases": 0, "conflicts": 0, "full": 0, "reloads": 0}
+
+    # ------------------------------------------------------------------
+    # Index maintenance
+    # ------------------------------------------------------------------
+    def load(self):
+        """Rebuild the index from ``doctors`` and ``recommended_doctor`` (two queries)."""
+        doctors = fetch_all_rows("doctors", "*")
+        assignments = fetch_all_rows("recommended_doctor", "user_id, doctor_id")
+
+        by_id = {str(d["id"]): d for d in doctors if d.get("id") is not None}
+        pools: Dict[str, List[str]] = {}
+        for doctor_id, doctor in by_id.items():
+            pools.setdefault(_pool_key(doctor.get("dominant_state")), []).append(doctor_id)
+        user_doctor: Dict[str, str] = {}
+        for row in assignments:
+            user_doctor.setdefault(str(row["user_id"]), str(row["doctor_id"]))
+        load_count = Counter(user_doctor.values())
+
+        with self._lock:
+            # Claims in flight keep their reservation across the swap
+            self.doctors, self.pools = by_id, pools
+            self.capacity = {doctor_id: _capacity(doctor) for doctor_id, doctor in by_id.items()}
+            self.load_count = {doctor_id: load_count.get(doctor_id, 0) for doctor_id in by_id}
+            self.user_doctor = user_doctor
+            self._position = {doctor_id: i for i, doctor_id in enumerate(by_id)}
+            self._heaps = {}
+            for key, ids in pools.items():
+                heap = [(self._effective_load(d), self._position[d], d) for d in ids if self._has_room(d)]
+                heapq.heapify(heap)
+                self._heaps[key] = heap
+            self._loaded = True
+            self._unassigned.clear()
+            self.loaded_at = time.time()
+            self.stats["reloads"] += 1
+        logger.info(f"Doctor index loaded: {len(by_id)} doctors, {len(user_doctor)} assigned")
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def _effective_load(self, doctor_id: str) -> int:
+        return self.load_count.get(doctor_id, 0) + self._reserved[doctor_id]
+
+    def _has_room(self, doctor_id: str) -> bool:
+        return self._effective_load(doctor_id) < self.capacity.get(doctor_id, 0)
+
+    def _push(self, doctor_id: str):
+        """Queue ``doctor_id`` at its current load if it still has a free slot."""
+        doctor = self.doctors.get(doctor_id)
+        if doctor is not None and self._has_room(doctor_id):
+            heap = self._heaps.setdefault(_pool_key(doctor.get("dominant_state")), [])
+            heapq.heappush(heap, (self._effective_load(doctor_id), self._position[doctor_id], doctor_id))
+
+    def _mark_assigned(self, doctor_id: str, user_id: str):
+        # A re-sync may already have counted this assignment
+        self._unassigned.delete(user_id)
+        if self.user_doctor.get(user_id) != doctor_id:
+            self.user_doctor[user_id] = doctor_id
+            self.load_count[doctor_id] = self.load_count.get(doctor_id, 0) + 1
+        self._push(doctor_id)
+
+    def _mark_full(self, doctor_id: str):
+        """Another worker filled the doctor; hold it at capacity until the next re-sync."""
+        self.load_count[doctor_id] = max(self.load_count.get(doctor_id, 0), self.capacity.get(doctor_id, 0))
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+    def assigned_doctor(self, user_id: str) -> Optional[dict]:
+        """The doctor already assigned to ``user_id``, if any.
+
+        The index only sees other workers' assignments after a re-sync, so a
+        miss is confirmed against ``recommended_doctor``; a doctor found there
+        is recorded, and "none" is cached for ``DOCTOR_UNASSIGNED_TTL_SECONDS``.
+        """
+        self.ensure_loaded()
+        user_id = str(user_id)
+        with self._lock:
+            doctor_id = self.user_doctor.get(user_id)
+            if doctor_id:
+                return self.doctors.get(doctor_id)
+        if self._unassigned.get(user_id):
+            return None
+        existing = self._lookup_user_assignment(user_id)
+        if not existing:
+            self._unassigned.set(user_id, True)
+            return None
+        with self._lock:
+            if existing in self.doctors:
+                self._mark_assigned(existing, user_id)
+                return self.doctors[existing]
+        # A doctor added after the last re-sync; that re-sync will index it
+        rows = supabase.table("doctors").select("*").eq("id", existing).limit(1).execute().data
+        return rows[0] if rows else None
+
+    def candidate_pools(self, dominant_state: Optional[str], fallback_any: bool = False) -> List[str]:
+        """Pools in the order they are tried: the state's own doctors, general ones, then (optionally) all."""
+        key = _pool_key(dominant_state)
+        pools = [k for k in (key, GENERAL_STATE) if k in self.pools]
+        if fallback_any:
+            pools.extend(k for k in self.pools if k not in pools)
+        return list(dict.fromkeys(pools))
+
+    def has_doctors(self) -> bool:
+        self.ensure_loaded()
+        return bool(self.doctors)
+
+    # ------------------------------------------------------------------
+    # Allocation
+    # ------------------------------------------------------------------
+    def _reserve(self, pools: List[str]) -> Optional[str]:
+        """Take a slot on the least-loaded doctor of the first pool with room."""
+        for key in pools:
+            heap = self._heaps.get(key)
+            while heap:
+                load, _, doctor_id = heapq.heappop(heap)
+                if load != self._effective_load(doctor_id) or not self._has_room(doctor_id):
+                    continue  # stale entry; a fresher one was pushed when the load changed
+                self._reserved[doctor_id] += 1
+                self._push(doctor_id)
+                return doctor_id
+        return None
+
+    def _drop_reservation(self, doctor_id: str):
+        self._reserved[doctor_id] -= 1
+        if self._reserved[doctor_id] <= 0:
+            del self._reserved[doctor_id]
+
+    def _unreserve(self, doctor_id: str):
+        self._drop_reservation(doctor_id)
+        self._push(doctor_id)
+
+    def _lookup_user_assignment(self, user_id: str) -> Optional[str]:
+        rows = supabase.table("recommended_doctor").select("doctor_id").eq("user_id", user_id).limit(1).execute().data
+        return str(rows[0]["doctor_id"]) if rows else None
+
+    def _claim(self, user_id: str, doctor_id: str) -> str:
+        """Write the assignment; returns "claimed", "full" or "assigned" (user already has one)."""
+        doctor_key = self.doctors[doctor_id].get("id")
+        if time.monotonic() >= self._rpc_unavailable_until:
+            try:
+                response = supabase.rpc(DOCTOR_CLAIM_RPC, {
+                    "p_user_id": user_id,
+                    "p_doctor_id": doctor_key,
+                    "p_default_capacity": DOCTOR_DEFAULT_CAPACITY
+                }).execute()
+                return "full" if response.data == "missing" else response.data
+            except Exception as e:
+                if _is_conflict(e):
+                    return "assigned"
+                logger.warning(f"Doctor claim RPC unavailable, inserting directly: {e}")
+                self._rpc_unavailable_until = time.monotonic() + RPC_RETRY_SECONDS
+        try:
+            supabase.table("recommended_doctor").insert({"user_id": user_id, "doctor_id": doctor_key}).execute()
+            return "claimed"
+        except Exception as e:
+            if _is_conflict(e):
+                return "assigned"
+            raise
+
+    def allocate(self, user_id: str, dominant_state: Optional[str], fallback_any: bool = False) -> Optional[dict]:
+        """Return the user's doctor, claiming the least-loaded one for ``dominant_state`` if needed."""
+        self.ensure_loaded()
+        user_id = str(user_id)
+        with self._claims:
+            # One claim per user at a time; a second request waits for the first
+            while user_id in self._claiming_users:
+                self._claims.wait()
+            if user_id in self.user_doctor:
+                return self.doctors.get(self.user_doctor[user_id])
+            self._claiming_users.add(user_id)
+            pools = self.candidate_pools(dominant_state, fallback_any)
+        try:
+            while True:
+                with self._lock:
+                    doctor_id = self._reserve(pools)
+                if doctor_id is None:
+                    return None
+                try:
+                    outcome = self._claim(user_id, doctor_id)
+                except Exception:
+                    with self._lock:
+                        self._unreserve(doctor_id)
+                    raise
+                if outcome == "full":
+                    with self._lock:
+                        self.stats["full"] += 1
+                        self._mark_full(doctor_id)
+                        self._unreserve(doctor_id)
+                    continue
+                if outcome == "assigned":
+                    # Another worker assigned this user first
+                    self.stats["conflicts"] += 1
+                    existing = self._lookup_user_assignment(user_id)
+                    with self._lock:
+                        self._unreserve(doctor_id)
+                        if existing:
+                            self._mark_assigned(existing, user_id)
+                        doctor = self.doctors.get(existing) if existing else None
+                    if existing and doctor is None:
+                        # Assigned to a doctor this index has not seen yet
+                        self.load()
+                        doctor = self.doctors.get(existing)
+                    return doctor
+                with self._lock:
+                    self._drop_reservation(doctor_id)
+                    self._mark_assigned(doctor_id, user_id)
+                    self.stats["claims"] += 1
+                logger.info(f"Assigned doctor {doctor_id} to user {user_id}")
+                return self.doctors[doctor_id]
+        finally:
+            with self._claims:
+                self._claiming_users.discard(user_id)
+                self._claims.notify_all()
+
+    def release(self, user_id: str) -> bool:
+        """Remove the user's assignment, freeing a slot on their doctor."""
+        self.ensure_loaded()
+        user_id = str(user_id)
+        removed = supabase.table("recommended_doctor").delete().eq("user_id", user_id).execute().data or []
+        with self._lock:
+            self._unassigned.delete(user_id)
+            doctor_id = self.user_doctor.pop(user_id, None)
+            if doctor_id is None and removed:
+                doctor_id = str(removed[0]["doctor_id"])
+            if doctor_id is None:
+                return False
+            self.load_count[doctor_id] = max(self.load_count.get(doctor_id, 0) - 1, 0)
+            self._push(doctor_id)
+            self.stats["releases"] += 1
+        logger.info(f"Released doctor {doctor_id} from user {user_id}")
+        return True
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "doctors": len(self.doctors),
+                "assigned": len(self.user_doctor),
+                "open_slots_by_state": {
+                    key: sum(max(self.capacity[d] - self._effective_load(d), 0) for d in ids)
+                    for key, ids in self.pools.items()
+                },
+                "reserved": sum(self._reserved.values()),
+                "loaded_at": self.loaded_at,
+                **self.stats,
+            }
+
+
+doctor_allocator = DoctorAllocator()
+
+
+async def doctor_index_sync_loop(interval: float = DOCTOR_INDEX_RESYNC_SECONDS):
+    """Load the doctor index, then re-sync it every ``interval`` seconds."""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, doctor_allocator.load)
+        except Exception as e:
+            logger.error(f"Error loading doctor index: {e}")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    print(DOCTOR_ALLOCATION_SQL)
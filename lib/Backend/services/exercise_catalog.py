@@ -0,0 +1,236 @@
+"""In-process exercise catalog cache.
+
+The whole ``exercises`` table is loaded in one query into an immutable
+``CatalogSnapshot``: chat flows are parsed once and the JSON bodies for the
+categories list, each category and each exercise are rendered to bytes with
+an ETag. Catalog endpoints are then served from memory.
+
+Every ``EXERCISE_CATALOG_POLL_SECONDS`` a background task reads the catalog
+marker: the row count and the newest ``updated_at``, in one single-row
+request (see ``CATALOG_VERSION_SQL``; print it with
+``python -m services.exercise_catalog``). The table is re-read only when the
+marker moved; ETags come from the content hash (the catalog version), so
+clients only see a change when the content did. Without an
+``updated_at`` column every poll falls back to a full re-read.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from config.database import supabase
+from config.settings import EXERCISE_CATALOG_POLL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_SQL = """
+alter table exercises add column if not exists updated_at timestamptz not null default now();
+create index if not exists exercises_updated_at_idx on exercises (updated_at);
+
+create or replace function touch_updated_at() returns trigger
+language plpgsql as $$
+begin
+    new.updated_at = now();
+    return new;
+end;
+$$;
+
+drop trigger if exists exercises_touch_updated_at on exercises;
+create trigger exercises_touch_updated_at before update on exercises
+    for each row execute function touch_updated_at();
+""".strip()
+
+# How long to stop reading the marker after ``updated_at`` turned out to be missing
+MARKER_RETRY_SECONDS = 600
+
+
+def parse_chat_flow(chat_flow) -> list:
+    """chat_flow as a list, parsing it if it is stored as a JSON string."""
+    if isinstance(chat_flow, str):
+        try:
+            return json.loads(chat_flow)
+        except json.JSONDecodeError:
+            return []
+    return chat_flow if chat_flow is not None else []
+
+
+def exercise_payload(ex: dict, **extra) -> dict:
+    """Shape an ``exercises`` row for the API."""
+    return {
+        "id": ex["id"],
+        "name": ex["exercise_name"],
+        "duration": ex["duration"],
+        "category": ex["category_name"],
+        "category_image_path": ex["category_image_path"],
+        "description": ex["exercise_description"],
+        **extra,
+        "chat_flow": parse_chat_flow(ex.get("chat_flow", [])),
+    }
+
+
+def render_json(content) -> bytes:
+    """Serialize like Starlette's JSONResponse so cached bodies are byte-identical."""
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+class RenderedJSON:
+    """A pre-serialized JSON body and its strong ETag."""
+
+    __slots__ = ("content", "body", "etag")
+
+    def __init__(self, content):
+        self.content = content
+        self.body = render_json(content)
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest() + '"'
+
+
+class CatalogSnapshot:
+    """Immutable view of the exercise catalog with pre-rendered responses."""
+
+    def __init__(self, rows: List[dict], marker: Optional[Tuple[int, Optional[str]]] = None):
+        self.loaded_at = datetime.now(timezone.utc)
+        self.marker = marker
+        self.version = hashlib.sha256(render_json(sorted(rows, key=lambda r: str(r.get("id"))))).hexdigest()[:16]
+        self.rows: Dict[str, dict] = {str(row["id"]): row for row in rows}
+        self.exercises: Dict[str, dict] = {}
+        self.exercise_bodies: Dict[str, RenderedJSON] = {}
+        by_category: Dict[str, List[dict]] = {}
+        categories: Dict[str, dict] = {}
+
+        for row in rows:
+            payload = exercise_payload(row)
+            self.exercises[str(row["id"])] = payload
+            self.exercise_bodies[str(row["id"])] = RenderedJSON(payload)
+            if not row.get("is_active"):
+                continue
+            name = row["category_name"]
+            by_category.setdefault(name, []).append(payload)
+            if name not in categories:
+                categories[name] = {
+                    "id": name.lower().replace(" ", "-"),
+                    "name": name,
+                    "image_path": row["category_image_path"],
+                    "exercises": []
+                }
+
+        self.categories = RenderedJSON(list(categories.values()))
+        self.category_bodies = {name: RenderedJSON(items) for name, items in by_category.items()}
+        self.empty_list = RenderedJSON([])
+
+    def category(self, category_id: str) -> RenderedJSON:
+        """Active exercises for a kebab-case category id (Title Case match, as before)."""
+        return self.category_bodies.get(category_id.replace("-", " ").title(), self.empty_list)
+
+    def stats(self) -> Dict:
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at.isoformat(),
+            "exercises": len(self.exercises),
+            "categories": len(self.category_bodies),
+        }
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True if an If-None-Match header value matches ``etag`` (weak comparison)."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+def cached_json_response(request: Request, rendered: RenderedJSON) -> Response:
+    """Serve a pre-rendered body, or 304 if the client already has this version."""
+    headers = {"ETag": rendered.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), rendered.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=rendered.body, media_type="application/json", headers=headers)
+
+
+def fetch_catalog_rows() -> List[dict]:
+    response = supabase.table("exercises").select("*").execute()
+    return response.data or []
+
+
+def fetch_catalog_marker() -> Tuple[int, Optional[str]]:
+    """(row count, newest ``updated_at``): inserts, deletes and updates all move it."""
+    response = supabase.table("exercises")\
+        .select("updated_at", count="exact")\
+        .order("updated_at", desc=True)\
+        .limit(1)\
+        .execute()
+    newest = response.data[0]["updated_at"] if response.data else None
+    return response.count or 0, newest
+
+
+_snapshot: Optional[CatalogSnapshot] = None
+_load_lock = threading.Lock()
+_first_load_lock = threading.Lock()
+_marker_unavailable_until = 0.0
+
+
+def _read_marker() -> Optional[Tuple[int, Optional[str]]]:
+    """The catalog marker, or None if ``updated_at`` is missing (then always reload)."""
+    global _marker_unavailable_until
+    if time.monotonic() < _marker_unavailable_until:
+        return None
+    try:
+        return fetch_catalog_marker()
+    except Exception as e:
+        logger.warning(f"Exercise catalog marker unavailable, re-reading the table on every poll: {e}")
+        _marker_unavailable_until = time.monotonic() + MARKER_RETRY_SECONDS
+        return None
+
+
+def refresh_catalog() -> CatalogSnapshot:
+    """Re-read the table only if the marker moved since the current snapshot was loaded."""
+    global _snapshot
+    started = time.perf_counter()
+    # Read before the rows, so a change landing in between is picked up by the next poll
+    marker = _read_marker()
+    current = _snapshot
+    if current is not None and marker is not None and marker == current.marker:
+        return current
+    snapshot = CatalogSnapshot(fetch_catalog_rows(), marker)
+    with _load_lock:
+        previous = _snapshot.version if _snapshot else None
+        # An unchanged version is swapped in too, so it carries the new marker
+        _snapshot = snapshot
+    if previous != snapshot.version:
+        logger.info(f"Exercise catalog {previous} -> {snapshot.version} "
+                    f"({len(snapshot.exercises)} exercises, {(time.perf_counter() - started) * 1000:.0f} ms)")
+    return snapshot
+
+
+def get_catalog() -> CatalogSnapshot:
+    """Current snapshot, loading it on first use (read-through)."""
+    snapshot = _snapshot
+    if snapshot is None:
+        with _first_load_lock:
+            snapshot = _snapshot or refresh_catalog()
+    return snapshot
+
+
+def catalog_stats() -> Optional[Dict]:
+    return _snapshot.stats() if _snapshot else None
+
+
+async def catalog_sync_loop(interval: float = EXERCISE_CATALOG_POLL_SECONDS):
+    """Load the catalog, then poll for a new version every ``interval`` seconds."""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, refresh_catalog)
+        except Exception as e:
+            logger.error(f"Error refreshing exercise catalog: {e}")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    print(CATALOG_VERSION_SQL)
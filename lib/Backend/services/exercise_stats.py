@@ -0,0 +1,409 @@
+"""Exercise statistics: today, weekly average and streak.
+
+Reads come from a materialized per-user record (``UserExerciseStats``) that
+``log_completion`` updates incrementally. The full recompute path fetches
+completion timestamps in bounded windows (newest first) and buckets them
+into calendar days in the user's timezone; it backs the rebuild/verify
+commands and serves reads when no usable record exists::
+
+    python -m services.exercise_stats rebuild --all
+    python -m services.exercise_stats verify --user <user_id>
+    python -m services.exercise_stats schema
+"""
+import argparse
+import logging
+import re
+import sys
+from datetime import date, datetime, time, timedelta, timezone, tzinfo
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from config.database import supabase
+from config.settings import (
+    EXERCISE_STATS_LOOKBACK_DAYS,
+    EXERCISE_STATS_MAX_ROWS,
+    EXERCISE_STATS_TABLE,
+    EXERCISE_STATS_TIMEZONE,
+)
+
+logger = logging.getLogger(__name__)
+
+_OFFSET_PATTERN = re.compile(r"^(?:UTC|GMT)?([+-])(\d{1,2})(?::?(\d{2}))?$", re.IGNORECASE)
+
+EMPTY_STATS = {
+    "completed_today": 0,
+    "total_duration": 0,
+    "weekly_average": 0.0,
+    "streak": 0,
+}
+
+
+def resolve_timezone(name: Optional[str] = None) -> tzinfo:
+    """Turn an IANA name ("Asia/Colombo") or UTC offset ("+05:30") into a tzinfo."""
+    name = (name or EXERCISE_STATS_TIMEZONE or "UTC").strip()
+    match = _OFFSET_PATTERN.match(name)
+    if match:
+        sign, hours, minutes = match.groups()
+        offset = timedelta(hours=int(hours), minutes=int(minutes or 0))
+        return timezone(-offset if sign == "-" else offset)
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Unknown timezone {name!r}, using {EXERCISE_STATS_TIMEZONE}")
+        return ZoneInfo(EXERCISE_STATS_TIMEZONE) if name != EXERCISE_STATS_TIMEZONE else timezone.utc
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Parse a PostgREST timestamp; naive values are taken to be UTC."""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _day_start_utc(day: date, tz: tzinfo) -> str:
+    return datetime.combine(day, time.min, tzinfo=tz).astimezone(timezone.utc).isoformat()
+
+
+def fetch_completion_window(user_id: str, since_day: date, until_day: date, tz: tzinfo,
+                            limit: int = EXERCISE_STATS_MAX_ROWS) -> List[dict]:
+    """Completions in local days [since_day, until_day), newest first."""
+    response = supabase.table("exercise_completions")\
+        .select("completed_at, duration_seconds")\
+        .eq("user_id", user_id)\
+        .gte("completed_at", _day_start_utc(since_day, tz))\
+        .lt("completed_at", _day_start_utc(until_day, tz))\
+        .order("completed_at", desc=True)\
+        .limit(limit)\
+        .execute()
+    return response.data or []
+
+
+def bucket_completions(rows: Iterable[dict], tz: tzinfo,
+                       day_totals: Optional[Dict[date, List[int]]] = None) -> Dict[date, List[int]]:
+    """Group completion rows by local day into ``day -> [count, duration_seconds]``."""
+    day_totals = {} if day_totals is None else day_totals
+    for row in rows:
+        day = parse_timestamp(row["completed_at"]).astimezone(tz).date()
+        totals = day_totals.setdefault(day, [0, 0])
+        totals[0] += 1
+        totals[1] += row.get("duration_seconds") or 0
+    return day_totals
+
+
+def streak_length(days: Iterable[date], end_day: date) -> int:
+    """Consecutive active days ending at ``end_day`` (0 if ``end_day`` was inactive)."""
+    days = days if isinstance(days, (set, dict)) else set(days)
+    streak = 0
+    while end_day - timedelta(days=streak) in days:
+        streak += 1
+    return streak
+
+
+def collect_day_totals(user_id: str, tz: tzinfo, today: date, streak_end: Optional[date] = None,
+                       lookback_days: int = EXERCISE_STATS_LOOKBACK_DAYS,
+                       max_rows: int = EXERCISE_STATS_MAX_ROWS) -> Dict[date, List[int]]:
+    """Per-day totals covering the last week and the streak ending at ``streak_end``.
+
+    ``streak_end`` defaults to the latest active day.
+    """
+    week_start = today - timedelta(days=7)
+    lookback_days = max(lookback_days, 8)
+    day_totals: Dict[date, List[int]] = {}
+    until_day = today + timedelta(days=1)
+    while True:
+        since_day = until_day - timedelta(days=lookback_days)
+        rows = fetch_completion_window(user_id, since_day, until_day, tz, max_rows)
+        if len(rows) >= max_rows:
+            # Page is truncated: drop its oldest (possibly partial) day and resume from there
+            oldest_day = parse_timestamp(rows[-1]["completed_at"]).astimezone(tz).date()
+            if oldest_day < until_day - timedelta(days=1):
+                rows = [r for r in rows if parse_timestamp(r["completed_at"]).astimezone(tz).date() > oldest_day]
+                since_day = oldest_day + timedelta(days=1)
+            else:
+                since_day = oldest_day
+        bucket_completions(rows, tz, day_totals)
+
+        end_day = streak_end or (max(day_totals) if day_totals else today)
+        # Stop once the streak is broken inside the covered range and the week is complete
+        if end_day - timedelta(days=streak_length(day_totals, end_day)) >= since_day and since_day <= week_start:
+            break
+        if not rows:
+            break
+        until_day = since_day
+    return day_totals
+
+
+def stats_from_day_totals(day_totals: Dict[date, List[int]], today: date) -> Dict:
+    """Build the stats payload from per-day totals."""
+    week_start = today - timedelta(days=7)
+    completed_today, total_duration = day_totals.get(today, (0, 0))
+    week_count = sum(count for day, (count, _) in day_totals.items() if week_start <= day <= today)
+    return {
+        "completed_today": completed_today,
+        "total_duration": total_duration,
+        "weekly_average": round(week_count / 7.0, 2),
+        "streak": streak_length(day_totals, today),
+    }
+
+
+def get_exercise_stats(user_id: str, tz_name: Optional[str] = None, now: Optional[datetime] = None,
+                       lookback_days: int = EXERCISE_STATS_LOOKBACK_DAYS,
+                       max_rows: int = EXERCISE_STATS_MAX_ROWS) -> Dict:
+    """Compute completed_today, total_duration, weekly_average and streak from completions."""
+    tz = resolve_timezone(tz_name)
+    today = (now or datetime.now(timezone.utc)).astimezone(tz).date()
+    day_totals = collect_day_totals(user_id, tz, today, today, lookback_days, max_rows)
+    return stats_from_day_totals(day_totals, today)
+
+
+class UserExerciseStats:
+    """Materialized stats for one user, updated one completion at a time.
+
+    Keeps the latest active day, the streak ending on it, that day's total
+    duration and an 8-slot ring of per-day counts (today plus the previous
+    seven days, matching the weekly average window).
+    """
+
+    RING_DAYS = 8
+
+    def __init__(self, user_id: str, timezone_name: str):
+        self.user_id = user_id
+        self.timezone = timezone_name
+        self.last_day: Optional[date] = None
+        self.streak = 0
+        self.last_day_duration = 0
+        self.day_counts = [0] * self.RING_DAYS
+
+    def _slot(self, day: date) -> int:
+        return day.toordinal() % self.RING_DAYS
+
+    def add(self, day: date, duration_seconds: int = 0) -> bool:
+        """Apply one completion; returns False if it predates the record (rebuild needed)."""
+        if self.last_day is not None and day < self.last_day:
+            return False
+        if self.last_day is None or day > self.last_day:
+            gap = (day - self.last_day).days if self.last_day else self.RING_DAYS
+            for back in range(min(gap, self.RING_DAYS)):
+                self.day_counts[self._slot(day - timedelta(days=back))] = 0
+            self.streak = self.streak + 1 if gap == 1 else 1
+            self.last_day = day
+            self.last_day_duration = 0
+        self.day_counts[self._slot(day)] += 1
+        self.last_day_duration += duration_seconds or 0
+        return True
+
+    def snapshot(self, today: date) -> Optional[Dict]:
+        """Stats as of ``today``; None if the record is ahead of ``today``."""
+        if self.last_day is None:
+            return dict(EMPTY_STATS)
+        age = (today - self.last_day).days
+        if age < 0:
+            return None
+        week_count = sum(
+            self.day_counts[self._slot(self.last_day - timedelta(days=back))]
+            for back in range(max(self.RING_DAYS - age, 0))
+        )
+        return {
+            "completed_today": self.day_counts[self._slot(today)] if age == 0 else 0,
+            "total_duration": self.last_day_duration if age == 0 else 0,
+            "weekly_average": round(week_count / 7.0, 2),
+            "streak": self.streak if age == 0 else 0,
+        }
+
+    @classmethod
+    def from_day_totals(cls, user_id: str, timezone_name: str, day_totals: Dict[date, List[int]]) -> "UserExerciseStats":
+        record = cls(user_id, timezone_name)
+        if day_totals:
+            record.last_day = max(day_totals)
+            record.streak = streak_length(day_totals, record.last_day)
+            record.last_day_duration = day_totals[record.last_day][1]
+            for back in range(cls.RING_DAYS):
+                day = record.last_day - timedelta(days=back)
+                record.day_counts[record._slot(day)] = day_totals.get(day, (0, 0))[0]
+        return record
+
+    def to_row(self) -> Dict:
+        return {
+            "user_id": self.user_id,
+            "timezone": self.timezone,
+            "last_day": self.last_day.isoformat() if self.last_day else None,
+            "streak": self.streak,
+            "last_day_duration": self.last_day_duration,
+            "day_counts": list(self.day_counts),
+        }
+
+    @classmethod
+    def from_row(cls, row: Dict) -> "UserExerciseStats":
+        record = cls(row["user_id"], row["timezone"])
+        record.last_day = date.fromisoformat(row["last_day"]) if row.get("last_day") else None
+        record.streak = row.get("streak") or 0
+        record.last_day_duration = row.get("last_day_duration") or 0
+        counts = row.get("day_counts") or []
+        record.day_counts = (list(counts) + [0] * cls.RING_DAYS)[:cls.RING_DAYS]
+        return record
+
+
+STATS_TABLE_SCHEMA = f"""
+create table if not exists {EXERCISE_STATS_TABLE} (
+    user_id text primary key,
+    timezone text not null,
+    last_day date,
+    streak integer not null default 0,
+    last_day_duration integer not null default 0,
+    day_counts jsonb not null default '[0,0,0,0,0,0,0,0]',
+    version integer not null default 1,
+    updated_at timestamptz not null default now()
+);
+""".strip()
+
+
+def _today(tz: tzinfo, now: Optional[datetime] = None) -> date:
+    return (now or datetime.now(timezone.utc)).astimezone(tz).date()
+
+
+def load_stats_record(user_id: str) -> Optional[Tuple[UserExerciseStats, int]]:
+    """Fetch the materialized record and its version, or None if there is none."""
+    response = supabase.table(EXERCISE_STATS_TABLE)\
+        .select("*")\
+        .eq("user_id", user_id)\
+        .limit(1)\
+        .execute()
+    if not response.data:
+        return None
+    row = response.data[0]
+    return UserExerciseStats.from_row(row), row.get("version") or 1
+
+
+def save_stats_record(record: UserExerciseStats, expected_version: Optional[int]) -> bool:
+    """Write a record with optimistic concurrency; False if another writer got there first."""
+    row = {**record.to_row(), "updated_at": datetime.now(timezone.utc).isoformat()}
+    if expected_version is None:
+        try:
+            response = supabase.table(EXERCISE_STATS_TABLE).insert({**row, "version": 1}).execute()
+        except Exception as e:
+            if "23505" in str(e) or "duplicate" in str(e).lower():
+                return False
+            raise
+        return bool(response.data)
+    response = supabase.table(EXERCISE_STATS_TABLE)\
+        .update({**row, "version": expected_version + 1})\
+        .eq("user_id", record.user_id)\
+        .eq("version", expected_version)\
+        .execute()
+    return bool(response.data)
+
+
+def rebuild_stats_record(user_id: str, tz_name: Optional[str] = None, now: Optional[datetime] = None) -> UserExerciseStats:
+    """Recompute a user's record from ``exercise_completions`` (not saved)."""
+    tz_name = tz_name or EXERCISE_STATS_TIMEZONE
+    tz = resolve_timezone(tz_name)
+    day_totals = collect_day_totals(user_id, tz, _today(tz, now))
+    return UserExerciseStats.from_day_totals(user_id, tz_name, day_totals)
+
+
+def record_completion(user_id: str, completed_at: datetime, duration_seconds: int = 0,
+                      tz_name: Optional[str] = None, retries: int = 3) -> UserExerciseStats:
+    """Fold a just-inserted completion into the user's materialized stats."""
+    for _ in range(retries):
+        loaded = load_stats_record(user_id)
+        record, version = loaded if loaded else (None, None)
+        if record is None or (tz_name and tz_name != record.timezone):
+            # New user or timezone change: the completion is already in the table
+            rebuilt = rebuild_stats_record(user_id, tz_name or (record.timezone if record else None))
+            record = rebuilt
+        elif not record.add(completed_at.astimezone(resolve_timezone(record.timezone)).date(), duration_seconds):
+            record = rebuild_stats_record(user_id, record.timezone)
+        if save_stats_record(record, version):
+            return record
+    raise RuntimeError(f"Concurrent stats updates for user {user_id}, giving up after {retries} attempts")
+
+
+def read_user_stats(user_id: str, tz_name: Optional[str] = None, now: Optional[datetime] = None) -> Dict:
+    """O(1) stats read from the materialized record, recomputing when it cannot answer."""
+    try:
+        loaded = load_stats_record(user_id)
+    except Exception as e:
+        logger.warning(f"Materialized stats unavailable, recomputing: {e}")
+        loaded = None
+    if loaded is not None:
+        record, _ = loaded
+        if not tz_name or tz_name == record.timezone:
+            snapshot = record.snapshot(_today(resolve_timezone(record.timezone), now))
+            if snapshot is not None:
+                return snapshot
+    return get_exercise_stats(user_id, tz_name, now)
+
+
+def iter_user_ids(page_size: int = 1000) -> Iterator[str]:
+    """Distinct user ids with completions, via keyset pagination on user_id."""
+    last = None
+    while True:
+        query = supabase.table("exercise_completions").select("user_id").order("user_id").limit(page_size)
+        if last is not None:
+            query = query.gt("user_id", last)
+        rows = query.execute().data or []
+        if not rows:
+            return
+        for user_id in sorted({row["user_id"] for row in rows}):
+            yield user_id
+        last = rows[-1]["user_id"]
+
+
+def rebuild_user(user_id: str, tz_name: Optional[str] = None) -> UserExerciseStats:
+    """Recompute and store a user's record, replacing whatever is there."""
+    loaded = load_stats_record(user_id)
+    tz_name = tz_name or (loaded[0].timezone if loaded else None)
+    record = rebuild_stats_record(user_id, tz_name)
+    if not save_stats_record(record, loaded[1] if loaded else None):
+        raise RuntimeError(f"Stats record for user {user_id} changed during rebuild")
+    return record
+
+
+def verify_user(user_id: str, now: Optional[datetime] = None) -> Optional[Tuple[Dict, Dict]]:
+    """Compare the stored record with a full recompute; returns both rows on mismatch."""
+    loaded = load_stats_record(user_id)
+    stored = loaded[0].to_row() if loaded else None
+    rebuilt = rebuild_stats_record(user_id, loaded[0].timezone if loaded else None, now).to_row()
+    if stored != rebuilt:
+        return stored, rebuilt
+    return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Maintain materialized exercise stats")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ("rebuild", "verify"):
+        command = commands.add_parser(name)
+        target = command.add_mutually_exclusive_group(required=True)
+        target.add_argument("--user", action="append", help="user id (repeatable)")
+        target.add_argument("--all", action="store_true", help="every user with completions")
+        if name == "rebuild":
+            command.add_argument("--tz", help="timezone for new records (IANA name or UTC offset)")
+    commands.add_parser("schema", help="print the SQL for the stats table")
+    args = parser.parse_args(argv)
+
+    if args.command == "schema":
+        print(STATS_TABLE_SCHEMA)
+        return 0
+
+    user_ids = iter_user_ids() if args.all else args.user
+    processed = failures = 0
+    for user_id in user_ids:
+        processed += 1
+        try:
+            if args.command == "rebuild":
+                record = rebuild_user(user_id, args.tz)
+                print(f"rebuilt {user_id}: streak={record.streak} last_day={record.last_day}")
+            else:
+                mismatch = verify_user(user_id)
+                if mismatch:
+                    failures += 1
+                    print(f"MISMATCH {user_id}: stored={mismatch[0]} recomputed={mismatch[1]}")
+        except Exception as e:
+            failures += 1
+            print(f"FAILED {user_id}: {e}")
+    print(f"{args.command}: {processed} users, {failures} problems")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+"""Trending exercises.
+
+The primary path is ``trending_counter``: an in-memory ``TrendingCounter``
+that is warmed from ``exercise_completions`` at startup, updated by every
+``/exercises/complete`` and re-synced periodically so completions handled by
+other workers show up too. It ranks by exponentially decayed score and
+answers from a cached top-K list, without touching the database.
+
+Until the counter is warm, counts come from the ``trending_exercises``
+Postgres function (see ``TRENDING_RPC_SQL``; print it with
+``python -m services.exercise_trending``) or, if that is not installed, a
+paged scan that reads only ``exercise_id``. Exercise details come from the
+in-memory ``exercise_catalog`` snapshot, so ranking a top-K never queries
+``exercises``.
+"""
+import asyncio
+import heapq
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config.database import supabase
+from config.settings import (
+    EXERCISE_TRENDING_HALF_LIFE_HOURS,
+    EXERCISE_TRENDING_PAGE_SIZE,
+    EXERCISE_TRENDING_RESYNC_SECONDS,
+    EXERCISE_TRENDING_RPC,
+    EXERCISE_TRENDING_TTL_SECONDS,
+    EXERCISE_TRENDING_WINDOW_DAYS,
+)
+from services.exercise_catalog import get_catalog
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+TRENDING_RPC_SQL = f"""
+create index if not exists exercise_completions_completed_at_idx
+    on exercise_completions (completed_at);
+
+create or replace function {EXERCISE_TRENDING_RPC}(since timestamptz, max_results integer default 10)
+returns table (exercise_id text, completions bigint)
+language sql stable as $$
+    select exercise_id::text, count(*) as completions
+    from exercise_completions
+    where completed_at >= since
+    group by exercise_id
+    order by completions desc, exercise_id
+    limit max_results;
+$$;
+
+create or replace function {EXERCISE_TRENDING_RPC}_hourly(since timestamptz)
+returns table (exercise_id text, hour timestamptz, completions bigint)
+language sql stable as $$
+    select exercise_id::text, date_trunc('hour', completed_at), count(*)
+    from exercise_completions
+    where completed_at >= since
+    group by 1, 2;
+$$;
+""".strip()
+
+# How long to stop trying the RPC after it turned out to be missing
+RPC_RETRY_SECONDS = 600
+
+trending_cache = TTLCache(maxsize=32, ttl=EXERCISE_TRENDING_TTL_SECONDS)
+_compute_lock = threading.Lock()
+_rpc_unavailable_until = 0.0
+
+
+def _count_via_rpc(since: str, limit: int) -> List[Tuple[str, int]]:
+    response = supabase.rpc(EXERCISE_TRENDING_RPC, {"since": since, "max_results": limit}).execute()
+    return [(str(row["exercise_id"]), int(row["completions"])) for row in response.data or []]
+
+
+def _count_via_scan(since: str, limit: int, page_size: int = EXERCISE_TRENDING_PAGE_SIZE) -> List[Tuple[str, int]]:
+    """Count completions client-side, paging on ``id`` and reading one column."""
+    counts: Counter = Counter()
+    last_id = None
+    while True:
+        query = supabase.table("exercise_completions")\
+            .select("id, exercise_id")\
+            .gte("completed_at", since)\
+            .order("id")\
+            .limit(page_size)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.execute().data or []
+        counts.update(str(row["exercise_id"]) for row in rows)
+        if len(rows) < page_size:
+            break
+        last_id = rows[-1]["id"]
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+def count_trending(limit: int, window_days: int = EXERCISE_TRENDING_WINDOW_DAYS,
+                   now: Optional[datetime] = None) -> List[Tuple[str, int]]:
+    """Top ``limit`` (exercise_id, completions) pairs over the window, most completed first."""
+    global _rpc_unavailable_until
+    since = ((now or datetime.now(timezone.utc)) - timedelta(days=window_days)).isoformat()
+    if time.monotonic() >= _rpc_unavailable_until:
+        try:
+            return _count_via_rpc(since, limit)
+        except Exception as e:
+            logger.warning(f"Trending RPC unavailable, counting client-side: {e}")
+            _rpc_unavailable_until = time.monotonic() + RPC_RETRY_SECONDS
+    return _count_via_scan(since, limit)
+
+
+class TrendingCounter:
+    """Sliding-window completion counts plus exponentially decayed scores.
+
+    Window counts live in a ring of hourly buckets (``window_hours`` slots) so
+    the "completions" figure stays a true rolling count. Ranking uses
+    decayed scores kept relative to a reference time: an increment adds
+    ``2 ** ((t - ref) / half_life)``, so older scores never need touching and
+    the order is the same as decaying everything to "now". The reference is
+    moved forward before the exponent can overflow.
+    """
+
+    RENORMALIZE_EXPONENT = 512
+
+    def __init__(self, window_hours: int = EXERCISE_TRENDING_WINDOW_DAYS * 24,
+                 half_life_hours: float = EXERCISE_TRENDING_HALF_LIFE_HOURS,
+                 now: Optional[datetime] = None):
+        self.window_hours = window_hours
+        self.half_life_seconds = half_life_hours * 3600.0
+        self._lock = threading.Lock()
+        self._bucket_hours: List[Optional[int]] = [None] * window_hours
+        self._buckets: List[Counter] = [Counter() for _ in range(window_hours)]
+        self._window_counts: Counter = Counter()
+        self._scores: Dict[str, float] = {}
+        self._reference = (now or datetime.now(timezone.utc)).timestamp()
+        self._current_hour = self._hour(self._reference)
+        self._ranking: Optional[List[Tuple[str, float, int]]] = None
+        self.warmed_at: Optional[datetime] = None
+
+    @staticmethod
+    def _hour(timestamp: float) -> int:
+        return int(timestamp // 3600)
+
+    def _advance(self, hour: int):
+        """Expire buckets that fell out of the window ending at ``hour``."""
+        if hour <= self._current_hour:
+            return
+        for stale in range(max(self._current_hour + 1, hour - self.window_hours + 1), hour + 1):
+            slot = stale % self.window_hours
+            if self._bucket_hours[slot] is not None:
+                self._window_counts.subtract(self._buckets[slot])
+                self._buckets[slot].clear()
+                self._bucket_hours[slot] = None
+        self._window_counts = +self._window_counts
+        self._scores = {key: self._scores[key] for key in self._window_counts}
+        self._current_hour = hour
+        self._ranking = None
+
+    def _weight(self, timestamp: float) -> float:
+        exponent = (timestamp - self._reference) / self.half_life_seconds
+        if exponent > self.RENORMALIZE_EXPONENT:
+            factor = 2.0 ** -exponent
+            self._scores = {key: score * factor for key, score in self._scores.items()}
+            self._reference = timestamp
+            exponent = 0.0
+        return 2.0 ** exponent
+
+    def record(self, exercise_id: str, completed_at: Optional[datetime] = None, count: int = 1):
+        """Count ``count`` completions of ``exercise_id`` at ``completed_at``."""
+        timestamp = (completed_at or datetime.now(timezone.utc)).timestamp()
+        hour = self._hour(timestamp)
+        exercise_id = str(exercise_id)
+        with self._lock:
+            self._advance(hour)
+            if hour <= self._current_hour - self.window_hours:
+                return
+            slot = hour % self.window_hours
+            self._bucket_hours[slot] = hour
+            self._buckets[slot][exercise_id] += count
+            self._window_counts[exercise_id] += count
+            self._scores[exercise_id] = self._scores.get(exercise_id, 0.0) + count * self._weight(timestamp)
+            self._ranking = None
+
+    def top(self, limit: int = 10, now: Optional[datetime] = None) -> List[Tuple[str, int]]:
+        """Top ``limit`` (exercise_id, window completions), ranked by decayed score."""
+        with self._lock:
+            self._advance(self._hour((now or datetime.now(timezone.utc)).timestamp()))
+            if self._ranking is None or len(self._ranking) < limit <= len(self._window_counts):
+                self._ranking = heapq.nlargest(
+                    max(limit, 50),
+                    ((exercise_id, self._scores[exercise_id], count) for exercise_id, count in self._window_counts.items()),
+                    key=lambda item: (item[1], item[0]),
+                )
+            ranking = self._ranking
+        return [(exercise_id, count) for exercise_id, _, count in ranking[:limit]]
+
+    def window_counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._window_counts)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "exercises": len(self._window_counts),
+                "window_completions": sum(self._window_counts.values()),
+                "window_hours": self.window_hours,
+                "half_life_hours": self.half_life_seconds / 3600.0,
+                "warmed_at": self.warmed_at.isoformat() if self.warmed_at else None,
+            }
+
+    @classmethod
+    def from_completions(cls, rows: Iterable[dict], now: Optional[datetime] = None, **kwargs) -> "TrendingCounter":
+        now = now or datetime.now(timezone.utc)
+        counter = cls(now=now - timedelta(hours=kwargs.get("window_hours", EXERCISE_TRENDING_WINDOW_DAYS * 24)), **kwargs)
+        for row in rows:
+            completed_at = datetime.fromisoformat(row["completed_at"].replace("Z", "+00:00"))
+            counter.record(row["exercise_id"], completed_at, row.get("completions", 1))
+        counter._advance(cls._hour(now.timestamp()))
+        counter.warmed_at = now
+        return counter
+
+
+def iter_window_completions(since: str, page_size: int = EXERCISE_TRENDING_PAGE_SIZE) -> Iterable[dict]:
+    """Completions since ``since`` as rows of exercise_id, completed_at (and completions).
+
+    Uses the hourly aggregate RPC when installed, else pages through the
+    table on ``id``. A failed RPC is not retried for ``RPC_RETRY_SECONDS``.
+    """
+    global _rpc_unavailable_until
+    if time.monotonic() >= _rpc_unavailable_until:
+        try:
+            response = supabase.rpc(f"{EXERCISE_TRENDING_RPC}_hourly", {"since": since}).execute()
+            yield from (
+                {"exercise_id": row["exercise_id"], "completed_at": row["hour"], "completions": int(row["completions"])}
+                for row in response.data or []
+            )
+            return
+        except Exception as e:
+            logger.warning(f"Hourly trending RPC unavailable, scanning completions: {e}")
+            _rpc_unavailable_until = time.monotonic() + RPC_RETRY_SECONDS
+
+    last_id = None
+    while True:
+        query = supabase.table("exercise_completions")\
+            .select("id, exercise_id, completed_at")\
+            .gte("completed_at", since)\
+            .order("id")\
+            .limit(page_size)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.execute().data or []
+        yield from rows
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]["id"]
+
+
+trending_counter: Optional[TrendingCounter] = None
+
+
+def warm_trending_counter(now: Optional[datetime] = None) -> TrendingCounter:
+    """Rebuild the counter from ``exercise_completions`` and swap it in."""
+    global trending_counter
+    now = now or datetime.now(timezone.utc)
+    since = (now - timedelta(days=EXERCISE_TRENDING_WINDOW_DAYS)).isoformat()
+    started = time.perf_counter()
+    counter = TrendingCounter.from_completions(iter_window_completions(since), now=now)
+    trending_counter = counter
+    logger.info(f"Trending counter warmed with {counter.stats()['window_completions']} completions "
+                f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return counter
+
+
+def record_trending_completion(exercise_id: str, completed_at: Optional[datetime] = None):
+    """Feed a new completion to the live counter, if it is warm."""
+    if trending_counter is not None:
+        trending_counter.record(exercise_id, completed_at)
+
+
+async def trending_sync_loop(interval: float = EXERCISE_TRENDING_RESYNC_SECONDS):
+    """Warm the counter, then re-sync it every ``interval`` seconds."""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, warm_trending_counter)
+        except Exception as e:
+            logger.error(f"Error warming trending counter: {e}")
+        await asyncio.sleep(interval)
+
+
+def hydrate_exercises(exercise_ids: List[str]) -> Dict[str, dict]:
+    """Exercise rows for ``exercise_ids`` keyed by id, from the catalog snapshot.
+
+    Exercises added since the catalog last reloaded are left out until the
+    next reload picks them up.
+    """
+    rows = get_catalog().rows
+    return {exercise_id: rows[exercise_id] for exercise_id in exercise_ids if exercise_id in rows}
+
+
+def get_trending(limit: int = 10) -> List[Tuple[dict, int]]:
+    """List of (exercise row, window completions), most trending first."""
+    if trending_counter is not None:
+        counts = trending_counter.top(limit)
+        exercises = hydrate_exercises([exercise_id for exercise_id, _ in counts])
+        return [(exercises[exercise_id], count) for exercise_id, count in counts if exercise_id in exercises]
+
+    cached = trending_cache.get(limit)
+    if cached is not None:
+        return cached
+    with _compute_lock:
+        # Another request may have filled the cache while we waited
+        cached = trending_cache.get(limit)
+        if cached is not None:
+            return cached
+        counts = count_trending(limit)
+        exercises = hydrate_exercises([exercise_id for exercise_id, _ in counts])
+        trending = [(exercises[exercise_id], count) for exercise_id, count in counts if exercise_id in exercises]
+        trending_cache.set(limit, trending)
+        return trending
+
+
+if __name__ == "__main__":
+    print(TRENDING_RPC_SQL)
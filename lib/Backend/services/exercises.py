@@ -1,108 +1,83 @@
-from fastapi import APIRouter, HTTPException, Query
-from supabase import create_client, Client
-from datetime import datetime, timedelta
-from typing import List, Optional
-import os
-import json
+from fastapi import APIRouter, HTTPException, Query, Request
+from datetime import datetime, timezone
+from typing import Optional
 import logging
+from fastapi.concurrency import run_in_threadpool
+from config.database import supabase
+from services.exercise_catalog import cached_json_response, exercise_payload, get_catalog
+from services.exercise_stats import EMPTY_STATS, read_user_stats, record_completion
+from services.exercise_trending import get_trending as get_trending_exercises, record_trending_completion
 
 logger = logging.getLogger(__name__)
 
-# Initialize Supabase from environment variables
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("SUPABASE_URL and SUPABASE_KEY environment variables are required")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 router = APIRouter(prefix="/exercises", tags=["exercises"])
 
 
 @router.get("/categories")
-async def get_categories():
+async def get_categories(request: Request):
     """
     Get all unique exercise categories from the exercises table.
-    Groups exercises by category_name.
+    Groups exercises by category_name. Served from the catalog cache.
     """
     try:
-        response = supabase.table("exercises")\
-            .select("category_name, category_image_path")\
-            .filter("is_active", "eq", True)\
-            .execute()
-        
-        if not response.data:
-            return []
-        
-        # Group by category
-        categories = {}
-        for exercise in response.data:
-            cat_name = exercise["category_name"]
-            if cat_name not in categories:
-                categories[cat_name] = {
-                    "id": cat_name.lower().replace(" ", "-"),
-                    "name": cat_name,
-                    "image_path": exercise["category_image_path"],
-                    "exercises": []
-                }
-        
-        return list(categories.values())
+        catalog = await run_in_threadpool(get_catalog)
+        return cached_json_response(request, catalog.categories)
     except Exception as e:
         logger.error(f"Error fetching categories: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch categories: {str(e)}")
 
 
 @router.get("/category/{category_id}")
-async def get_exercises_by_category(category_id: str):
+async def get_exercises_by_category(category_id: str, request: Request):
     """
     Get all exercises for a specific category.
     category_id is converted from kebab-case to Title Case.
     """
     try:
-        # Convert category_id from kebab-case to Title Case
-        category_name = category_id.replace("-", " ").title()
-        
-        response = supabase.table("exercises")\
-            .select("*")\
-            .filter("category_name", "eq", category_name)\
-            .filter("is_active", "eq", True)\
-            .execute()
-        
-        if not response.data:
-            return []
-        
-        exercises = []
-        for ex in response.data:
-            # Parse chat_flow if it's a string
-            chat_flow = ex.get("chat_flow", [])
-            if isinstance(chat_flow, str):
-                try:
-                    chat_flow = json.loads(chat_flow)
-                except json.JSONDecodeError:
-                    chat_flow = []
-            
-            exercises.append({
-                "id": ex["id"],
-                "name": ex["exercise_name"],
-                "duration": ex["duration"],
-                "category": ex["category_name"],
-                "category_image_path": ex["category_image_path"],
-                "description": ex["exercise_description"],
-                "chat_flow": chat_flow
-            })
-        
-        return exercises
+        catalog = await run_in_threadpool(get_catalog)
+        return cached_json_response(request, catalog.category(category_id))
     except Exception as e:
         logger.error(f"Error fetching exercises by category: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch exercises: {str(e)}")
 
 
+@router.get("/trending")
+async def get_trending(limit: int = Query(10)):
+    """
+    Get trending exercises based on completion count.
+    Returns the most completed exercises in the last 7 days.
+    Registered before /{exercise_id} so "trending" is not taken as an id.
+    """
+    try:
+        trending = await run_in_threadpool(get_trending_exercises, limit)
+        
+        if not trending:
+            # Return all exercises if no completions
+            all_response = supabase.table("exercises")\
+                .select("*")\
+                .filter("is_active", "eq", True)\
+                .limit(limit)\
+                .execute()
+            return all_response.data if all_response.data else []
+        
+        return [exercise_payload(ex, completions=count) for ex, count in trending]
+    except Exception as e:
+        logger.error(f"Error fetching trending exercises: {str(e)}")
+        return []
+
+
 @router.get("/{exercise_id}")
-async def get_exercise(exercise_id: str):
+async def get_exercise(exercise_id: str, request: Request):
     """
     Get a single exercise by ID with its full chat flow.
     """
     try:
+        catalog = await run_in_threadpool(get_catalog)
+        rendered = catalog.exercise_bodies.get(exercise_id)
+        if rendered is not None:
+            return cached_json_response(request, rendered)
+        
+        # Not in the snapshot yet (added since the last poll): read through
         response = supabase.table("exercises")\
             .select("*")\
             .eq("id", exercise_id)\
@@ -111,25 +86,7 @@ async def get_exercise(exercise_id: str):
         if not response.data:
             raise HTTPException(status_code=404, detail="Exercise not found")
         
-        ex = response.data[0]
-        
-        # Parse chat_flow if it's a string
-        chat_flow = ex.get("chat_flow", [])
-        if isinstance(chat_flow, str):
-            try:
-                chat_flow = json.loads(chat_flow)
-            except json.JSONDecodeError:
-                chat_flow = []
-        
-        return {
-            "id": ex["id"],
-            "name": ex["exercise_name"],
-            "duration": ex["duration"],
-            "category": ex["category_name"],
-            "category_image_path": ex["category_image_path"],
-            "description": ex["exercise_description"],
-            "chat_flow": chat_flow
-        }
+        return exercise_payload(response.data[0])
     except HTTPException:
         raise
     except Exception as e:
@@ -141,7 +98,7 @@ async def get_exercise(exercise_id: str):
 async def log_completion(completion_data: dict):
     """
     Log an exercise completion for a user.
-    Accepts JSON body with: user_id, exercise_id, duration_seconds
+    Accepts JSON body with: user_id, exercise_id, duration_seconds and optional tz
     """
     try:
         user_id = completion_data.get("user_id")
@@ -161,13 +118,22 @@ async def log_completion(completion_data: dict):
             raise HTTPException(status_code=404, detail="Exercise not found")
         
         # Insert completion record
+        completed_at = datetime.now(timezone.utc)
         supabase.table("exercise_completions").insert({
             "user_id": user_id,
             "exercise_id": exercise_id,
             "duration_seconds": duration_seconds,
-            "completed_at": datetime.now().isoformat()
+            "completed_at": completed_at.isoformat()
         }).execute()
         
+        record_trending_completion(exercise_id, completed_at)
+        
+        # Keep the materialized stats in step; a failure here must not lose the completion
+        try:
+            await run_in_threadpool(record_completion, user_id, completed_at, duration_seconds, completion_data.get("tz"))
+        except Exception as e:
+            logger.error(f"Error updating exercise stats for user {user_id}: {str(e)}")
+        
         return {"success": True, "message": "Completion logged successfully"}
     except HTTPException:
         raise
@@ -177,134 +143,15 @@ async def log_completion(completion_data: dict):
 
 
 @router.get("/user/{user_id}/stats")
-async def get_user_stats(user_id: str):
+async def get_user_stats(user_id: str, tz: Optional[str] = Query(None)):
     """
     Get comprehensive exercise statistics for a user.
     Returns: completed_today, total_duration, weekly_average, streak
+    Days are bucketed in ``tz`` (IANA name or UTC offset such as "+05:30").
     """
     try:
-        today = datetime.now().date()
-        week_ago = today - timedelta(days=7)
-        
-        # Get today's completions
-        today_response = supabase.table("exercise_completions")\
-            .select("duration_seconds")\
-            .filter("user_id", "eq", user_id)\
-            .gte("completed_at", f"{today}T00:00:00")\
-            .execute()
-        
-        today_data = today_response.data if today_response.data else []
-        completed_today = len(today_data)
-        total_duration = sum(ex.get("duration_seconds") or 0 for ex in today_data)
-        
-        # Get weekly data for average
-        week_response = supabase.table("exercise_completions")\
-            .select("completed_at")\
-            .filter("user_id", "eq", user_id)\
-            .gte("completed_at", f"{week_ago}T00:00:00")\
-            .execute()
-        
-        week_data = week_response.data if week_response.data else []
-        weekly_average = len(week_data) / 7.0 if week_data else 0.0
-        
-        # Calculate streak
-        streak = 0
-        current_date = today
-        
-        while True:
-            start_of_day = f"{current_date}T00:00:00"
-            end_of_day = f"{current_date + timedelta(days=1)}T00:00:00"
-            
-            check_response = supabase.table("exercise_completions")\
-                .select("id")\
-                .filter("user_id", "eq", user_id)\
-                .gte("completed_at", start_of_day)\
-                .lt("completed_at", end_of_day)\
-                .execute()
-            
-            if not check_response.data or len(check_response.data) == 0:
-                break
-            
-            streak += 1
-            current_date = current_date - timedelta(days=1)
-        
-        return {
-            "completed_today": completed_today,
-            "total_duration": total_duration,
-            "weekly_average": round(weekly_average, 2),
-            "streak": streak
-        }
+        return await run_in_threadpool(read_user_stats, user_id, tz)
     except Exception as e:
         logger.error(f"Error fetching user stats: {str(e)}")
         # Return default stats on error
-        return {
-            "completed_today": 0,
-            "total_duration": 0,
-            "weekly_average": 0.0,
-            "streak": 0
-        }
-
-
-@router.get("/trending")
-async def get_trending(limit: int = Query(10)):
-    """
-    Get trending exercises based on completion count.
-    Returns the most completed exercises in the last 7 days.
-    """
-    try:
-        week_ago = (datetime.now() - timedelta(days=7)).isoformat()
-        
-        response = supabase.table("exercise_completions")\
-            .select("exercise_id")\
-            .gte("completed_at", week_ago)\
-            .execute()
-        
-        if not response.data:
-            # Return all exercises if no completions
-            all_response = supabase.table("exercises")\
-                .select("*")\
-                .filter("is_active", "eq", True)\
-                .limit(limit)\
-                .execute()
-            return all_response.data if all_response.data else []
-        
-        # Count occurrences
-        count_map = {}
-        for completion in response.data:
-            ex_id = completion["exercise_id"]
-            count_map[ex_id] = count_map.get(ex_id, 0) + 1
-        
-        # Get exercise details for top exercises
-        trending_ids = sorted(count_map.items(), key=lambda x: x[1], reverse=True)[:limit]
-        
-        trending_exercises = []
-        for ex_id, count in trending_ids:
-            ex_response = supabase.table("exercises")\
-                .select("*")\
-                .eq("id", ex_id)\
-                .execute()
-            
-            if ex_response.data:
-                ex = ex_response.data[0]
-                chat_flow = ex.get("chat_flow", [])
-                if isinstance(chat_flow, str):
-                    try:
-                        chat_flow = json.loads(chat_flow)
-                    except json.JSONDecodeError:
-                        chat_flow = []
-                
-                trending_exercises.append({
-                    "id": ex["id"],
-                    "name": ex["exercise_name"],
-                    "duration": ex["duration"],
-                    "category": ex["category_name"],
-                    "category_image_path": ex["category_image_path"],
-                    "description": ex["exercise_description"],
-                    "completions": count,
-                    "chat_flow": chat_flow
-                })
-        
-        return trending_exercises
-    except Exception as e:
-        logger.error(f"Error fetching trending exercises: {str(e)}")
-        return []
+        return dict(EMPTY_STATS)
@@ -1,29 +1,133 @@
 # recommendations.py
 import os
 import re
-import uuid
 import json
 import time
-from collections import defaultdict
+import asyncio
+import hashlib
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Optional
 
-import groq
-from supabase import create_client, Client
+
+from config.database import insert_rows_in_chunks, supabase
+from config.settings import (
+    ENTERTAINMENT_FINGERPRINT_TTL_SECONDS,
+    ENTERTAINMENT_INSERT_CHUNK_SIZE,
+    PREDICTION_CACHE_DB,
+    PREDICTION_CACHE_SIZE,
+    PREDICTION_CACHE_TTL_SECONDS,
+    RECOMMENDATION_FANOUT_WORKERS,
+    RECOMMENDATION_VIEW_CACHE_SIZE,
+    RECOMMENDATION_VIEW_TTL_SECONDS,
+)
+from core.llm_gateway import get_llm_gateway
+from services.doctor_allocator import doctor_allocator
+from services.reference_data import reference_data
+from utils.cache import SQLiteCache, TieredCache, TTLCache
+from utils.keyword_matcher import KeywordMatcher
 
 # config/settings can provide constants, fallback to env
 try:
-    from config.settings import SUPABASE_URL, SUPABASE_KEY, GROQ_API_KEY  # type: ignore
+    from config.settings import GROQ_API_KEY  # type: ignore
 except Exception:
-    SUPABASE_URL = os.environ.get("SUPABASE_URL")
-    SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
     GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set (env or config.settings)")
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+# mapping common words/phrases to canonical labels (first match wins)
+LABEL_KEYWORDS = {
+    "happy": "happy/positive",
+    "positive": "happy/positive",
+    "joy": "happy/positive",
+    "grateful": "happy/positive",
+    "blessed": "happy/positive",
+    "amazing": "happy/positive",
+    "great": "happy/positive",
+    "excited": "excited/energetic",
+    "energetic": "excited/energetic",
+    "anxious": "stressed/anxious",
+    "anxiety": "stressed/anxious",
+    "stressed": "stressed/anxious",
+    "panic": "stressed/anxious",
+    "worried": "stressed/anxious",
+    "depress": "depressed/sad",
+    "depressed": "depressed/sad",
+    "sad": "depressed/sad",
+    "hopeless": "depressed/sad",
+    "angry": "angry/frustrated",
+    "frustrated": "angry/frustrated",
+    "frustration": "angry/frustrated",
+    "irritated": "angry/frustrated",
+    "neutral": "neutral/calm",
+    "calm": "neutral/calm",
+    "confused": "confused/uncertain",
+    "uncertain": "confused/uncertain",
+    "unsure": "confused/uncertain",
+}
+
+# phrase-based overrides, consulted after LABEL_KEYWORDS
+LABEL_PHRASES = {
+    "life feels amazing": "happy/positive",
+    "i feel amazing": "happy/positive",
+    "i feel great": "happy/positive",
+    "i feel good": "happy/positive",
+    "i can't calm": "stressed/anxious",
+    "i'm overwhelmed": "stressed/anxious",
+    "i am overwhelmed": "stressed/anxious",
+    "i'm hopeless": "depressed/sad",
+    "i don't know what to do": "confused/uncertain",
+}
+
+# heuristic phrase checks (exact-ish): phrase -> (label, confidence)
+HEURISTIC_PHRASES = {
+    "life feels amazing": ("happy/positive", 0.95),
+    "i feel amazing": ("happy/positive", 0.95),
+    "i feel great": ("happy/positive", 0.92),
+    "i feel good": ("happy/positive", 0.9),
+    "i feel hopeless": ("depressed/sad", 0.95),
+    "i can't calm": ("stressed/anxious", 0.95),
+    "i'm overwhelmed": ("stressed/anxious", 0.93),
+    "i am overwhelmed": ("stressed/anxious", 0.93),
+    "i don't know what to do": ("confused/uncertain", 0.85),
+}
+
+# heuristic keyword checks: (keywords list, label, confidence)
+HEURISTIC_CHECKS = [
+    (["hopeless", "depress", "sad", "cry", "crying", "empty", "lonely", "worthless", "numb", "low energy"], "depressed/sad", 0.9),
+    (["panic attack", "panic", "anxiety", "anxious", "worried", "worry", "nervous", "racing", "heart racing", "can't calm", "overwhelmed", "overwhelming"], "stressed/anxious", 0.92),
+    (["angry", "furious", "annoyed", "irritated", "frustrat", "mad", "fed up", "rage", "hate this", "ridiculous"], "angry/frustrated", 0.88),
+    (["excited", "can't wait", "eager", "energ", "enthusiastic", "thrilled", "pumped", "hyped"], "excited/energetic", 0.9),
+    (["happy", "joy", "smile", "smiling", "amazing", "best", "great", "wonderful", "perfect", "success", "achievement", "blessed", "grateful"], "happy/positive", 0.92),
+    (["stress", "stressed", "deadline", "pressure", "burned out", "burnout", "stretched thin", "tense"], "stressed/anxious", 0.85),
+    (["not sure", "unsure", "confused", "confus", "uncertain", "don't know", "what should", "should i", "can't decide", "mixed feelings", "need clarity"], "confused/uncertain", 0.78),
+    (["fine", "okay", "ok", "normal day", "routine", "chill", "calm", "neutral", "just here", "doing ok"], "neutral/calm", 0.75),
+]
+
+# Compiled once at import; each lookup is a single pass over the text
+_LABEL_MATCHER = KeywordMatcher(
+    list(LABEL_KEYWORDS.items()) + list(LABEL_PHRASES.items())
+)
+_HEURISTIC_MATCHER = KeywordMatcher(
+    [(phrase, ("phrase", label, conf)) for phrase, (label, conf) in HEURISTIC_PHRASES.items()]
+    + [(kw, ("keyword", label, conf)) for keywords, label, conf in HEURISTIC_CHECKS for kw in keywords]
+)
+
+
+# Cache of LLM predictions keyed on normalized text + model + prompt version.
+# Heuristic fallbacks are never cached so a later call can still reach the LLM.
+prediction_cache = TieredCache(
+    TTLCache(maxsize=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL_SECONDS),
+    SQLiteCache(PREDICTION_CACHE_DB, ttl=PREDICTION_CACHE_TTL_SECONDS, table="predictions")
+    if PREDICTION_CACHE_DB else None,
+)
+
+
+def normalize_message(text: str) -> str:
+    """Fold case, whitespace and trailing punctuation so near-identical messages share a key."""
+    return re.sub(r"\s+", " ", (text or "").lower()).strip().rstrip(".!?~ ")
 
 
 class GroqMentalStatePredictor:
@@ -32,11 +136,16 @@ class GroqMentalStatePredictor:
     heuristic fallback if LLM fails or returns unexpected output.
     """
 
+    MODEL = "llama-3.1-8b-instant"
+    # Bump whenever the prompts or label set change so stale cache entries are ignored
+    PROMPT_VERSION = "v1"
+
     def __init__(self, api_key: Optional[str] = None):
         api_key = api_key or GROQ_API_KEY or os.environ.get("GROQ_API_KEY")
         if not api_key:
             raise ValueError("GROQ_API_KEY environment variable is not set")
-        self.client = groq.Client(api_key=api_key)
+        # Predictors with the same key share one pooled gateway
+        self.llm = get_llm_gateway(api_key)
         self.mental_conditions = [
             "happy/positive",
             "stressed/anxious",
@@ -74,7 +183,7 @@ Confidence: a number between 0.70 and 1.00
     def _safe_parse_json(self, raw: str) -> Optional[Dict]:
         """
         Try to parse JSON robustly. Accept raw JSON or a JSON object embedded
-        inside text (use regex to find {...}).
+        inside text (the outermost {...}).
         """
         if not raw:
             return None
@@ -87,10 +196,10 @@ Confidence: a number between 0.70 and 1.00
         except Exception:
             pass
 
-        # Try to extract first JSON object in string
-        match = re.search(r"(\{(?:[^{}]|(?R))*\})", raw, flags=re.DOTALL)
-        if match:
-            candidate = match.group(1)
+        # Try to extract the outermost JSON object embedded in the string
+        start, end = raw.find("{"), raw.rfind("}")
+        if 0 <= start < end:
+            candidate = raw[start:end + 1]
             try:
                 obj = json.loads(candidate)
                 if isinstance(obj, dict):
@@ -109,59 +218,8 @@ Confidence: a number between 0.70 and 1.00
         if p in self.mental_conditions:
             return p
 
-        # mapping common words/phrases to canonical labels
-        mapping = {
-            "happy": "happy/positive",
-            "positive": "happy/positive",
-            "joy": "happy/positive",
-            "grateful": "happy/positive",
-            "blessed": "happy/positive",
-            "amazing": "happy/positive",
-            "great": "happy/positive",
-            "excited": "excited/energetic",
-            "energetic": "excited/energetic",
-            "anxious": "stressed/anxious",
-            "anxiety": "stressed/anxious",
-            "stressed": "stressed/anxious",
-            "panic": "stressed/anxious",
-            "worried": "stressed/anxious",
-            "depress": "depressed/sad",
-            "depressed": "depressed/sad",
-            "sad": "depressed/sad",
-            "hopeless": "depressed/sad",
-            "angry": "angry/frustrated",
-            "frustrated": "angry/frustrated",
-            "frustration": "angry/frustrated",
-            "irritated": "angry/frustrated",
-            "neutral": "neutral/calm",
-            "calm": "neutral/calm",
-            "confused": "confused/uncertain",
-            "uncertain": "confused/uncertain",
-            "unsure": "confused/uncertain",
-        }
-
-        # exact token or substring check
-        for k, v in mapping.items():
-            if k in p:
-                return v
-
-        # phrase-based overrides
-        phrase_map = {
-            "life feels amazing": "happy/positive",
-            "i feel amazing": "happy/positive",
-            "i feel great": "happy/positive",
-            "i feel good": "happy/positive",
-            "i can't calm": "stressed/anxious",
-            "i'm overwhelmed": "stressed/anxious",
-            "i am overwhelmed": "stressed/anxious",
-            "i'm hopeless": "depressed/sad",
-            "i don't know what to do": "confused/uncertain",
-        }
-        for phrase, label in phrase_map.items():
-            if phrase in p:
-                return label
-
-        return None
+        # mapping common words/phrases, then phrase-based overrides
+        return _LABEL_MATCHER.first(p)
 
     def heuristic_predict(self, text: str) -> Dict[str, float]:
         """
@@ -170,46 +228,17 @@ Confidence: a number between 0.70 and 1.00
         then positive/excited, then confusion, then neutral fallback.
         """
 
-        t = (text or "").lower().strip()
-
-        # phrase checks (exact-ish)
-        phrases = {
-            "life feels amazing": ("happy/positive", 0.95),
-            "i feel amazing": ("happy/positive", 0.95),
-            "i feel great": ("happy/positive", 0.92),
-            "i feel good": ("happy/positive", 0.9),
-            "i feel hopeless": ("depressed/sad", 0.95),
-            "i can't calm": ("stressed/anxious", 0.95),
-            "i'm overwhelmed": ("stressed/anxious", 0.93),
-            "i am overwhelmed": ("stressed/anxious", 0.93),
-            "i don't know what to do": ("confused/uncertain", 0.85),
-        }
-        for phrase, (label, conf) in phrases.items():
-            if phrase in t:
-                return {"prediction": label, "confidence": conf}
-
-        # keyword checks: (keywords list, label, confidence)
-        checks = [
-            (["hopeless", "depress", "sad", "cry", "crying", "empty", "lonely", "worthless", "numb", "low energy"], "depressed/sad", 0.9),
-            (["panic attack", "panic", "anxiety", "anxious", "worried", "worry", "nervous", "racing", "heart racing", "can't calm", "overwhelmed", "overwhelming"], "stressed/anxious", 0.92),
-            (["angry", "furious", "annoyed", "irritated", "frustrat", "mad", "fed up", "rage", "hate this", "ridiculous"], "angry/frustrated", 0.88),
-            (["excited", "can't wait", "eager", "energ", "enthusiastic", "thrilled", "pumped", "hyped"], "excited/energetic", 0.9),
-            (["happy", "joy", "smile", "smiling", "amazing", "best", "great", "wonderful", "perfect", "success", "achievement", "blessed", "grateful"], "happy/positive", 0.92),
-            (["stress", "stressed", "deadline", "pressure", "burned out", "burnout", "stretched thin", "tense"], "stressed/anxious", 0.85),
-            (["not sure", "unsure", "confused", "confus", "uncertain", "don't know", "what should", "should i", "can't decide", "mixed feelings", "need clarity"], "confused/uncertain", 0.78),
-            (["fine", "okay", "ok", "normal day", "routine", "chill", "calm", "neutral", "just here", "doing ok"], "neutral/calm", 0.75),
-        ]
-
-        # search for best match by priority/confidence
+        # one pass over the text finds every phrase and keyword that occurs
         best_label = None
         best_conf = 0.0
-        for keywords, label, conf in checks:
-            for kw in keywords:
-                if kw in t:
-                    if conf > best_conf:
-                        best_conf = conf
-                        best_label = label
-                    break
+        for kind, label, conf in _HEURISTIC_MATCHER.matches(text or ""):
+            # phrase checks (exact-ish) come first and win outright
+            if kind == "phrase":
+                return {"prediction": label, "confidence": conf}
+            # search for best match by priority/confidence
+            if conf > best_conf:
+                best_conf = conf
+                best_label = label
 
         if best_label:
             return {"prediction": best_label, "confidence": round(best_conf, 2)}
@@ -221,11 +250,21 @@ Confidence: a number between 0.70 and 1.00
         """
         Main prediction method: try Groq LLM first with a schema,
         then fallback to heuristic if LLM is unavailable or returns invalid output.
+        Blocking wrapper around ``apredict`` for synchronous callers.
         """
+        return self.llm.run(self.apredict(message))
+
+    async def apredict(self, message: str) -> Dict[str, float]:
+        """Async variant of ``predict`` that goes through the shared LLM gateway."""
         # quick heuristic guard for very short messages
         if not message or len(message.strip()) <= 2:
             return {"prediction": "neutral/calm", "confidence": 0.7}
 
+        cache_key = self.cache_key(message)
+        cached = prediction_cache.get(cache_key)
+        if cached:
+            return dict(cached)
+
         prompt = self._build_prompt(message)
 
         # Groq call with minimal retry
@@ -234,8 +273,8 @@ Confidence: a number between 0.70 and 1.00
         for attempt in range(2):  # 1 retry
             try:
                 # Request the model to return a JSON object; provide a schema too
-                response = self.client.chat.completions.create(
-                    model="llama-3.1-8b-instant",
+                response = await self.llm.acreate(
+                    model=self.MODEL,
                     messages=[{"role": "user", "content": prompt}],
                     temperature=0.25,
                     max_tokens=120,
@@ -262,31 +301,23 @@ Confidence: a number between 0.70 and 1.00
                     break
                 else:
                     # If not parsed, wait briefly and retry once
-                    time.sleep(0.3)
+                    await asyncio.sleep(0.3)
             except Exception as e:
                 # log and break to fallback
                 print(f"[Groq] attempt {attempt + 1} error: {e}")
                 raw = None
                 parsed = None
-                time.sleep(0.2)
+                await asyncio.sleep(0.2)
                 continue
 
         # If Groq produced a valid JSON parse, use it
         if parsed:
-            pred_raw = parsed.get("prediction")
-            conf_raw = parsed.get("confidence", 0.7)
-            normalized = self.normalize_prediction(pred_raw) or self.normalize_prediction(str(pred_raw or ""))
-            if normalized:
-                try:
-                    conf = float(conf_raw)
-                    conf = max(0.7, min(conf, 1.0))
-                except Exception:
-                    conf = 0.85
-                return {"prediction": normalized, "confidence": round(conf, 2)}
-            else:
-                # If the model returned an unexpected label, fall back to heuristic
-                print(f"[Groq] Unrecognized label from model: {pred_raw}; using heuristic fallback.")
-                return self.heuristic_predict(message)
+            result = self._result_from_parsed(parsed)
+            if result:
+                prediction_cache.set(cache_key, result)
+                return result
+            # If the model returned an unexpected label, fall back to heuristic
+            return self.heuristic_predict(message)
 
         # If parsing failed or Groq failed, fallback to heuristic
         if raw:
@@ -295,11 +326,211 @@ Confidence: a number between 0.70 and 1.00
             print("[Groq] No raw response; using heuristic fallback.")
         return self.heuristic_predict(message)
 
+    def cache_key(self, message: str) -> str:
+        raw = f"{self.MODEL}|{self.PROMPT_VERSION}|{normalize_message(message)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _result_from_parsed(self, parsed: Dict) -> Optional[Dict[str, float]]:
+        """Turn one parsed {"prediction", "confidence"} object into a result (None if unusable)."""
+        pred_raw = parsed.get("prediction")
+        conf_raw = parsed.get("confidence", 0.7)
+        normalized = self.normalize_prediction(pred_raw) or self.normalize_prediction(str(pred_raw or ""))
+        if normalized:
+            try:
+                conf = float(conf_raw)
+                conf = max(0.7, min(conf, 1.0))
+            except Exception:
+                conf = 0.85
+            return {"prediction": normalized, "confidence": round(conf, 2)}
+        print(f"[Groq] Unrecognized label from model: {pred_raw}; using heuristic fallback.")
+        return None
+
+    # ---------------- Batch classification ----------------
+
+    BATCH_SIZE = 8
+
+    def _build_batch_prompt(self, messages: List[str]) -> str:
+        conditions = ", ".join(self.mental_conditions)
+        numbered = "\n".join(f'{i}. "{m}"' for i, m in enumerate(messages, 1))
+        prompt = f"""
+Analyze each of the following messages independently and choose exactly ONE of these conditions for each:
+{conditions}
+
+Definitions (brief):
+- happy/positive: joy, gratitude, achievement, optimism
+- stressed/anxious: worry, pressure, panic, racing thoughts, overwhelm
+- depressed/sad: hopelessness, low energy, emptiness, loss of interest
+- angry/frustrated: irritation, anger, blame, strong negative reaction
+- neutral/calm: balanced mood, routine activities, no strong emotion
+- confused/uncertain: doubt, unclear thoughts, asking what to do
+- excited/energetic: high energy, eagerness, future-focused excitement
+
+Return EXACTLY a JSON object (no extra text) with one entry per message:
+{{"results": [{{"index": 1, "prediction": "<one of the conditions above>", "confidence": 0.XX}}, ...]}}
+
+Messages:
+{numbered}
+
+Confidence: a number between 0.70 and 1.00
+"""
+        return prompt
+
+    async def _classify_chunk(self, messages: List[str]) -> List[Dict[str, float]]:
+        """Classify one chunk with a single LLM call; unparseable items use the heuristic."""
+        by_index: Dict[int, Dict] = {}
+        try:
+            response = await self.llm.acreate(
+                model=self.MODEL,
+                messages=[{"role": "user", "content": self._build_batch_prompt(messages)}],
+                temperature=0.25,
+                max_tokens=40 * len(messages) + 40,
+                response_format={"type": "json_object"}
+            )
+            raw = getattr(response.choices[0].message, "content", None) or ""
+            parsed = self._safe_parse_json(raw) or {}
+            for item in parsed.get("results") or []:
+                try:
+                    by_index[int(item.get("index"))] = item
+                except Exception:
+                    continue
+        except Exception as e:
+            print(f"[Groq] batch of {len(messages)} error: {e}")
+
+        results = []
+        for i, message in enumerate(messages, 1):
+            result = self._result_from_parsed(by_index[i]) if i in by_index else None
+            if result:
+                prediction_cache.set(self.cache_key(message), result)
+            else:
+                result = self.heuristic_predict(message)
+            results.append(result)
+        return results
+
+    def predict_many(self, messages: List[str]) -> List[Dict[str, float]]:
+        """Classify many messages at once; results are in the same order as ``messages``."""
+        return self.llm.run(self.apredict_many(messages))
+
+    async def apredict_many(self, messages: List[str]) -> List[Dict[str, float]]:
+        """
+        Batch variant of ``apredict``: messages are packed BATCH_SIZE at a time
+        into one structured-JSON prompt and the chunks are classified concurrently.
+        """
+        results: List[Optional[Dict[str, float]]] = [None] * len(messages)
+        # cache misses grouped by key, so duplicates in one batch cost one slot
+        pending: Dict[str, List[int]] = {}
+        for i, message in enumerate(messages):
+            # same short-message guard as predict
+            if not message or len(message.strip()) <= 2:
+                results[i] = {"prediction": "neutral/calm", "confidence": 0.7}
+                continue
+            key = self.cache_key(message)
+            cached = prediction_cache.get(key) if key not in pending else None
+            if cached:
+                results[i] = dict(cached)
+            else:
+                pending.setdefault(key, []).append(i)
+
+        groups = list(pending.values())
+        chunks = [groups[i:i + self.BATCH_SIZE] for i in range(0, len(groups), self.BATCH_SIZE)]
+        chunk_results = await asyncio.gather(
+            *(self._classify_chunk([messages[group[0]] for group in chunk]) for chunk in chunks)
+        )
+        for chunk, chunk_result in zip(chunks, chunk_results):
+            for group, result in zip(chunk, chunk_result):
+                for i in group:
+                    results[i] = dict(result)
+        return results
+
 
 # --------------- Remaining system (unchanged logic, lightly cleaned) ---------------
 
-def analyze_user_mental_state(user_id: str) -> Optional[Dict]:
-    """Analyze user's mental state using Groq API (with heuristic fallback)."""
+REPORT_WINDOW = 20  # number of most recent messages a report is based on
+
+
+class ReportState:
+    """
+    Rolling per-user classification window used by incremental reports.
+    Keeps the last REPORT_WINDOW labels with running per-state counts, and
+    the checkpoint of the newest message already classified.
+    """
+
+    def __init__(self, window_size: int = REPORT_WINDOW):
+        self.window = deque(maxlen=window_size)  # (label, confidence) in message order
+        self.state_counts: Dict[str, int] = defaultdict(int)
+        self.last_message_id = None
+        self.last_created_at: Optional[str] = None
+
+    @property
+    def confidence_sum(self) -> float:
+        # Summed in window order rather than kept as a running total: add/subtract
+        # drift would otherwise change round(avg, 2) at half-cent boundaries
+        return sum(conf for _, conf in self.window)
+
+    def add(self, message: Dict, result: Dict[str, float]):
+        if len(self.window) == self.window.maxlen:
+            old_label, _ = self.window[0]
+            self.state_counts[old_label] -= 1
+            if not self.state_counts[old_label]:
+                del self.state_counts[old_label]
+        label, conf = result["prediction"], float(result["confidence"])
+        self.window.append((label, conf))
+        self.state_counts[label] += 1
+        # The checkpoint is the (created_at, id) pair of the newest classified message
+        if message.get("created_at"):
+            self.last_created_at = message["created_at"]
+            self.last_message_id = message.get("id")
+
+    def build_report(self, user_id: str) -> Dict:
+        total_messages = len(self.window)
+        avg_confidence = (self.confidence_sum / total_messages) if total_messages > 0 else 0.0
+        # distribution keyed in first-seen window order, so ties resolve like a full recompute
+        state_distribution = {label: self.state_counts[label] for label in dict.fromkeys(l for l, _ in self.window)}
+
+        dominant_state = None
+        if total_messages > 0:
+            dominant_state = max(state_distribution, key=state_distribution.get)
+            # require at least 25% of messages to be in one state to consider it dominant
+            if state_distribution[dominant_state] / total_messages < 0.25:
+                dominant_state = "mixed/no_clear_pattern"
+
+        return {
+            "user_id": user_id,
+            "total_messages_analyzed": total_messages,
+            "dominant_state": dominant_state or "mixed/no_clear_pattern",
+            "confidence": round(avg_confidence, 2),
+            "state_distribution": state_distribution,
+        }
+
+
+# Per-user rolling state for incremental reports (bounded, idle users expire)
+_report_states = TTLCache(maxsize=10000, ttl=7 * 24 * 3600)
+
+
+def fetch_messages_since(user_id: str, since: Optional[str] = None, since_id=None,
+                         limit: int = REPORT_WINDOW) -> List[Dict]:
+    """Newest ``limit`` messages after the ``(since, since_id)`` checkpoint, oldest first.
+
+    Messages are ordered by ``(created_at, id)`` and filtered with a keyset on
+    that pair, so messages sharing the checkpoint's timestamp are not skipped.
+    """
+    query = supabase.table("messages").select("id, message, created_at").eq("user_id", user_id)
+    if since and since_id is not None:
+        query = query.or_(f'created_at.gt."{since}",and(created_at.eq."{since}",id.gt."{since_id}")')
+    elif since:
+        query = query.gt("created_at", since)
+    response = query.order("created_at", desc=True).order("id", desc=True).limit(limit).execute()
+    return list(reversed(response.data or []))
+
+
+def analyze_user_mental_state(user_id: str, incremental: bool = False) -> Optional[Dict]:
+    """
+    Analyze user's mental state using Groq API (with heuristic fallback).
+    With ``incremental=True`` only messages newer than the user's checkpoint
+    are fetched and classified, and the rolling window is updated in place.
+    """
+    if incremental:
+        return _analyze_user_mental_state_incremental(user_id)
+
     predictor = GroqMentalStatePredictor()
 
     # Get user messages from Supabase
@@ -319,45 +550,66 @@ def analyze_user_mental_state(user_id: str) -> Optional[Dict]:
         timestamp = msg.get("created_at", "No timestamp")
         print(f"{i}. [{timestamp}] {msg.get('message', '')}")
 
-    state_counts = defaultdict(int)
-    confidence_sum = 0.0
-    recent_messages = messages[-20:]  # last 20 messages for analysis
+    state = ReportState()
+    recent_messages = messages[-REPORT_WINDOW:]  # last 20 messages for analysis
 
-    for i, msg in enumerate(recent_messages, 1):
-        text = msg.get("message", "") if isinstance(msg, dict) else str(msg)
-        result = predictor.predict(text)
-        state_counts[result["prediction"]] += 1
-        confidence_sum += float(result["confidence"])
+    texts = [msg.get("message", "") if isinstance(msg, dict) else str(msg) for msg in recent_messages]
+    results = predictor.predict_many(texts)
+
+    for i, (msg, result) in enumerate(zip(recent_messages, results), 1):
+        state.add(msg if isinstance(msg, dict) else {}, result)
         print(f"Message {i}: {result['prediction']} (confidence: {result['confidence']:.2f})")
 
-    total_messages = len(recent_messages)
-    avg_confidence = (confidence_sum / total_messages) if total_messages > 0 else 0.0
-
-    dominant_state = None
-    if total_messages > 0:
-        dominant_state = max(state_counts, key=state_counts.get)
-        # require at least 25% of messages to be in one state to consider it dominant
-        if state_counts[dominant_state] / total_messages < 0.25:
-            dominant_state = "mixed/no_clear_pattern"
-
-    report = {
-        "user_id": user_id,
-        "total_messages_analyzed": total_messages,
-        "dominant_state": dominant_state or "mixed/no_clear_pattern",
-        "confidence": round(avg_confidence, 2),
-        "state_distribution": dict(state_counts),
-    }
+    _report_states.set(user_id, state)
+    report = state.build_report(user_id)
+    _print_report(report)
+    _save_report(report)
+    return report
+
+
+def _analyze_user_mental_state_incremental(user_id: str) -> Optional[Dict]:
+    state = _report_states.get(user_id) or ReportState()
 
+    try:
+        new_messages = fetch_messages_since(user_id, state.last_created_at, state.last_message_id)
+    except Exception as e:
+        print(f"Error fetching messages: {e}")
+        return None
+
+    if not new_messages:
+        if not state.window:
+            print("No messages found for this user")
+            return None
+        # Nothing new since the last report: it is still current
+        return state.build_report(user_id)
+
+    print(f"\n📩 {len(new_messages)} new message(s) since last report")
+    predictor = GroqMentalStatePredictor()
+    results = predictor.predict_many([msg.get("message", "") for msg in new_messages])
+    for msg, result in zip(new_messages, results):
+        state.add(msg, result)
+        print(f"[{msg.get('created_at', 'No timestamp')}] {result['prediction']} (confidence: {result['confidence']:.2f})")
+
+    _report_states.set(user_id, state)
+    report = state.build_report(user_id)
+    _print_report(report)
+    _save_report(report)
+    return report
+
+
+def _print_report(report: Dict):
     print("\n🧠 Mental State Analysis Report")
-    print(f"👤 User: {user_id}")
+    print(f"👤 User: {report['user_id']}")
     print(f"🔍 Messages Analyzed: {report['total_messages_analyzed']}")
     print(f"📊 State Distribution: {report['state_distribution']}")
     print(f"🎯 Dominant State: {report['dominant_state'].upper()} ({report['confidence']:.0%} confidence)")
 
+
+def _save_report(report: Dict):
     # Save report to Supabase
     try:
         supabase.table("mental_state_reports").insert({
-            "user_id": user_id,
+            "user_id": report["user_id"],
             "report": json.dumps(report),
             "dominant_state": report["dominant_state"],
             "confidence": report["confidence"],
@@ -367,8 +619,6 @@ def analyze_user_mental_state(user_id: str) -> Optional[Dict]:
     except Exception as e:
         print(f"❌ Error saving report: {e}")
 
-    return report
-
 
 # The rest of your helper functions are kept intact, with minor defensive checks
 
@@ -390,8 +640,7 @@ def get_user_dominant_state(user_id):
 
 def get_all_doctors():
     try:
-        response = supabase.table("doctors").select("*").execute()
-        return response.data if response.data else []
+        return reference_data.all_rows("doctors")
     except Exception as e:
         print(f"Error fetching doctors: {e}")
         return []
@@ -399,66 +648,12 @@ def get_all_doctors():
 
 def get_doctors_by_dominant_state(dominant_state):
     try:
-        response = supabase.table("doctors").select("*").eq("dominant_state", dominant_state).execute()
-        if response.data:
-            return response.data
-        response = supabase.table("doctors").select("*").eq("dominant_state", "General").execute()
-        return response.data if response.data else []
+        return reference_data.rows_for("doctors", dominant_state) or reference_data.rows_for("doctors", "General")
     except Exception as e:
         print(f"Error fetching doctors by dominant state: {e}")
         return []
 
 
-def is_doctor_already_assigned(doctor_id):
-    try:
-        response = supabase.table("recommended_doctor").select("doctor_id").eq("doctor_id", doctor_id).execute()
-        return len(response.data) > 0
-    except Exception as e:
-        print(f"Error checking doctor assignment: {e}")
-        return False
-
-
-def store_recommended_doctor(user_id, doctor_id):
-    try:
-        response = supabase.table("recommended_doctor").insert({
-            "user_id": user_id,
-            "doctor_id": doctor_id
-        }).execute()
-        print(f"\n💾 Recommended doctor stored successfully for user {user_id}")
-        return response.data
-    except Exception as e:
-        print(f"Error storing recommended doctor: {e}")
-        return None
-
-
-def assign_best_available_doctor(user_id, matching_doctors):
-    try:
-        existing = (
-            supabase.table("recommended_doctor")
-            .select("doctor_id")
-            .eq("user_id", user_id)
-            .execute()
-        )
-        if existing.data:
-            doctor_id = existing.data[0]["doctor_id"]
-            doctor = next((d for d in matching_doctors if d.get("id") == doctor_id or d.get("id") == str(doctor_id)), None)
-            if doctor:
-                return doctor
-
-        sorted_doctors = sorted(matching_doctors, key=lambda x: 0 if x.get("dominant_state") != "General" else 1)
-        for doctor in sorted_doctors:
-            if not is_doctor_already_assigned(doctor.get("id")):
-                result = store_recommended_doctor(user_id, doctor.get("id"))
-                if result:
-                    print(f"\n✅ Assigned Dr. {doctor.get('name')} to user {user_id}")
-                    return doctor
-        print(f"\n❌ No available doctors found for user {user_id}")
-        return None
-    except Exception as e:
-        print(f"Error assigning doctor: {e}")
-        return None
-
-
 def display_doctors(doctors, title="ALL DOCTORS"):
     print(f"\n{title}")
     print("=" * 70)
@@ -476,33 +671,74 @@ def display_doctors(doctors, title="ALL DOCTORS"):
 
 def get_entertainments_by_dominant_state(dominant_state):
     try:
-        response = supabase.table('entertainments') \
-            .select('id, title, type, dominant_state, cover_img_url, description, media_file_url') \
-            .eq('dominant_state', dominant_state) \
-            .execute()
-        return response.data if response.data else []
+        return reference_data.rows_for('entertainments', dominant_state)
     except Exception as e:
         print(f"Error fetching entertainments: {e}")
         return []
 
 
-def store_recommended_entertainments(user_id, entertainments, dominant_state):
-    recommendations_stored = 0
-    for entertainment in entertainments:
-        try:
-            recommendation_data = {
-                'id': str(uuid.uuid4()),
-                'user_id': user_id,
-                'entertainment_id': entertainment['id'],
-                'recommended_at': datetime.now().isoformat(),
-                'matched_state': dominant_state
-            }
-            supabase.table('recommended_entertainments').insert(recommendation_data).execute()
-            recommendations_stored += 1
-            print(f"     ✅ Stored {entertainment.get('title', 'Untitled')} recommendation")
-        except Exception as insert_error:
-            print(f"     ❌ Failed to store {entertainment.get('title', 'Untitled')} recommendation: {insert_error}")
-    return recommendations_stored
+RECOMMENDED_ENTERTAINMENTS_KEY = "user_id,entertainment_id,matched_state"
+
+RECOMMENDED_ENTERTAINMENTS_SQL = """
+-- Keep the newest row per (user_id, entertainment_id, matched_state) before adding the unique index
+delete from recommended_entertainments a
+using recommended_entertainments b
+where a.user_id = b.user_id
+  and a.entertainment_id = b.entertainment_id
+  and a.matched_state = b.matched_state
+  and (a.recommended_at, a.id::text) < (b.recommended_at, b.id::text);
+alter table recommended_entertainments alter column id set default gen_random_uuid();
+create unique index if not exists recommended_entertainments_user_entertainment_state_key
+    on recommended_entertainments (user_id, entertainment_id, matched_state);
+""".strip()
+
+# user_id -> (fingerprint of the last stored set, its recommended_at)
+_entertainment_fingerprints = TTLCache(maxsize=10000, ttl=ENTERTAINMENT_FINGERPRINT_TTL_SECONDS)
+
+
+def entertainment_fingerprint(dominant_state, entertainment_ids) -> str:
+    """Digest of a user's recommendation set: the state plus the sorted entertainment ids."""
+    digest = hashlib.sha1(str(dominant_state).encode("utf-8"))
+    for entertainment_id in sorted(str(i) for i in entertainment_ids):
+        digest.update(b"\0" + entertainment_id.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def store_recommended_entertainments(user_id, entertainments, dominant_state, force: bool = False):
+    """Upsert the recommendations in one batched write; reports rows that failed.
+
+    Rows are keyed on (user_id, entertainment_id, matched_state), so a repeat
+    call refreshes ``recommended_at`` instead of adding rows. When the state
+    and matching set are unchanged since this worker last stored them, the
+    write is skipped entirely (``skipped`` in the result).
+    """
+    # One row per entertainment: a statement cannot upsert the same key twice
+    entertainment_ids = list(dict.fromkeys(entertainment['id'] for entertainment in entertainments))
+    fingerprint = entertainment_fingerprint(dominant_state, entertainment_ids)
+    previous = _entertainment_fingerprints.get(user_id)
+    if not force and previous and previous[0] == fingerprint:
+        return {"stored": 0, "failed": [], "recommended_at": previous[1], "skipped": True}
+
+    recommended_at = datetime.now().isoformat()
+    rows = [
+        {
+            'user_id': user_id,
+            'entertainment_id': entertainment_id,
+            'recommended_at': recommended_at,
+            'matched_state': dominant_state
+        }
+        for entertainment_id in entertainment_ids
+    ]
+    result = insert_rows_in_chunks('recommended_entertainments', rows, ENTERTAINMENT_INSERT_CHUNK_SIZE,
+                                   on_conflict=RECOMMENDED_ENTERTAINMENTS_KEY)
+    failed = [{"entertainment_id": f["row"]["entertainment_id"], "error": f["error"]} for f in result["failed"]]
+    if failed:
+        print(f"     ❌ Failed to store {len(failed)} of {len(rows)} recommendations: {failed[0]['error']}")
+    else:
+        # Only a fully stored set may be skipped next time
+        _entertainment_fingerprints.set(user_id, (fingerprint, recommended_at))
+        print(f"     ✅ Stored {len(rows)} recommendations")
+    return {"stored": len(result["stored"]), "failed": failed, "recommended_at": recommended_at, "skipped": False}
 
 
 def display_entertainments(entertainments, title="RECOMMENDED ENTERTAINMENTS"):
@@ -541,20 +777,133 @@ def display_stored_recommendations(user_id):
         print(f"Error fetching stored recommendations: {e}")
 
 
+class StageTimings:
+    """Count, total and worst latency per pipeline stage (milliseconds)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, List[float]] = {}
+
+    def record(self, stage: str, elapsed_ms: float):
+        with self._lock:
+            entry = self._stages.setdefault(stage, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed_ms
+            entry[2] = max(entry[2], elapsed_ms)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                stage: {"count": count, "avg_ms": round(total / count, 2), "max_ms": round(worst, 2)}
+                for stage, (count, total, worst) in self._stages.items()
+            }
+
+
+recommendation_timings = StageTimings()
+# Bounded pool for the doctor and entertainment branches; callers already run in worker threads
+_fanout_pool = ThreadPoolExecutor(max_workers=RECOMMENDATION_FANOUT_WORKERS, thread_name_prefix="recommendations")
+
+
+def _timed(stage: str, timings: Dict[str, float], fn, *args):
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        timings[stage] = round(elapsed_ms, 2)
+        recommendation_timings.record(stage, elapsed_ms)
+
+
+def _entertainment_branch(user_id: str, dominant_state: str, timings: Dict[str, float]) -> List[Dict]:
+    entertainments = _timed("entertainments.fetch", timings, get_entertainments_by_dominant_state, dominant_state)
+    if entertainments:
+        _timed("entertainments.store", timings, store_recommended_entertainments, user_id, entertainments, dominant_state)
+    return entertainments
+
+
+def _doctor_branch(user_id: str, dominant_state: str, timings: Dict[str, float]) -> List[Dict]:
+    try:
+        assigned_doctor = _timed("doctor.allocate", timings, doctor_allocator.allocate, user_id, dominant_state)
+    except Exception as e:
+        print(f"Error assigning doctor: {e}")
+        return []
+    return [assigned_doctor] if assigned_doctor else []
+
+
 def get_all_recommendations(user_id: str) -> Dict:
-    dominant_state = get_user_dominant_state(user_id)
+    """Assign a doctor and store entertainments for the user's current state.
+
+    Once the state is known, the doctor and entertainment branches run
+    concurrently on a bounded pool, so the call takes about as long as the
+    slower branch. Per-stage timings are returned in ``timings_ms`` and
+    aggregated in ``recommendation_timings``.
+    """
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+    dominant_state = _timed("state", timings, get_user_dominant_state, user_id)
     if not dominant_state:
-        return {"doctors": [], "entertainments": []}
-    doctors = get_doctors_by_dominant_state(dominant_state)
-    entertainments = get_entertainments_by_dominant_state(dominant_state)
-    if entertainments:
-        store_recommended_entertainments(user_id, entertainments, dominant_state)
-    assigned_doctor = None
-    if doctors:
-        assigned_doctor_obj = assign_best_available_doctor(user_id, doctors)
-        if assigned_doctor_obj:
-            assigned_doctor = [assigned_doctor_obj]
-    return {"doctors": assigned_doctor if assigned_doctor else [], "entertainments": entertainments}
+        return {"doctors": [], "entertainments": [], "timings_ms": timings}
+    doctor_future = _fanout_pool.submit(_doctor_branch, user_id, dominant_state, timings)
+    entertainment_future = _fanout_pool.submit(_entertainment_branch, user_id, dominant_state, timings)
+    entertainments = entertainment_future.result()
+    doctors = doctor_future.result()
+    total_ms = (time.perf_counter() - started) * 1000
+    timings["total"] = round(total_ms, 2)
+    recommendation_timings.record("total", total_ms)
+    return {"doctors": doctors, "entertainments": entertainments, "timings_ms": timings}
+
+
+# user_id -> ((latest report id, assigned doctor id), view)
+_recommendation_views = TTLCache(maxsize=RECOMMENDATION_VIEW_CACHE_SIZE, ttl=RECOMMENDATION_VIEW_TTL_SECONDS)
+
+
+def get_latest_report(user_id) -> Optional[Dict]:
+    """The user's newest mental_state_reports row (id and dominant_state only)."""
+    response = (
+        supabase.table("mental_state_reports")
+        .select("id, dominant_state")
+        .eq("user_id", user_id)
+        .order("created_at", desc=True)
+        .limit(1)
+        .execute()
+    )
+    return response.data[0] if response.data else None
+
+
+def read_recommendations(user_id: str) -> Dict:
+    """Current dominant state, assigned doctor and matching entertainments; writes nothing.
+
+    The view is cached per user and reused while the latest report id and
+    the assigned doctor are unchanged. Every read looks up the latest report
+    (one indexed query); the doctor comes from the in-memory index, plus one
+    ``recommended_doctor`` lookup for a user the index has no doctor for,
+    whose negative answer is then cached (see ``DoctorAllocator.assigned_doctor``).
+    Assigning a doctor and storing entertainments is left to
+    ``refresh_recommendations``.
+    """
+    report = get_latest_report(user_id)
+    if not report:
+        return {"dominant_state": None, "report_id": None, "doctors": [], "entertainments": []}
+    doctor = doctor_allocator.assigned_doctor(user_id)
+    key = (report["id"], doctor.get("id") if doctor else None)
+    cached = _recommendation_views.get(user_id)
+    if cached and cached[0] == key:
+        return cached[1]
+    view = {
+        "dominant_state": report["dominant_state"],
+        "report_id": report["id"],
+        "doctors": [doctor] if doctor else [],
+        "entertainments": get_entertainments_by_dominant_state(report["dominant_state"]),
+    }
+    _recommendation_views.set(user_id, (key, view))
+    return view
+
+
+def refresh_recommendations(user_id: str) -> Dict:
+    """Run the write side (doctor assignment, stored entertainments), then return the fresh view."""
+    get_all_recommendations(user_id)
+    _recommendation_views.delete(user_id)
+    return read_recommendations(user_id)
 
 
 def recommend_doctors(user_id, dominant_state):
@@ -563,7 +912,11 @@ def recommend_doctors(user_id, dominant_state):
         print(f"🧠 User's dominant mental state: {dominant_state.upper()}")
         matching_doctors = get_doctors_by_dominant_state(dominant_state)
         if matching_doctors:
-            assigned_doctor = assign_best_available_doctor(user_id, matching_doctors)
+            try:
+                assigned_doctor = doctor_allocator.allocate(user_id, dominant_state)
+            except Exception as e:
+                print(f"Error assigning doctor: {e}")
+                assigned_doctor = None
             if assigned_doctor:
                 display_doctors([assigned_doctor], f"ASSIGNED DOCTOR FOR {dominant_state.upper()}")
             else:
@@ -589,8 +942,8 @@ def recommend_entertainments(user_id, dominant_state):
         if matching_entertainments:
             print(f"\n🎉 Found {len(matching_entertainments)} entertainment(s) matching your dominant state:")
             display_entertainments(matching_entertainments)
-            stored_count = store_recommended_entertainments(user_id, matching_entertainments, dominant_state)
-            print(f"\n📊 Successfully stored {stored_count} recommendation(s) in 'recommended_entertainments' table!")
+            result = store_recommended_entertainments(user_id, matching_entertainments, dominant_state)
+            print(f"\n📊 Successfully stored {result['stored']} recommendation(s) in 'recommended_entertainments' table!")
             display_stored_recommendations(user_id)
         else:
             print(f"\n❌ No entertainments found matching the '{dominant_state}' state.")
@@ -605,7 +958,7 @@ def main(user_id: Optional[str] = None) -> Optional[Dict]:
     if not user_id:
         print("User ID cannot be empty.")
         return None
-    report = analyze_user_mental_state(user_id)
+    report = analyze_user_mental_state(user_id, incremental=True)
     if not report:
         print(f"❌ Could not analyze mental state for user {user_id}")
         return None
@@ -616,4 +969,8 @@ def main(user_id: Optional[str] = None) -> Optional[Dict]:
 
 
 if __name__ == "__main__":
-    main()
+    import sys
+    if sys.argv[1:] == ["schema"]:
+        print(RECOMMENDED_ENTERTAINMENTS_SQL)
+    else:
+        main()
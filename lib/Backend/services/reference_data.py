@@ -0,0 +1,130 @@
+"""In-process cache of the per-state reference tables.
+
+``doctors``, ``entertainments`` and ``suggestions`` are small, change rarely
+and are always looked up by one of a handful of state values. Each table is
+loaded in bulk into a ``ReferenceSnapshot`` indexed by its state column, so
+per-user recommendation calls read them from memory instead of querying
+Supabase. A background task re-reads every table each
+``REFERENCE_DATA_REFRESH_SECONDS`` and swaps in a new snapshot only when the
+content hash changed; ``refresh`` can also be forced with
+``POST /api/admin/reference-data/refresh`` (requires ``X-Admin-Token``).
+Rows are shared between callers and must be treated as read-only.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+from config.database import fetch_all_rows
+from config.settings import REFERENCE_DATA_MAX_AGE_SECONDS, REFERENCE_DATA_REFRESH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# table -> (columns to load, column the rows are looked up by)
+REFERENCE_TABLES = {
+    "doctors": ("*", "dominant_state"),
+    "entertainments": ("id, title, type, dominant_state, cover_img_url, description, media_file_url", "dominant_state"),
+    "suggestions": ("id, logo, suggestion, description, category", "category"),
+}
+
+
+class ReferenceSnapshot:
+    """Immutable copy of one reference table, grouped by its key column."""
+
+    def __init__(self, table: str, rows: List[dict], key_column: str):
+        self.table = table
+        self.rows = rows
+        self.by_key: Dict[str, List[dict]] = {}
+        for row in rows:
+            self.by_key.setdefault(row.get(key_column), []).append(row)
+        self.version = hashlib.sha1(json.dumps(rows, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:12]
+        self.loaded_at = time.time()
+
+
+class ReferenceDataCache:
+    """Snapshots of every reference table, with per-table hit/miss counters."""
+
+    def __init__(self, tables: Dict[str, tuple] = REFERENCE_TABLES):
+        self.tables = tables
+        self._snapshots: Dict[str, ReferenceSnapshot] = {}
+        self._lock = threading.Lock()
+        self._load_locks = {table: threading.Lock() for table in tables}
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+        self.refreshes: Counter = Counter()
+
+    def refresh(self, tables: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        """Re-read ``tables`` (default: all); returns each table's version after the refresh."""
+        versions = {}
+        for table in tables or self.tables:
+            columns, key_column = self.tables[table]
+            started = time.perf_counter()
+            snapshot = ReferenceSnapshot(table, fetch_all_rows(table, columns), key_column)
+            with self._lock:
+                current = self._snapshots.get(table)
+                if current is None or current.version != snapshot.version:
+                    self._snapshots[table] = snapshot
+                    self.refreshes[table] += 1
+                    logger.info(f"Reference data {table} {current.version if current else None} -> {snapshot.version} "
+                                f"({len(snapshot.rows)} rows, {(time.perf_counter() - started) * 1000:.0f} ms)")
+                else:
+                    current.loaded_at = snapshot.loaded_at
+                versions[table] = self._snapshots[table].version
+        return versions
+
+    def snapshot(self, table: str) -> ReferenceSnapshot:
+        """Current snapshot of ``table``, loading it on first use or when it is overdue."""
+        snapshot = self._snapshots.get(table)
+        if snapshot is not None and time.time() - snapshot.loaded_at <= REFERENCE_DATA_MAX_AGE_SECONDS:
+            self.hits[table] += 1
+            return snapshot
+        self.misses[table] += 1
+        with self._load_locks[table]:
+            snapshot = self._snapshots.get(table)
+            if snapshot is None or time.time() - snapshot.loaded_at > REFERENCE_DATA_MAX_AGE_SECONDS:
+                self.refresh([table])
+            return self._snapshots[table]
+
+    def rows_for(self, table: str, key: Optional[str]) -> List[dict]:
+        """Rows of ``table`` whose key column equals ``key``."""
+        return list(self.snapshot(table).by_key.get(key, ()))
+
+    def all_rows(self, table: str) -> List[dict]:
+        return list(self.snapshot(table).rows)
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            snapshots = dict(self._snapshots)
+        result = {}
+        for table in self.tables:
+            lookups = self.hits[table] + self.misses[table]
+            snapshot = snapshots.get(table)
+            result[table] = {
+                "rows": len(snapshot.rows) if snapshot else 0,
+                "keys": len(snapshot.by_key) if snapshot else 0,
+                "version": snapshot.version if snapshot else None,
+                "loaded_at": snapshot.loaded_at if snapshot else None,
+                "hits": self.hits[table],
+                "misses": self.misses[table],
+                "hit_rate": round(self.hits[table] / lookups, 4) if lookups else 0.0,
+                "refreshes": self.refreshes[table],
+            }
+        return result
+
+
+reference_data = ReferenceDataCache()
+
+
+async def reference_sync_loop(interval: float = REFERENCE_DATA_REFRESH_SECONDS):
+    """Load every reference table, then re-read them every ``interval`` seconds."""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, reference_data.refresh)
+        except Exception as e:
+            logger.error(f"Error refreshing reference data: {e}")
+        await asyncio.sleep(interval)
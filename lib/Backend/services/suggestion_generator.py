@@ -2,8 +2,6 @@ from fastapi import APIRouter, HTTPException
 import logging
 from pydantic import BaseModel
 from typing import List
-import openai
-from openai import OpenAI
 from uuid import UUID
 import os
 from pathlib import Path
@@ -20,9 +18,9 @@ api_key = GROQ_API_KEY
 if not api_key:
     raise ValueError("GROQ_API_KEY not found in environment variables")
 
-# Create a Groq client for API calls
-from groq import Groq
-client = Groq(api_key=api_key)
+# Shared async Groq gateway for API calls
+from core.llm_gateway import get_llm_gateway
+client = get_llm_gateway()
 
 class ConversationRequest(BaseModel):
     messages: List[str]
@@ -54,7 +52,7 @@ async def generate_suggestions(request: ConversationRequest) -> SuggestionRespon
         
         try:
             # Call Groq API to generate suggestions
-            response = client.chat.completions.create(
+            response = await client.acreate(
                 model="gemma2-9b-it",  # Using Gemma 2 model
                 messages=[
                     {
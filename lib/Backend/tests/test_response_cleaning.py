@@ -0,0 +1,54 @@
+"""The streamed chat cleaner must produce exactly what clean_response does."""
+import os
+import random
+
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+
+from services.chatbot_service import StreamingResponseCleaner, clean_response  # noqa: E402
+
+PIECES = [
+    "Call", "helpline", "Helpline", "Sumithrayo", "psychiatrists", "123", "4", "then", "done", "x",
+    "you can", "Remember", "try", "hope", "straße", "ok",
+    ". ", ".", " ", "  ", "\n", "\n\n", "\t", '"', "'", ",", "AI",
+]
+
+
+def random_reply(rng: random.Random) -> str:
+    text = "".join(rng.choice(PIECES) for _ in range(rng.randint(0, 25)))
+    # A stream cannot take back released text, so "AI:" is only tested where it can be stripped
+    if rng.random() < 0.2:
+        text = rng.choice(["", " ", '"', "\n"]) + "AI:" + text
+    return text
+
+
+def stream(text: str, rng: random.Random, crisis_mode: bool) -> StreamingResponseCleaner:
+    cleaner = StreamingResponseCleaner(crisis_mode)
+    out, position = [], 0
+    while position < len(text):
+        size = rng.randint(1, 6)
+        out.append(cleaner.feed(text[position:position + size]))
+        position += size
+    out.append(cleaner.finish())
+    assert "".join(out) == cleaner.emitted
+    return cleaner
+
+
+def test_stream_matches_clean_response_on_random_replies():
+    rng = random.Random(1234)
+    for _ in range(20000):
+        text = random_reply(rng)
+        crisis_mode = rng.random() < 0.1
+        assert stream(text, rng, crisis_mode).emitted == clean_response(text, crisis_mode), repr(text)
+
+
+def test_review_examples():
+    rng = random.Random(0)
+    for text in ["Call helpline. 123 then. done", "x. Helpline 12", "One sentence only.", 'AI: "Hi. there"']:
+        assert stream(text, rng, False).emitted == clean_response(text), repr(text)
+    assert clean_response("Call helpline. 123 then. done") == "CALL  then. done Remember, small steps can make a big difference."
+
+
+def test_first_sentence_is_released_before_the_reply_ends():
+    cleaner = StreamingResponseCleaner()
+    assert cleaner.feed("You are not alone. Take") == "YOU ARE NOT ALONE"
+    assert cleaner.feed(" a breath.\nThen rest.") == ". TAKE A BREATH.\nThen rest."
@@ -0,0 +1,137 @@
+"""Memory-mappable snapshot of the compiled chatbot dataset.
+
+``IntentIndex.build_arrays`` compiles ``chatbot_dataset.json`` into flat
+arrays (string tables, offsets and the BM25 matrices). This module writes
+those arrays to one binary file and maps them back read-only, so every
+uvicorn worker on a host shares the same pages through the page cache
+instead of parsing the JSON and holding its own copy.
+
+Layout (little-endian)::
+
+    magic "SSDSNAP1" | sha256 of the JSON source (32 bytes)
+    | crc32 of the payload (u32) | table-of-contents length (u64)
+    | table of contents (JSON: name, dtype, shape, offset per array)
+    | payload (each array 64-byte aligned)
+
+A snapshot is used only if its source digest matches the JSON file on disk
+and its payload passes the CRC; otherwise it is rebuilt and replaced
+atomically. Build it ahead of time with::
+
+    python -m utils.dataset_snapshot models/chatbot_dataset.json
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from utils.intent_index import IntentIndex
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SSDSNAP1"
+_HEADER = struct.Struct("<8s32sIQ")
+_ALIGN = 64
+
+
+class SnapshotError(Exception):
+    """The snapshot is missing, stale or damaged."""
+
+
+def source_digest(json_path: str) -> bytes:
+    with open(json_path, "rb") as file:
+        return hashlib.sha256(file.read()).digest()
+
+
+def default_snapshot_path(json_path: str) -> str:
+    return os.path.splitext(json_path)[0] + ".snapshot"
+
+
+def write_snapshot(path: str, arrays: Dict[str, np.ndarray], digest: bytes):
+    """Write ``arrays`` to ``path`` atomically (temp file + rename)."""
+    toc, chunks, offset = [], [], 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        padding = -offset % _ALIGN
+        chunks.append(b"\0" * padding)
+        offset += padding
+        toc.append({"name": name, "dtype": array.dtype.str, "shape": list(array.shape), "offset": offset})
+        chunks.append(array.tobytes())
+        offset += array.nbytes
+    payload = b"".join(chunks)
+    toc_bytes = json.dumps(toc, separators=(",", ":")).encode("utf-8")
+    toc_bytes += b" " * (-(_HEADER.size + len(toc_bytes)) % _ALIGN)
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(_HEADER.pack(MAGIC, digest, zlib.crc32(payload), len(toc_bytes)))
+        file.write(toc_bytes)
+        file.write(payload)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+def read_snapshot(path: str, expected_digest: Optional[bytes] = None) -> Dict[str, np.ndarray]:
+    """Map the snapshot read-only; the arrays are views over the shared mapping."""
+    try:
+        with open(path, "rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"cannot map {path}: {e}")
+    if len(mapped) < _HEADER.size:
+        raise SnapshotError("truncated header")
+    magic, digest, crc, toc_length = _HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC:
+        raise SnapshotError("not a dataset snapshot")
+    if expected_digest is not None and digest != expected_digest:
+        raise SnapshotError("built from a different dataset")
+    base = _HEADER.size + toc_length
+    if len(mapped) < base or zlib.crc32(memoryview(mapped)[base:]) != crc:
+        raise SnapshotError("payload checksum mismatch")
+    toc = json.loads(bytes(mapped[_HEADER.size:base]))
+    arrays = {}
+    for entry in toc:
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"], dtype=np.int64))
+        arrays[entry["name"]] = np.frombuffer(mapped, dtype=dtype, count=count,
+                                              offset=base + entry["offset"]).reshape(entry["shape"])
+    return arrays
+
+
+def load_intent_index(json_path: str, snapshot_path: Optional[str] = None) -> Tuple[IntentIndex, Dict]:
+    """Map the snapshot for ``json_path``, rebuilding it first if it is stale or damaged."""
+    snapshot_path = snapshot_path or default_snapshot_path(json_path)
+    started = time.perf_counter()
+    digest = source_digest(json_path)
+    try:
+        index = IntentIndex(read_snapshot(snapshot_path, digest))
+        source = "snapshot"
+    except SnapshotError as e:
+        logger.info(f"Rebuilding dataset snapshot {snapshot_path}: {e}")
+        with open(json_path, "r", encoding="utf-8") as file:
+            arrays = IntentIndex.build_arrays(json.load(file).get("intents", []))
+        try:
+            write_snapshot(snapshot_path, arrays, digest)
+            index = IntentIndex(read_snapshot(snapshot_path, digest))
+            source = "rebuilt"
+        except (OSError, SnapshotError) as write_error:
+            logger.warning(f"Could not write dataset snapshot, using an in-memory index: {write_error}")
+            index = IntentIndex(arrays)
+            source = "json"
+    return index, {"source": source, "path": snapshot_path, "load_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    json_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join("models", "chatbot_dataset.json")
+    index, info = load_intent_index(json_path, sys.argv[2] if len(sys.argv) > 2 else None)
+    print(f"{info['path']}: {info['source']}, {len(index)} intents, {len(index.patterns)} patterns, "
+          f"{os.path.getsize(info['path'])} bytes, {info['load_ms']} ms")
@@ -0,0 +1,231 @@
+"""BM25 retrieval over the chatbot intent dataset.
+
+Everything the index needs is held in flat NumPy arrays (see
+``IntentIndex.arrays``), so the same structure can be built from the JSON
+dataset or mapped straight from a snapshot file (``utils.dataset_snapshot``)
+without copying.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class StringTable:
+    """Immutable list of strings stored as one UTF-8 blob plus an offsets array."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings: Sequence[str]) -> "StringTable":
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8) if encoded else np.zeros(0, dtype=np.uint8)
+        return cls(blob, offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class BM25:
+    """
+    Okapi BM25 over a fixed set of token lists.
+
+    Weights are precomputed per (term, document) at build time and stored as
+    a CSR term-document matrix: ``ptr[t]:ptr[t + 1]`` slices ``doc_ids`` and
+    ``weights`` for term ``t``. Scoring a query is one vectorized
+    scatter-add per distinct query term.
+    """
+
+    def __init__(self, terms: StringTable, ptr: np.ndarray, doc_ids: np.ndarray, weights: np.ndarray, n_docs: int):
+        self.terms = terms
+        self.ptr = ptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.n_docs = n_docs
+        # term -> (start, end) of its postings, resolved once so scoring does no NumPy scalar indexing
+        bounds = ptr.tolist()
+        self.vocabulary: Dict[str, Tuple[int, int]] = {
+            term: (bounds[i], bounds[i + 1]) for i, term in enumerate(terms)
+        }
+
+    @classmethod
+    def build(cls, documents: List[List[str]], k1: float = 1.2, b: float = 0.75) -> "BM25":
+        n_docs = len(documents)
+        lengths = np.array([len(doc) for doc in documents], dtype=np.float32)
+        average = float(lengths.mean()) if n_docs and lengths.mean() > 0 else 1.0
+
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for doc_id, tokens in enumerate(documents):
+            for term, tf in Counter(tokens).items():
+                postings[term].append((doc_id, tf))
+
+        terms = sorted(postings)
+        ptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(postings[term]) for term in terms], out=ptr[1:])
+        doc_ids = np.empty(ptr[-1], dtype=np.int32)
+        weights = np.empty(ptr[-1], dtype=np.float32)
+        for row, term in enumerate(terms):
+            entries = postings[term]
+            ids = np.fromiter((doc_id for doc_id, _ in entries), dtype=np.int32, count=len(entries))
+            tf = np.fromiter((tf for _, tf in entries), dtype=np.float32, count=len(entries))
+            idf = math.log(1.0 + (n_docs - len(entries) + 0.5) / (len(entries) + 0.5))
+            norm = k1 * (1.0 - b + b * lengths[ids] / average)
+            doc_ids[ptr[row]:ptr[row + 1]] = ids
+            weights[ptr[row]:ptr[row + 1]] = idf * tf * (k1 + 1.0) / (tf + norm)
+        return cls(StringTable.from_strings(terms), ptr, doc_ids, weights, n_docs)
+
+    def scores(self, tokens: Iterable[str]) -> Optional[np.ndarray]:
+        """Score of every document, or None if no query term is in the vocabulary."""
+        rows = [self.vocabulary[term] for term in set(tokens) if term in self.vocabulary]
+        if not rows:
+            return None
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for start, end in rows:
+            scores[self.doc_ids[start:end]] += self.weights[start:end]  # ids are unique within a row
+        return scores
+
+
+class IntentIndex:
+    """
+    Top-k intents for a message, each with its best-matching response.
+
+    Every distinct pattern is a BM25 document and an intent scores as its
+    best pattern. Patterns are stored grouped by intent, so the per-intent
+    maximum is a single ``np.maximum.reduceat``. Responses get their own
+    BM25 index, used to pick the response of a matched intent that shares
+    the most with the message (the first response if none does).
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.tags = StringTable(arrays["tags.blob"], arrays["tags.offsets"])
+        self.patterns = StringTable(arrays["patterns.blob"], arrays["patterns.offsets"])
+        self.responses = StringTable(arrays["responses.blob"], arrays["responses.offsets"])
+        # per intent: [first response, end of responses); per pattern group: [start, end, owning intent]
+        self.response_bounds = arrays["intent.response_bounds"]
+        self.groups = arrays["pattern.groups"]
+        self._pattern_index = self._load_bm25(arrays, "bm25.patterns", len(self.patterns))
+        self._response_index = self._load_bm25(arrays, "bm25.responses", len(self.responses))
+        self._starts = np.ascontiguousarray(self.groups[:, 0])
+
+    @staticmethod
+    def _load_bm25(arrays: Dict[str, np.ndarray], prefix: str, n_docs: int) -> BM25:
+        terms = StringTable(arrays[f"{prefix}.terms.blob"], arrays[f"{prefix}.terms.offsets"])
+        return BM25(terms, arrays[f"{prefix}.ptr"], arrays[f"{prefix}.doc_ids"], arrays[f"{prefix}.weights"], n_docs)
+
+    @staticmethod
+    def _bm25_arrays(index: BM25, prefix: str) -> Dict[str, np.ndarray]:
+        return {
+            f"{prefix}.terms.blob": index.terms.blob,
+            f"{prefix}.terms.offsets": index.terms.offsets,
+            f"{prefix}.ptr": index.ptr,
+            f"{prefix}.doc_ids": index.doc_ids,
+            f"{prefix}.weights": index.weights,
+        }
+
+    @classmethod
+    def build_arrays(cls, intents: Iterable[dict], k1: float = 1.2, b: float = 0.75) -> Dict[str, np.ndarray]:
+        """Compile the intent list into the flat arrays the index is made of."""
+        tags: List[str] = []
+        patterns: List[str] = []
+        responses: List[str] = []
+        pattern_tokens: List[List[str]] = []
+        response_bounds: List[Tuple[int, int]] = []
+        groups: List[Tuple[int, int, int]] = []
+
+        for intent in intents:
+            tag = intent.get("tag")
+            if not tag:
+                continue
+            owner = len(tags)
+            tags.append(tag)
+            intent_responses = intent.get("responses", intent.get("response", []))
+            intent_responses = [intent_responses] if isinstance(intent_responses, str) else [r for r in intent_responses if r]
+            response_bounds.append((len(responses), len(responses) + len(intent_responses)))
+            responses.extend(intent_responses)
+            start = len(patterns)
+            for pattern in dict.fromkeys(p.strip() for p in intent.get("patterns", []) if p and p.strip()):
+                tokens = tokenize(pattern)
+                if tokens:
+                    patterns.append(pattern)
+                    pattern_tokens.append(tokens)
+            if len(patterns) > start:
+                groups.append((start, len(patterns), owner))
+
+        arrays = {}
+        for name, strings in (("tags", tags), ("patterns", patterns), ("responses", responses)):
+            table = StringTable.from_strings(strings)
+            arrays[f"{name}.blob"], arrays[f"{name}.offsets"] = table.blob, table.offsets
+        arrays["intent.response_bounds"] = np.array(response_bounds, dtype=np.int64).reshape(-1, 2)
+        arrays["pattern.groups"] = np.array(groups, dtype=np.int64).reshape(-1, 3)
+        arrays.update(cls._bm25_arrays(BM25.build(pattern_tokens, k1, b), "bm25.patterns"))
+        arrays.update(cls._bm25_arrays(BM25.build([tokenize(r) for r in responses], k1, b), "bm25.responses"))
+        return arrays
+
+    @classmethod
+    def build(cls, intents: Iterable[dict], k1: float = 1.2, b: float = 0.75) -> "IntentIndex":
+        return cls(cls.build_arrays(intents, k1, b))
+
+    def __len__(self) -> int:
+        return len(self.tags)
+
+    def first_responses(self) -> Dict[str, str]:
+        """tag -> first response, for intents that have one."""
+        return {
+            self.tags[i]: self.responses[int(start)]
+            for i, (start, end) in enumerate(self.response_bounds)
+            if end > start
+        }
+
+    def _best_response(self, intent: int, response_scores: Optional[np.ndarray]) -> Optional[str]:
+        start, end = (int(x) for x in self.response_bounds[intent])
+        if start == end:
+            return None
+        if response_scores is not None:
+            best = start + int(np.argmax(response_scores[start:end]))
+            if response_scores[best] > 0:
+                return self.responses[best]
+        return self.responses[start]
+
+    def search(self, text: str, k: int = 3, min_score: float = 0.0) -> List[Dict]:
+        """Up to ``k`` intents scoring above ``min_score``, best first."""
+        tokens = tokenize(text)
+        scores = self._pattern_index.scores(tokens) if len(self._starts) else None
+        if scores is None or k <= 0:
+            return []
+        per_intent = np.maximum.reduceat(scores, self._starts)
+        k = min(k, len(per_intent))
+        top = np.argpartition(-per_intent, k - 1)[:k]
+        top = top[np.argsort(-per_intent[top], kind="stable")]
+        response_scores = self._response_index.scores(tokens)
+
+        matches = []
+        for slot in top:
+            score = float(per_intent[slot])
+            if score <= min_score:
+                break
+            start, end, intent = (int(x) for x in self.groups[slot])
+            matches.append({
+                "tag": self.tags[intent],
+                "score": round(score, 4),
+                "pattern": self.patterns[start + int(np.argmax(scores[start:end]))],
+                "response": self._best_response(intent, response_scores),
+            })
+        return matches
@@ -0,0 +1,100 @@
+"""Precompiled multi-keyword matcher shared by the heuristic classifiers."""
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+class KeywordMatcher:
+    """
+    Find every keyword of a table that occurs as a substring of a text in one
+    regex pass.
+
+    ``entries`` is an ordered list of ``(keyword, payload)`` pairs; results are
+    returned in entry order, so "first match wins" tables keep their priority.
+    All keywords are folded into a single trie-shaped lookahead pattern,
+    which reports the longest keyword starting at every position.
+    Keywords that are prefixes of that longest match are added from a table
+    precomputed at build time, so overlapping matches are never lost.
+    ``first`` and ``any`` only need one hit: ``any`` runs a plain alternation
+    search, and ``first`` scans the distinct keywords in priority order, which
+    stops at the winning entry and beats the full regex pass on short tables.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, Any]]):
+        self._entries: List[Tuple[str, Any]] = [(kw.lower(), payload) for kw, payload in entries]
+
+        by_keyword: Dict[str, List[int]] = defaultdict(list)
+        for i, (kw, _) in enumerate(self._entries):
+            if kw:
+                by_keyword[kw].append(i)
+
+        keywords = sorted(by_keyword, key=len, reverse=True)
+        self._regex = None
+        if keywords:
+            alternation = _trie_pattern(keywords)
+            # cheap first-character test lets the engine skip most positions
+            first_chars = re.escape("".join(sorted({kw[0] for kw in keywords})))
+            self._regex = re.compile(f"(?=[{first_chars}])(?=({alternation}))")
+            self._search = re.compile(alternation)
+
+        # every entry implied by a match of `kw`: itself plus all keyword prefixes
+        self._implied: Dict[str, Tuple[int, ...]] = {
+            kw: tuple(sorted(i for other in keywords if kw.startswith(other) for i in by_keyword[other]))
+            for kw in keywords
+        }
+        # each keyword once, at the position of its highest-priority entry
+        self._by_priority: List[Tuple[str, Any]] = [
+            (kw, self._entries[indices[0]][1])
+            for kw, indices in sorted(by_keyword.items(), key=lambda item: item[1][0])
+        ]
+
+    def match_indices(self, text: str) -> List[int]:
+        """Indices of all entries whose keyword occurs in ``text``, in entry order."""
+        if self._regex is None or not text:
+            return []
+        found = set()
+        for keyword in self._regex.findall(text.lower()):
+            found.update(self._implied[keyword])
+        return sorted(found)
+
+    def matches(self, text: str) -> List[Any]:
+        """Payloads of all matching entries, in entry order."""
+        return [self._entries[i][1] for i in self.match_indices(text)]
+
+    def first(self, text: str, default: Optional[Any] = None) -> Any:
+        """Payload of the highest-priority matching entry, or ``default``."""
+        if not text:
+            return default
+        lowered = text.lower()
+        for kw, payload in self._by_priority:
+            if kw in lowered:
+                return payload
+        return default
+
+    def any(self, text: str) -> bool:
+        """Whether any keyword occurs in ``text``."""
+        return self._regex is not None and bool(text) and self._search.search(text.lower()) is not None
+
+
+def _trie_pattern(keywords: Iterable[str]) -> str:
+    """
+    Build a regex alternation factored on shared prefixes, e.g. ``panic`` and
+    ``panic attack`` become ``panic(?: attack)?``. Factoring keeps the regex
+    engine from retrying every keyword at every position; greedy optional
+    suffixes make the longest keyword win.
+    """
+    trie: Dict[str, Any] = {}
+    for kw in keywords:
+        node = trie
+        for ch in kw:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
@@ -0,0 +1,211 @@
+"""LRU/TTL cache of chat replies with an optional near-duplicate tier.
+
+Keys are the selected model plus the message normalized to its casefolded
+word tokens, so case, punctuation and spacing do not matter. Words are
+Unicode-aware: letters and digits of any script together with combining
+marks, such as the Sinhala and Tamil vowel signs a plain word regex splits on.
+A message that loses anything else to normalization (emoji, symbols) is
+neither looked up nor stored, so it cannot collide with a different one. When
+``similarity`` is above zero, a miss on the exact key also looks for a
+cached message of the same model whose word n-gram Jaccard similarity is at
+least ``similarity``. Candidates come from MinHash LSH (``bands`` x ``rows``
+signature bands, each hashed into a bucket) and are confirmed against the
+stored shingle sets, so the threshold is exact, not estimated.
+"""
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Hashable, List, Optional, Set, Tuple
+
+import numpy as np
+
+_PRIME = (1 << 31) - 1  # shingle hashes are reduced mod this so a * x + b fits in uint64
+
+
+def _word_pattern() -> "re.Pattern":
+    """Word characters plus every combining mark in the Basic Multilingual Plane."""
+    ranges, start = [], None
+    for code in range(0x10001):
+        is_mark = code < 0x10000 and unicodedata.category(chr(code)).startswith("M")
+        if is_mark and start is None:
+            start = code
+        elif not is_mark and start is not None:
+            ranges.append(re.escape(chr(start)) + (f"-{re.escape(chr(code - 1))}" if code - 1 > start else ""))
+            start = None
+    return re.compile(f"[\\w{''.join(ranges)}]+")
+
+
+_WORD = _word_pattern()
+
+
+def normalize(text: str) -> str:
+    return " ".join(_WORD.findall(text.casefold()))
+
+
+def is_lossless(text: str) -> bool:
+    """Whether normalizing ``text`` only drops whitespace and punctuation."""
+    return all(ch.isspace() or unicodedata.category(ch).startswith("P") for ch in _WORD.sub("", text))
+
+
+def shingles(normalized: str, n: int = 2) -> FrozenSet[str]:
+    """Words and word n-grams up to ``n``; short messages still get their unigrams."""
+    words = normalized.split()
+    grams = set(words)
+    for size in range(2, n + 1):
+        grams.update(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+    return frozenset(grams)
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """MinHash signatures over string sets from ``bands * rows`` universal hash functions."""
+
+    def __init__(self, bands: int = 16, rows: int = 4, seed: int = 1):
+        self.bands = bands
+        self.rows = rows
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=bands * rows, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=bands * rows, dtype=np.uint64)
+
+    def signature(self, grams: FrozenSet[str]) -> np.ndarray:
+        values = np.fromiter((zlib.crc32(g.encode("utf-8")) % _PRIME for g in grams), dtype=np.uint64, count=len(grams))
+        if not len(values):
+            return np.full(self.bands * self.rows, _PRIME, dtype=np.uint64)
+        return ((np.outer(values, self._a) + self._b) % _PRIME).min(axis=0)
+
+    def band_keys(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+
+class ResponseCache:
+    """Thread-safe LRU of ``(model, normalized message) -> reply`` entries that expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize: int = 2048, ttl: float = 3600.0, similarity: float = 0.0,
+                 bands: int = 16, rows: int = 4):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.similarity = similarity
+        self._hasher = MinHasher(bands, rows) if similarity > 0 else None
+        # key -> (expires_at, reply, shingles, LSH bucket keys)
+        self._data: "OrderedDict[Tuple[str, str], tuple]" = OrderedDict()
+        self._buckets: Dict[Hashable, Set[Tuple[str, str]]] = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.approximate_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.skipped = 0
+
+    def _remove(self, key: Tuple[str, str]):
+        _, _, _, buckets = self._data.pop(key)
+        for bucket in buckets:
+            members = self._buckets.get(bucket)
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del self._buckets[bucket]
+
+    def _live(self, key: Tuple[str, str], now: float) -> Optional[tuple]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            self._remove(key)
+            self.expirations += 1
+            return None
+        return entry
+
+    def get(self, model: str, message: str) -> Optional[str]:
+        """Cached reply for ``message`` (exact, then near-duplicate), or None."""
+        if not is_lossless(message):
+            return None
+        key = (model, normalize(message))
+        now = time.monotonic()
+        grams = signature = None
+        if self._hasher is not None:
+            grams = shingles(key[1])
+            signature = self._hasher.signature(grams)
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is not None:
+                self._data.move_to_end(key)
+                self.exact_hits += 1
+                return entry[1]
+            if self._hasher is not None:
+                candidates = set()
+                for band, band_key in self._hasher.band_keys(signature):
+                    candidates |= self._buckets.get((model, band, band_key), set())
+                best, best_score = None, self.similarity
+                for candidate in candidates:
+                    entry = self._live(candidate, now)
+                    if entry is None:
+                        continue
+                    score = jaccard(grams, entry[2])
+                    if score >= best_score:
+                        best, best_score = candidate, score
+                if best is not None:
+                    self._data.move_to_end(best)
+                    self.approximate_hits += 1
+                    return self._data[best][1]
+            self.misses += 1
+            return None
+
+    def set(self, model: str, message: str, reply: str):
+        key = (model, normalize(message))
+        if not key[1] or not is_lossless(message):
+            self.skipped += 1
+            return
+        grams, buckets = frozenset(), ()
+        if self._hasher is not None:
+            grams = shingles(key[1])
+            buckets = tuple((model, band, band_key)
+                            for band, band_key in self._hasher.band_keys(self._hasher.signature(grams)))
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + self.ttl, reply, grams, buckets)
+            for bucket in buckets:
+                self._buckets.setdefault(bucket, set()).add(key)
+            while len(self._data) > self.maxsize:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def skip(self):
+        """Count a turn that was deliberately neither looked up nor stored."""
+        with self._lock:
+            self.skipped += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.exact_hits + self.approximate_hits
+        lookups = hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "similarity": self.similarity,
+            "lsh_buckets": len(self._buckets),
+            "exact_hits": self.exact_hits,
+            "approximate_hits": self.approximate_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "skipped": self.skipped,
+        }
@@ -1,5 +1,6 @@
 import 'dart:convert';
 import 'package:http/http.dart' as http;
+import 'package:supabase_flutter/supabase_flutter.dart';
 import '../config.dart';
 
 class ChatService {
@@ -12,6 +13,8 @@ class ChatService {
     String? userId,
   }) async {
     final url = Uri.parse(_baseUrl);
+    final accessToken =
+        Supabase.instance.client.auth.currentSession?.accessToken;
 
     final payload = {
       "message": userMessage,
@@ -29,6 +32,8 @@ class ChatService {
         headers: {
           "Content-Type": "application/json",
           "Accept": "application/json",
+          // Conversation memory is keyed by the verified access token, not user_id
+          if (accessToken != null) "Authorization": "Bearer $accessToken",
         },
         body: json.encode(payload),
       );
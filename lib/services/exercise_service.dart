@@ -190,6 +190,7 @@ class ExerciseService {
               'exercise_id': exerciseId,
               'duration_seconds': duration,
               'completed_at': DateTime.now().toIso8601String(),
+              'tz': _utcOffset(),
             }),
           )
           .timeout(const Duration(seconds: 10));
@@ -207,12 +208,24 @@ class ExerciseService {
     }
   }
 
+  /// Device UTC offset such as "+05:30", used for day boundaries in stats
+  static String _utcOffset() {
+    final offset = DateTime.now().timeZoneOffset;
+    final sign = offset.isNegative ? '-' : '+';
+    final minutes = offset.inMinutes.abs();
+    final hours = (minutes ~/ 60).toString().padLeft(2, '0');
+    final mins = (minutes % 60).toString().padLeft(2, '0');
+    return '$sign$hours:$mins';
+  }
+
   /// Get user's exercise statistics
   static Future<Map<String, dynamic>> getUserStats(String userId) async {
     try {
       final response = await http
           .get(
-            Uri.parse('$baseUrl/exercises/user/$userId/stats'),
+            Uri.parse('$baseUrl/exercises/user/$userId/stats').replace(
+              queryParameters: {'tz': _utcOffset()},
+            ),
             headers: {'Content-Type': 'application/json'},
           )
           .timeout(const Duration(seconds: 10));